@@ -1,6 +1,18 @@
 from assessment.models import *
+from assessment.routers import reporting
 from django.contrib import admin
 
+class ReportingModelAdmin(admin.ModelAdmin):
+  '''A ModelAdmin whose changelist reads from the reporting replica'''
+  def changelist_view(self, request, extra_context=None):
+    with reporting():
+      response = super(ReportingModelAdmin, self).changelist_view(request,
+                                                                extra_context)
+      # the changelist's queries run as the template is rendered
+      if hasattr(response, 'render'):
+        response.render()
+    return response
+
 class PreferenceAssessmentReasonInline(admin.TabularInline):
   model = PreferenceReason
 
@@ -13,7 +25,7 @@ admin.site.register(Query,
   inlines = [DocInline],
   short_description = "Queries and Documents")
 
-class AssessedDocumentRelationAdmin(admin.ModelAdmin):
+class AssessedDocumentRelationAdmin(ReportingModelAdmin):
   list_display = ('query', 'assessor',
                   'source_docname', 'target_docname',
                   'relation_type_as_permalink')
@@ -23,9 +35,15 @@ class AssessedDocumentRelationAdmin(admin.ModelAdmin):
   #               'relation_type',)
 admin.site.register(AssessedDocumentRelation, AssessedDocumentRelationAdmin)
 
-admin.site.register(Assignment,
+admin.site.register(Assignment, ReportingModelAdmin,
   list_display = ('assessor', 'query', 'created_date',
-                  'num_assessments_complete', 'elapsed_time'))
+                  'assessments_done', 'pending_assessments',
+                  'last_assessment_date', 'elapsed_time'))
+
+admin.site.register(AssignmentProgress,
+  list_display = ('assignment', 'assessments_done', 'pending_assessments',
+                  'bad_documents', 'dup_documents', 'last_assessment_date',
+                  'elapsed_seconds'))
 
 admin.site.register(PreferenceReason,
   list_display = ('short_name', 'description', 'active'))
@@ -33,4 +51,5 @@ admin.site.register(PreferenceReason,
 admin.site.register(Comment)
 
 admin.site.register(AssessedDocument,
-  list_display = ('id', 'document', 'assignment'))
+  list_display = ('id', 'document', 'assignment',
+                  'times_assessed', 'is_bad', 'is_dup'))
@@ -0,0 +1,223 @@
+# Inter-assessor agreement on queries judged by more than one assessor.  All
+# the judgements are loaded into NumPy arrays with a single query, and each
+# is keyed by the unordered document pair it judges, (query, document_a,
+# document_b) with document_a < document_b, and labelled with one of
+# CATEGORIES relative to that order.  Agreement statistics for every query,
+# assessor and pair of assessors are then computed together in vectorized
+# form.
+#
+# Requires NumPy.
+import numpy as np
+from django.contrib.auth.models import User
+from assessment.models import AssessedDocumentRelation, Document, Query
+
+# the outcomes of judging a document pair (a, b), a < b
+CATEGORIES = ('a preferred', 'b preferred', 'duplicates', 'a bad', 'b bad')
+N_CATEGORIES = len(CATEGORIES)
+
+class Judgements(object):
+  '''Aligned arrays with one entry per judgement, sorted by item (the
+  judged (query, document_a, document_b) pair):
+
+    queries, assessors - Query and User ids
+    doc_a, doc_b       - Document ids, doc_a < doc_b
+    categories         - indexes into CATEGORIES
+    items              - item numbers, from 0
+  '''
+  def __init__(self, queries, assessors, doc_a, doc_b, categories):
+    # sort by item, then assessor, and keep each assessor's last judgement
+    # of an item
+    order = np.lexsort((assessors, doc_b, doc_a, queries))
+    (queries, assessors, doc_a, doc_b, categories) = \
+      [array[order] for array in (queries, assessors, doc_a, doc_b,
+                                  categories)]
+    n = len(queries)
+    new_item = np.r_[True, (queries[1:] != queries[:-1]) |
+                           (doc_a[1:] != doc_a[:-1]) |
+                           (doc_b[1:] != doc_b[:-1])][:n]
+    keep = np.r_[new_item[1:] | (assessors[1:] != assessors[:-1]), True][:n]
+    self.queries, self.assessors = queries[keep], assessors[keep]
+    self.doc_a, self.doc_b = doc_a[keep], doc_b[keep]
+    self.categories = categories[keep]
+    # numbered before the earlier judgements are dropped, since an item's
+    # first judgement may be one of them
+    self.items = (np.cumsum(new_item) - 1)[keep]
+
+  def __len__(self):
+    return len(self.items)
+
+def load_judgements(query_ids = None):
+  '''Loads the judgements (of the given queries, or all of them) into a
+  Judgements object.'''
+  # in id order, so which of an assessor's judgements of an item counts as
+  # the last doesn't depend on the database's row order
+  relations = AssessedDocumentRelation.objects.order_by('id')
+  if query_ids is not None:
+    relations = relations.filter(assignment__query__in = query_ids)
+  rows = list(relations.values_list('assignment__query',
+                                    'assignment__assessor',
+                                    'source_doc__document',
+                                    'target_doc__document', 'relation_type'))
+  if not rows:
+    empty = np.zeros(0, dtype=np.int64)
+    return Judgements(empty, empty, empty, empty, empty)
+  (queries, assessors, sources, targets, types) = \
+    [np.array(column) for column in zip(*rows)]
+  (doc_a, doc_b) = (np.minimum(sources, targets), np.maximum(sources, targets))
+  forward = sources == doc_a
+  # for bad judgements, the source is the bad document
+  categories = np.where(types == 'P', np.where(forward, 0, 1),
+               np.where(types == 'D', 2, np.where(forward, 3, 4)))
+  return Judgements(queries.astype(np.int64), assessors.astype(np.int64),
+                    doc_a.astype(np.int64), doc_b.astype(np.int64),
+                    categories.astype(np.int64))
+
+def _kappa(observed, expected):
+  '''(observed - expected) / (1 - expected), or NaN where expected is 1'''
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return np.where(expected < 1, (observed - expected) / (1 - expected),
+                    np.nan)
+
+class Agreement(object):
+  '''Agreement statistics for a Judgements object.  Only items judged by at
+  least two assessors count.  Each group of statistics is a set of aligned
+  arrays:
+
+    per query:  query_ids, query_items (number of items), query_agreement
+                (fraction of agreeing pairs of judgements), fleiss_kappa
+    per assessor: assessor_ids, assessor_judgements, assessor_agreement
+                (mean fraction of other assessors agreeing)
+    per pair of assessors: pair_a, pair_b (User ids, pair_a < pair_b),
+                pair_items, pair_agreement, cohen_kappa
+    conflicts:  conflict_queries, conflict_doc_a, conflict_doc_b,
+                conflict_counts (items x CATEGORIES judgement counts), for
+                items the assessors disagree on
+  '''
+  def __init__(self, judgements):
+    j = judgements
+    n_items = j.items[-1] + 1 if len(j) else 0
+    counts = np.bincount(j.items * N_CATEGORIES + j.categories,
+                         minlength=n_items * N_CATEGORIES) \
+               .reshape(n_items, N_CATEGORIES)
+    raters = counts.sum(1)
+    first = np.r_[0, np.flatnonzero(np.diff(j.items)) + 1][:n_items]
+    item_queries = j.queries[first]
+    multi = raters >= 2
+
+    # per query: the pairs of judgements of each item that agree, and Fleiss'
+    # kappa with its expected agreement from the query's category totals
+    agreeing = (counts * (counts - 1) / 2).sum(1)[multi]
+    possible = (raters * (raters - 1) / 2)[multi]
+    (self.query_ids, query_index) = np.unique(item_queries[multi],
+                                              return_inverse=True)
+    n_queries = len(self.query_ids)
+    self.query_items = np.bincount(query_index, minlength=n_queries)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      self.query_agreement = \
+        np.bincount(query_index, weights=agreeing, minlength=n_queries) / \
+        np.bincount(query_index, weights=possible, minlength=n_queries)
+      item_agreement = agreeing / possible.astype(float)
+      mean_agreement = np.bincount(query_index, weights=item_agreement,
+                                   minlength=n_queries) / self.query_items
+      category_totals = np.bincount(
+        (query_index[:, None] * N_CATEGORIES +
+         np.arange(N_CATEGORIES)).ravel(),
+        weights=counts[multi].ravel(),
+        minlength=n_queries * N_CATEGORIES).reshape(n_queries, N_CATEGORIES)
+      proportions = category_totals / category_totals.sum(1)[:, None]
+    self.fleiss_kappa = _kappa(mean_agreement, (proportions ** 2).sum(1))
+
+    # per assessor: the fraction of the other judgements of each item agreeing
+    # with the assessor's
+    judged_multi = multi[j.items]
+    item_raters = raters[j.items][judged_multi]
+    same = counts[j.items, j.categories][judged_multi]
+    (self.assessor_ids, assessor_index) = \
+      np.unique(j.assessors[judged_multi], return_inverse=True)
+    self.assessor_judgements = np.bincount(assessor_index)
+    self.assessor_agreement = \
+      np.bincount(assessor_index,
+                  weights=(same - 1) / (item_raters - 1.0)) / \
+      np.maximum(self.assessor_judgements, 1)
+
+    # per pair of assessors: every pair of judgements of the same item (they're
+    # sorted by item, so these are within max(raters) places of each other)
+    (left, right) = ([], [])
+    for offset in xrange(1, raters.max() if n_items else 0):
+      i = np.flatnonzero(j.items[:-offset] == j.items[offset:])
+      left.append(i)
+      right.append(i + offset)
+    left = np.concatenate(left) if left else np.zeros(0, dtype=np.int64)
+    right = np.concatenate(right) if right else np.zeros(0, dtype=np.int64)
+    # assessors are sorted within items, so left has the smaller id
+    stride = j.assessors.max() + 1 if len(j) else 1
+    (pair_keys, pair_index) = np.unique(j.assessors[left] * stride +
+                                        j.assessors[right],
+                                        return_inverse=True)
+    n_pairs = len(pair_keys)
+    (self.pair_a, self.pair_b) = (pair_keys // stride, pair_keys % stride)
+    self.pair_items = np.bincount(pair_index, minlength=n_pairs)
+    n = np.maximum(self.pair_items, 1).astype(float)
+    self.pair_agreement = np.bincount(pair_index,
+      weights=j.categories[left] == j.categories[right], minlength=n_pairs) / n
+    marginal = lambda side: np.bincount(
+      pair_index * N_CATEGORIES + j.categories[side],
+      minlength=n_pairs * N_CATEGORIES) \
+      .reshape(n_pairs, N_CATEGORIES) / n[:, None]
+    self.cohen_kappa = _kappa(self.pair_agreement,
+                              (marginal(left) * marginal(right)).sum(1))
+
+    # conflicts: items given more than one category
+    conflicted = multi & ((counts > 0).sum(1) > 1)
+    self.conflict_queries = item_queries[conflicted]
+    self.conflict_doc_a = j.doc_a[first][conflicted]
+    self.conflict_doc_b = j.doc_b[first][conflicted]
+    self.conflict_counts = counts[conflicted]
+
+  def report(self, max_conflicts = None):
+    '''A dict of lists of rows, with names in place of ids, for display or
+    caching:
+
+      queries   - (qid, items, agreement, Fleiss' kappa)
+      assessors - (username, judgements, agreement)
+      pairs     - (username, username, items, agreement, Cohen's kappa)
+      conflicts - (qid, document a, document b, counts per category), the
+                  most contested first
+    '''
+    order = np.lexsort((-self.conflict_counts.sum(1),
+                        self.conflict_counts.max(1) /
+                        np.maximum(self.conflict_counts.sum(1), 1.0)))
+    if max_conflicts is not None:
+      order = order[:max_conflicts]
+    qids = dict(Query.objects.filter(
+                  id__in = np.r_[self.query_ids,
+                                 self.conflict_queries[order]].tolist())
+                .values_list('id', 'qid'))
+    usernames = dict(User.objects.filter(
+                       id__in = np.r_[self.assessor_ids, self.pair_a,
+                                      self.pair_b].tolist())
+                     .values_list('id', 'username'))
+    docs = dict(Document.objects.filter(
+                  id__in = np.r_[self.conflict_doc_a[order],
+                                 self.conflict_doc_b[order]].tolist())
+                .values_list('id', 'document'))
+    return {
+      'queries': [(qids[q], int(n), float(a), float(k)) for (q, n, a, k) in \
+                  zip(self.query_ids, self.query_items, self.query_agreement,
+                      self.fleiss_kappa)],
+      'assessors': [(usernames[u], int(n), float(a)) for (u, n, a) in \
+                    zip(self.assessor_ids, self.assessor_judgements,
+                        self.assessor_agreement)],
+      'pairs': [(usernames[u], usernames[v], int(n), float(a), float(k)) \
+                for (u, v, n, a, k) in zip(self.pair_a, self.pair_b,
+                                           self.pair_items,
+                                           self.pair_agreement,
+                                           self.cohen_kappa)],
+      'conflicts': [(qids[self.conflict_queries[i]],
+                     docs[self.conflict_doc_a[i]],
+                     docs[self.conflict_doc_b[i]],
+                     self.conflict_counts[i].tolist()) for i in order] }
+
+def analyze(query_ids = None):
+  '''The Agreement of the judgements of the given queries, or all of them'''
+  return Agreement(load_judgements(query_ids))
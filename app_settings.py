@@ -7,6 +7,13 @@ DOCSERVER_URL_PATTERN = getattr(settings, 'DOCSERVER_URL_PATTERN',
 # Is a new registration required to provide a validation key?
 REGISTRATION_KEY = getattr(settings, 'REGISTRATION_KEY', None)
 
+# how document pairs are chosen: 'bubble_sort', 'binary_insertion' or 'top_k'
+# (which orders the TOP_K most preferred documents)
+SELECTION_STRATEGY = getattr(settings, 'SELECTION_STRATEGY', 'bubble_sort')
+
+# the number of most preferred documents ordered by the 'top_k' strategy
+TOP_K = getattr(settings, 'TOP_K', 10)
+
 # number of assessments per query
 ASSESSMENTS_PER_QUERY = getattr(settings, 'ASSESSMENTS_PER_QUERY', 25)
 
@@ -23,3 +30,90 @@ COLLECT_INFORMATION_NEED = getattr(settings, 'COLLECT_INFORMATION_NEED',
 
 # Do we assume judgements are transitivie?
 ASSUME_TRANSITIVITY = getattr(settings, 'ASSUME_TRANSITIVITY', False)
+
+# number of lines inserted per transaction when uploading queries & documents
+UPLOAD_BATCH_SIZE = getattr(settings, 'UPLOAD_BATCH_SIZE', 10000)
+
+# Are AssessedDocuments created only when a document is first presented,
+# rather than for the whole pool when a query is assigned?
+LAZY_ASSESSED_DOCUMENTS = getattr(settings, 'LAZY_ASSESSED_DOCUMENTS', False)
+
+# maximum number of memoized values kept in each process
+MEMOIZE_LOCAL_SIZE = getattr(settings, 'MEMOIZE_LOCAL_SIZE', 1000)
+
+# number of next document pairs precomputed in the background after each
+# judgement (0 to turn off precomputation)
+PRECOMPUTE_PAIRS = getattr(settings, 'PRECOMPUTE_PAIRS', 0)
+
+# number of worker threads per process precomputing pairs
+PRECOMPUTE_WORKERS = getattr(settings, 'PRECOMPUTE_WORKERS', 2)
+
+# should requests be instrumented?  (requires
+# assessment.instrumentation.InstrumentationMiddleware)
+INSTRUMENTATION = getattr(settings, 'INSTRUMENTATION', False)
+
+# number of recent requests kept in each URL's instrumentation histogram
+INSTRUMENTATION_WINDOW = getattr(settings, 'INSTRUMENTATION_WINDOW', 1000)
+
+# requests slower than this (in ms) are logged with their SQL (None for no
+# logging)
+INSTRUMENTATION_SLOW_REQUEST_MS = getattr(settings,
+                                          'INSTRUMENTATION_SLOW_REQUEST_MS',
+                                          None)
+
+# number of the slowest requests whose SQL is kept for the instrumentation
+# page, in each process
+INSTRUMENTATION_SLOWEST = getattr(settings, 'INSTRUMENTATION_SLOWEST', 10)
+
+# seconds between reloads of each process's pool of claimable queries
+CLAIM_POOL_REFRESH = getattr(settings, 'CLAIM_POOL_REFRESH', 60)
+
+# minimum seconds between the early reloads of the claim pool made when it
+# has nothing to offer
+CLAIM_POOL_MIN_RELOAD = getattr(settings, 'CLAIM_POOL_MIN_RELOAD', 5)
+
+# random picks tried per query offered from the claim pool, before it's
+# scanned for queries the assessor doesn't already have
+CLAIM_POOL_ATTEMPTS = getattr(settings, 'CLAIM_POOL_ATTEMPTS', 10)
+
+# number of claimable queries checked when offering a query
+CLAIM_POOL_CANDIDATES = getattr(settings, 'CLAIM_POOL_CANDIDATES', 5)
+
+# number of upcoming pairs queued by the assessment page, which then judges
+# them locally and sends the judgements to the server in the background (0
+# to submit each judgement with a page load)
+CLIENT_PAIR_QUEUE = getattr(settings, 'CLIENT_PAIR_QUEUE', 0)
+
+# Are the next pairs rendered directly by the next_assessment view and after
+# a judgement is posted, rather than by redirecting to the pair's own page?
+DIRECT_PAIR_RENDERING = getattr(settings, 'DIRECT_PAIR_RENDERING', False)
+
+# Are documents served through the caching document proxy?
+DOCUMENT_PROXY = getattr(settings, 'DOCUMENT_PROXY', False)
+
+# directory of the document proxy's cache (None for a directory in the
+# system's temporary directory)
+DOCUMENT_CACHE_DIR = getattr(settings, 'DOCUMENT_CACHE_DIR', None)
+
+# maximum size of the document proxy's cache, in bytes
+DOCUMENT_CACHE_SIZE = getattr(settings, 'DOCUMENT_CACHE_SIZE',
+                              512 * 1024 * 1024)
+
+# seconds to wait for the document server when fetching a document
+DOCUMENT_PROXY_TIMEOUT = getattr(settings, 'DOCUMENT_PROXY_TIMEOUT', 10)
+
+# maximum number of conflicting judgements listed in the agreement report
+AGREEMENT_MAX_CONFLICTS = getattr(settings, 'AGREEMENT_MAX_CONFLICTS', 200)
+
+# alias in DATABASES of the replica reporting reads are sent to, by
+# assessment.routers.ReportingRouter (None to read everything from the
+# primary)
+REPORTING_DATABASE = getattr(settings, 'REPORTING_DATABASE', None)
+
+# seconds the reporting replica may lag behind the primary before reporting
+# reads go to the primary instead
+REPORTING_MAX_LAG = getattr(settings, 'REPORTING_MAX_LAG', 60)
+
+# seconds between checks of the reporting replica's lag
+REPORTING_LAG_CHECK_INTERVAL = getattr(settings, 'REPORTING_LAG_CHECK_INTERVAL',
+                                       10)
@@ -0,0 +1,194 @@
+# Synthetic-load benchmarks for the assessment views.  For each scale, a
+# fresh test database is filled by util.generate_synthetic_data, and each
+# view is driven through the test client, recording its latency and the
+# number of SQL queries it makes.  See the benchmark management command.
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.client import Client
+from assessment.models import Assignment
+from assessment.caching import local_cache
+from assessment.util import generate_synthetic_data
+from contextlib import contextmanager
+from math import ceil
+from time import time
+from uuid import uuid4
+import re
+
+# the views benchmarked, in the order they're run
+VIEWS = ('assessor_dashboard', 'next_assessment', 'new_assessment',
+         'new_assessment_post', 'admin_dashboard', 'download_data')
+
+ADMIN_USERNAME = 'benchmark_admin'
+
+# the action of the assessment form, on a directly rendered pair
+_FORM_ACTION = re.compile(r'<form id="assessmentform" action="([^"]+)"')
+
+class Scale(object):
+  '''A benchmark dataset size: queries x documents x assessors'''
+  def __init__(self, n_queries, n_docs, n_assessors, judgements):
+    self.n_queries = n_queries
+    self.n_docs = n_docs
+    self.n_assessors = n_assessors
+    self.judgements = judgements
+
+  @classmethod
+  def parse(cls, scale, judgements):
+    '''Parses a "<queries>x<documents>x<assessors>" string'''
+    (n_queries, n_docs, n_assessors) = [int(n) for n in scale.split('x')]
+    return cls(n_queries, n_docs, n_assessors, judgements)
+
+  def __str__(self):
+    return '%dx%dx%d' % (self.n_queries, self.n_docs, self.n_assessors)
+
+def percentile(values, p):
+  '''The p-th percentile of a sorted list, by nearest rank'''
+  if not values:
+    return None
+  return values[max(0, int(ceil(p / 100.0 * len(values))) - 1)]
+
+def summarize(latencies, query_counts):
+  latencies, query_counts = sorted(latencies), sorted(query_counts)
+  return { 'n': len(latencies),
+           'latency_ms': { 'mean': 1000 * sum(latencies) / len(latencies),
+                           'p50': 1000 * percentile(latencies, 50),
+                           'p90': 1000 * percentile(latencies, 90),
+                           'p99': 1000 * percentile(latencies, 99),
+                           'max': 1000 * latencies[-1] },
+           'queries': { 'mean': float(sum(query_counts)) / len(query_counts),
+                        'max': query_counts[-1] } }
+
+class ViewTimer(object):
+  '''Times requests made through a test client, counting SQL queries.'''
+  def __init__(self):
+    self.results = {}
+
+  def request(self, view, method, client, url, data = None):
+    connection.queries = []
+    start = time()
+    if method == 'post':
+      response = client.post(url, data)
+    else:
+      response = client.get(url)
+    # consume streaming responses, so they're timed too
+    response.content
+    elapsed = time() - start
+    (latencies, query_counts) = self.results.setdefault(view, ([], []))
+    latencies.append(elapsed)
+    query_counts.append(len(connection.queries))
+    return response
+
+  def summary(self):
+    return dict((view, summarize(*self.results[view])) \
+                for view in VIEWS if view in self.results)
+
+def run_scale(scale, repeat = 5, seed = 0):
+  '''Benchmarks the views at one scale, which must be run against an empty
+  (test) database.  Returns a dict of view name -> summary.'''
+  local_cache.clear()
+  assessors = generate_synthetic_data(scale.n_queries, scale.n_docs,
+                                      scale.n_assessors, scale.judgements,
+                                      prefix = 'benchmark', seed = seed)
+  User.objects.create_superuser(ADMIN_USERNAME, 'admin@example.com',
+                                ADMIN_USERNAME)
+
+  timer = ViewTimer()
+  # the debug cursor records queries even when DEBUG is off
+  connection.use_debug_cursor = True
+  try:
+    for assessor in assessors[:repeat]:
+      client = Client()
+      client.login(username = assessor.username, password = assessor.username)
+      timer.request('assessor_dashboard', 'get', client,
+                    reverse('assessor_dashboard'))
+      for assignment in Assignment.objects.filter(assessor = assessor) \
+                                          .order_by('id')[:repeat]:
+        response = timer.request('next_assessment', 'get', client,
+            reverse('next_assessment', args = [assignment.id]))
+        if response.status_code == 200:
+          # with DIRECT_PAIR_RENDERING, the pair is rendered straight away
+          match = _FORM_ACTION.search(response.content)
+          if match is None:
+            continue
+          url = match.group(1)
+        elif response.status_code != 302 or \
+            '/assessor/dashboard/' in response['Location']:
+          # the assignment is complete
+          continue
+        else:
+          url = response['Location']
+        timer.request('new_assessment', 'get', client, url)
+        timer.request('new_assessment_post', 'post', client, url,
+                      {'preference': 'L'})
+
+    client = Client()
+    client.login(username = ADMIN_USERNAME, password = ADMIN_USERNAME)
+    for i in xrange(repeat):
+      timer.request('admin_dashboard', 'get', client,
+                    reverse('admin_dashboard'))
+      timer.request('download_data', 'get', client, reverse('download_data'))
+  finally:
+    connection.use_debug_cursor = None
+  return timer.summary()
+
+@contextmanager
+def _private_cache():
+  '''Gives the cache a key prefix of its own in the enclosed code, so the
+  test database's ids don't collide with the cached values of the real one,
+  or of another scale's.'''
+  key_prefix = cache.key_prefix
+  cache.key_prefix = '%sbenchmark-%s' % (key_prefix, uuid4().hex)
+  try:
+    yield
+  finally:
+    cache.key_prefix = key_prefix
+
+def run(scales, repeat = 5, seed = 0, out = None):
+  '''Benchmarks the views at each scale, each in a freshly created test
+  database, printing a summary of each to out if given.  Returns a
+  machine-readable dict of the results.'''
+  results = []
+  for scale in scales:
+    old_name = settings.DATABASES['default']['NAME']
+    connection.creation.create_test_db(verbosity = 0, autoclobber = True)
+    try:
+      with _private_cache():
+        start = time()
+        summary = run_scale(scale, repeat, seed)
+    finally:
+      connection.creation.destroy_test_db(old_name, verbosity = 0)
+    if out is not None:
+      print_summary(out, scale, summary, time() - start)
+    results.append({ 'scale': str(scale), 'queries': scale.n_queries,
+                     'documents': scale.n_docs, 'assessors': scale.n_assessors,
+                     'judgements': scale.judgements, 'views': summary })
+  return { 'created': time(), 'repeat': repeat, 'seed': seed,
+           'results': results }
+
+def print_summary(out, scale, summary, elapsed):
+  out.write('Scale %s (%.1fs):\n' % (scale, elapsed))
+  out.write('  %-20s %6s %9s %9s %9s %9s %8s\n' % \
+            ('view', 'n', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'queries'))
+  for view in VIEWS:
+    if view in summary:
+      s = summary[view]
+      out.write('  %-20s %6d %9.1f %9.1f %9.1f %9.1f %8.1f\n' % \
+          (view, s['n'], s['latency_ms']['p50'], s['latency_ms']['p90'],
+           s['latency_ms']['p99'], s['latency_ms']['max'], s['queries']['mean']))
+
+def compare(old, new):
+  '''A generator over (scale, view, old p50, new p50, old queries,
+  new queries) tuples for the views in both benchmark results.'''
+  old_results = dict((r['scale'], r['views']) for r in old['results'])
+  for result in new['results']:
+    if result['scale'] not in old_results:
+      continue
+    old_views = old_results[result['scale']]
+    for view in VIEWS:
+      if view in old_views and view in result['views']:
+        (o, n) = (old_views[view], result['views'][view])
+        yield (result['scale'], view, o['latency_ms']['p50'],
+               n['latency_ms']['p50'], o['queries']['mean'],
+               n['queries']['mean'])
@@ -0,0 +1,208 @@
+# Versioned caching for the assessment app.  Cached values are stored under
+# keys that include a version number for the object they're derived from, and
+# signals bump the version whenever the object changes, so stale values are
+# never read and nothing needs to be deleted.
+from django.core.cache import cache
+from django.db import transaction
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.hashcompat import md5_constructor
+from assessment import app_settings
+from contextlib import contextmanager
+from functools import wraps
+from threading import local, Lock
+from time import time, sleep
+try:
+  from collections import OrderedDict
+except ImportError:
+  from django.utils.datastructures import SortedDict as OrderedDict
+
+# versions need to outlive the values cached under them (memcached can't
+# store anything for more than 30 days)
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+# versioned values can't go stale, so they can be kept for a long time
+VALUE_TIMEOUT = 60 * 60 * 24
+
+# how long a process computing a memoized value holds its lock, and how long
+# other processes wait for the value before computing it themselves
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 2
+
+def _version_key(namespace, id):
+  return 'assessment:%s:%s:version' % (namespace, id)
+
+def _new_version():
+  '''A fresh version number, larger than any version previously handed out
+  for an evicted key (as long as there were fewer than a million bumps a
+  second).'''
+  return int(time() * 1000000)
+
+def get_version(namespace, id):
+  '''The current version of an object.'''
+  return get_versions(namespace, [id])[id]
+
+def get_versions(namespace, ids):
+  '''A dict of id -> current version for several objects, using a single
+  cache round trip when they're all present.'''
+  keys = dict((_version_key(namespace, id), id) for id in ids)
+  found = cache.get_many(keys.keys())
+  versions = dict((keys[key], version) for (key, version) in found.items())
+  for (key, id) in keys.items():
+    if key not in found:
+      # add, rather than set, in case another process just did the same
+      cache.add(key, _new_version(), VERSION_TIMEOUT)
+      versions[id] = cache.get(key)
+  return versions
+
+_pending = local()
+
+def bump_version(namespace, id):
+  '''Invalidates everything cached for an object.  Inside
+  commit_on_success, it's invalidated again when the transaction ends.'''
+  bumps = getattr(_pending, 'bumps', None)
+  if bumps is not None:
+    bumps.add((namespace, id))
+  _bump(namespace, id)
+
+def _bump(namespace, id):
+  key = _version_key(namespace, id)
+  try:
+    cache.incr(key)
+  except ValueError:
+    # the version isn't in the cache (anymore)
+    cache.set(key, _new_version(), VERSION_TIMEOUT)
+
+@contextmanager
+def commit_on_success():
+  '''transaction.commit_on_success, which bumps the versions bumped inside it
+  again once it's committed or rolled back.  Until then, other requests
+  still read the data from before the transaction, and may cache it under
+  the new version.'''
+  if getattr(_pending, 'bumps', None) is not None:
+    # the outermost block does the bumping
+    with transaction.commit_on_success():
+      yield
+    return
+  _pending.bumps = set()
+  try:
+    with transaction.commit_on_success():
+      yield
+  finally:
+    bumps = _pending.bumps
+    _pending.bumps = None
+    for (namespace, id) in bumps:
+      _bump(namespace, id)
+
+def versioned_key(namespace, id, version, name):
+  return 'assessment:%s:%s:v%s:%s' % (namespace, id, version, name)
+
+class LocalCache(object):
+  '''A bounded, thread-safe, least-recently-used in-process cache.'''
+  def __init__(self, max_size):
+    self.max_size = max_size
+    self.items = OrderedDict()
+    self.lock = Lock()
+
+  def get(self, key):
+    '''Returns a (value,) tuple, or None if the key isn't cached'''
+    self.lock.acquire()
+    try:
+      if key not in self.items:
+        return None
+      value = self.items.pop(key)
+      self.items[key] = value
+      return value
+    finally:
+      self.lock.release()
+
+  def set(self, key, value):
+    self.lock.acquire()
+    try:
+      self.items.pop(key, None)
+      self.items[key] = value
+      while len(self.items) > self.max_size:
+        del self.items[iter(self.items).next()]
+    finally:
+      self.lock.release()
+
+  def clear(self):
+    self.lock.acquire()
+    try:
+      self.items.clear()
+    finally:
+      self.lock.release()
+
+local_cache = LocalCache(app_settings.MEMOIZE_LOCAL_SIZE)
+
+def _shared_cache():
+  '''Whether Django's cache is shared between processes, so a version bumped
+  in one process is seen by all of them'''
+  return not isinstance(cache, (DummyCache, LocMemCache))
+
+def _model_version_of(obj):
+  return (obj._meta.module_name, obj.pk)
+
+def memoize(version_of = _model_version_of, timeout = VALUE_TIMEOUT):
+  '''A decorator for memoizing model methods.  Values are keyed on the
+  model, the object's primary key, the method and its arguments, and the
+  version of the object returned by version_of (a (namespace, id) tuple,
+  defaulting to the object itself), so bumping that version invalidates
+  them.  Values are kept in a bounded in-process LRU cache in front of
+  Django's cache, and only one process computes a missing value at a time.
+
+  Versions are kept in Django's cache, so memoize needs a backend shared by
+  all the server processes, such as memcached.  With the dummy backend, or
+  the per-process local memory backend, the in-process cache is skipped,
+  since a version bumped in another process (or not stored at all) can't be
+  seen, and values are only as fresh as the backend allows.
+
+  The decorated method gets an invalidate(obj) attribute for explicit
+  invalidation, which bumps the object's version.  Memoized values are
+  shared, so they mustn't be mutated.'''
+  def decorator(func):
+    @wraps(func)
+    def memoized(self, *args, **kwargs):
+      (namespace, id) = version_of(self)
+      call = '%s.%s:%s:%s' % (self._meta.module_name, func.__name__, self.pk,
+                              md5_constructor(repr((args, sorted(
+                                kwargs.items())))).hexdigest())
+      version = get_version(namespace, id)
+      key = versioned_key(namespace, id, version, call)
+      # the in-process cache is only safe when the version is shared
+      use_local = version is not None and _shared_cache()
+
+      value = local_cache.get(key) if use_local else None
+      if value is None:
+        value = cache.get(key)
+      if value is None:
+        value = _compute(key, lambda: func(self, *args, **kwargs), timeout)
+      if use_local:
+        local_cache.set(key, value)
+      return value[0]
+
+    def invalidate(obj):
+      bump_version(*version_of(obj))
+    memoized.invalidate = invalidate
+    return memoized
+  return decorator
+
+def _compute(key, func, timeout):
+  '''Computes and caches a (value,) tuple, making sure only one process
+  computes it at a time so a popular expired value doesn't stampede.'''
+  lock_key = key + ':lock'
+  if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+    # someone else is computing it: wait for them, up to a point
+    waited = 0.0
+    while waited < LOCK_WAIT:
+      sleep(0.05)
+      waited += 0.05
+      value = cache.get(key)
+      if value is not None:
+        return value
+  try:
+    value = (func(),)
+    cache.set(key, value, timeout)
+    return value
+  finally:
+    cache.delete(lock_key)
@@ -0,0 +1,177 @@
+# A per-process pool of claimable query ids, for offering queries to
+# assessors without sorting the Query table.  The pool is loaded when it's
+# first used and every CLAIM_POOL_REFRESH seconds after that, and kept up to
+# date in between as this process's assessors claim and abandon queries and
+# queries are saved or deleted.  Queries are offered by picking ids from the
+# pool at random, which takes constant time however many queries there are,
+# and spreads concurrent assessors across the queries rather than having
+# them all contend for the same rows.  Ids that other processes have made
+# unclaimable are dropped as they're found.
+from assessment.models import Query, Assignment
+from assessment import app_settings
+from django.db.models.signals import post_save, post_delete
+from random import randrange
+from threading import Lock
+from time import time
+
+class ClaimPool(object):
+  '''A set of query ids with constant-time adding, removing and random
+  choice.  The ids are kept in a list, with a dict of each id's position in
+  it, and removed by moving the last id into their place.'''
+  def __init__(self):
+    self.ids = []
+    self.positions = {}
+    self.loaded = None
+    self.lock = Lock()
+
+  def __len__(self):
+    return len(self.ids)
+
+  def load(self, ids):
+    self.lock.acquire()
+    try:
+      self.ids = list(ids)
+      self.positions = dict((id, i) for (i, id) in enumerate(self.ids))
+      self.loaded = time()
+    finally:
+      self.lock.release()
+
+  def add(self, id):
+    self.lock.acquire()
+    try:
+      if id not in self.positions:
+        self.positions[id] = len(self.ids)
+        self.ids.append(id)
+    finally:
+      self.lock.release()
+
+  def remove(self, id):
+    self.lock.acquire()
+    try:
+      i = self.positions.pop(id, None)
+      if i is not None:
+        last = self.ids.pop()
+        if last != id:
+          self.ids[i] = last
+          self.positions[last] = i
+    finally:
+      self.lock.release()
+
+  def choose(self, n, exclude_ids = ()):
+    '''Up to n different ids, not in exclude_ids, chosen at random.  Random
+    positions are tried first; only if too few of them are usable (when
+    most of the pool is excluded) is the pool scanned.'''
+    chosen = []
+    self.lock.acquire()
+    try:
+      size = len(self.ids)
+      for _ in xrange(min(n * app_settings.CLAIM_POOL_ATTEMPTS, size)):
+        id = self.ids[randrange(size)]
+        if id not in exclude_ids and id not in chosen:
+          chosen.append(id)
+          if len(chosen) == n:
+            return chosen
+      start = randrange(size) if size else 0
+      for i in xrange(size):
+        id = self.ids[(start + i) % size]
+        if id not in exclude_ids and id not in chosen:
+          chosen.append(id)
+          if len(chosen) == n:
+            break
+      return chosen
+    finally:
+      self.lock.release()
+
+pool = ClaimPool()
+
+def reload():
+  '''Reloads the pool from the database'''
+  pool.load(Query.objects.filter(remaining_assignments__gt = 0) \
+                         .values_list('id', flat = True))
+
+def reload_if_loaded():
+  '''Reloads the pool if it's in use, for when queries have been saved
+  without the signals that keep it up to date'''
+  if pool.loaded is not None:
+    reload()
+
+def refresh(query_id):
+  '''Adds the query to the pool, or removes it, depending on whether it has
+  any remaining assignments'''
+  remaining = list(Query.objects.filter(id = query_id) \
+                        .values_list('remaining_assignments', flat = True))
+  if remaining and remaining[0] > 0:
+    pool.add(query_id)
+  else:
+    pool.remove(query_id)
+
+def candidates(exclude_ids = (), n = None):
+  '''Up to n (CLAIM_POOL_CANDIDATES by default) random claimable Query
+  objects not in exclude_ids.'''
+  if n is None:
+    n = app_settings.CLAIM_POOL_CANDIDATES
+  if pool.loaded is None or \
+      time() - pool.loaded > app_settings.CLAIM_POOL_REFRESH:
+    reload()
+  ids = pool.choose(n, set(exclude_ids))
+  queries = Query.objects.in_bulk(ids)
+  available = []
+  for query_id in ids:
+    query = queries.get(query_id)
+    if query is None or query.remaining_assignments <= 0:
+      # another process has taken (or deleted) it
+      pool.remove(query_id)
+    else:
+      available.append(query)
+  return available
+
+def offer(exclude_ids = ()):
+  '''A random claimable Query not in exclude_ids, or None if there aren't
+  any.'''
+  for query in candidates(exclude_ids):
+    return query
+  # the pool may be out of date: reload it before giving up, unless it was
+  # loaded very recently, so that dashboards shown while nothing is
+  # claimable don't each reload it
+  if pool.loaded is not None and \
+      time() - pool.loaded < app_settings.CLAIM_POOL_MIN_RELOAD:
+    return None
+  reload()
+  for query in candidates(exclude_ids):
+    return query
+  return None
+
+def claim(assessor, query):
+  '''Claims the query for the assessor.  Returns the new Assignment, or None
+  if the query has been taken, in which case it's dropped from the pool.
+  Raises IntegrityError if the query is already assigned to the
+  assessor.'''
+  assignment = query.claim(assessor)
+  if assignment is None:
+    pool.remove(query.id)
+  else:
+    refresh(query.id)
+  return assignment
+
+def abandon(assignment):
+  '''Abandons the assignment, returning its query to the pool'''
+  if assignment.abandon():
+    pool.add(assignment.query_id)
+
+def _query_saved(sender, instance, raw = False, **kwargs):
+  if raw or pool.loaded is None:
+    return
+  if instance.remaining_assignments > 0:
+    pool.add(instance.id)
+  else:
+    pool.remove(instance.id)
+post_save.connect(_query_saved, sender=Query)
+
+def _query_deleted(sender, instance, **kwargs):
+  pool.remove(instance.id)
+post_delete.connect(_query_deleted, sender=Query)
+
+def _assignment_deleted(sender, instance, **kwargs):
+  if pool.loaded is not None:
+    refresh(instance.query_id)
+post_delete.connect(_assignment_deleted, sender=Assignment)
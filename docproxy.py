@@ -0,0 +1,233 @@
+# A caching proxy for the document server.  When DOCUMENT_PROXY is set,
+# documents are linked through the document_proxy view, which fetches each
+# one from DOCSERVER_URL_PATTERN once and keeps it in a size-bounded on-disk
+# cache in DOCUMENT_CACHE_DIR, shared by all the server processes.  Cached
+# documents are read through mmap, and their recency is their file's mtime:
+# once the cache is over DOCUMENT_CACHE_SIZE bytes, the least recently used
+# documents are removed.  The precompute workers prefetch the documents of
+# the next pair, so they're usually cached before they're asked for.
+from django.utils import simplejson
+from django.utils.hashcompat import md5_constructor
+from django.utils.http import http_date
+from assessment import app_settings
+from threading import Lock
+from time import time
+import logging
+import mmap
+import os
+import tempfile
+import urllib2
+
+logger = logging.getLogger('assessment.docproxy')
+
+# size of the chunks a cached document is sent in
+CHUNK_SIZE = 64 * 1024
+
+class CachedDocument(object):
+  '''A document in the cache, open for reading.  Iterating over it yields its
+  content in chunks from a memory map, and closes it at the end.'''
+  def __init__(self, path, meta):
+    self.content_type = meta['content_type']
+    self.etag = meta['etag']
+    self.last_modified = meta['last_modified']
+    self._file = open(path, 'rb')
+    self.size = os.fstat(self._file.fileno()).st_size
+    if self.size > 0:
+      self._map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+    else:
+      # empty files can't be mapped
+      self._map = None
+
+  def __iter__(self):
+    try:
+      for start in xrange(0, self.size, CHUNK_SIZE):
+        yield self._map[start:start + CHUNK_SIZE]
+    finally:
+      self.close()
+
+  def close(self):
+    if self._map is not None:
+      self._map.close()
+      self._map = None
+    self._file.close()
+
+class FetchedDocument(object):
+  '''A document just fetched from the document server, served from memory
+  when it couldn't be cached.  It has the same interface as
+  CachedDocument.'''
+  def __init__(self, content, meta):
+    self.content_type = meta['content_type']
+    self.etag = meta['etag']
+    self.last_modified = meta['last_modified']
+    self.size = len(content)
+    self._content = content
+
+  def __iter__(self):
+    for start in xrange(0, self.size, CHUNK_SIZE):
+      yield self._content[start:start + CHUNK_SIZE]
+
+  def close(self):
+    pass
+
+def _meta(content, content_type, etag = None, last_modified = None):
+  '''A document's headers, with an ETag and Last-Modified made up if the
+  document server didn't send them'''
+  if etag is None:
+    etag = '"%s"' % md5_constructor(content).hexdigest()
+  if last_modified is None:
+    last_modified = http_date(time())
+  return { 'content_type': content_type, 'etag': etag,
+           'last_modified': last_modified }
+
+class DocumentCache(object):
+  '''A size-bounded LRU cache of documents in a directory.  Each document is
+  stored in a file named by the MD5 of its name, with its headers in a .meta
+  file beside it.  Files are written to a temporary name and renamed, so
+  readers never see partial documents.'''
+  def __init__(self, directory, max_size):
+    self.directory = directory
+    self.max_size = max_size
+    # the cache's size, as of the last scan plus what's been added since
+    self._size = None
+    self._lock = Lock()
+
+  def _path(self, document):
+    return os.path.join(self.directory,
+                        md5_constructor(document.encode('utf-8')).hexdigest())
+
+  def get(self, document):
+    '''The CachedDocument for document, or None if it isn't cached'''
+    path = self._path(document)
+    try:
+      meta = simplejson.load(open(path + '.meta'))
+      cached = CachedDocument(path, meta)
+    except (IOError, OSError, ValueError):
+      return None
+    try:
+      # mark it recently used
+      os.utime(path, None)
+    except OSError:
+      pass
+    return cached
+
+  def put(self, document, content, content_type, etag = None,
+          last_modified = None):
+    '''Stores a document, evicting the least recently used ones if the cache
+    is full.  Raises IOError or OSError if it can't be written.'''
+    if not os.path.isdir(self.directory):
+      try:
+        os.makedirs(self.directory)
+      except OSError:
+        # another process made it
+        pass
+    meta = _meta(content, content_type, etag, last_modified)
+    path = self._path(document)
+    self._write(path + '.meta', simplejson.dumps(meta))
+    self._write(path, content)
+
+    self._lock.acquire()
+    try:
+      if self._size is not None:
+        self._size += len(content)
+      if self._size is None or self._size > self.max_size:
+        self._evict()
+    finally:
+      self._lock.release()
+
+  def _write(self, path, content):
+    (fd, temp_path) = tempfile.mkstemp(dir = self.directory, suffix = '.tmp')
+    try:
+      try:
+        os.write(fd, content)
+      finally:
+        os.close(fd)
+      os.rename(temp_path, path)
+    except (IOError, OSError):
+      try:
+        os.remove(temp_path)
+      except OSError:
+        pass
+      raise
+
+  def _evict(self):
+    '''Removes the least recently used documents until the cache fits in
+    max_size, and updates the size from what's on disk.'''
+    entries = []
+    for name in os.listdir(self.directory):
+      if name.endswith('.meta') or name.endswith('.tmp'):
+        continue
+      try:
+        stat = os.stat(os.path.join(self.directory, name))
+      except OSError:
+        # another process evicted it
+        continue
+      entries.append((stat.st_mtime, stat.st_size, name))
+    entries.sort()
+    size = sum(entry_size for (_, entry_size, _) in entries)
+    for (_, entry_size, name) in entries:
+      if size <= self.max_size:
+        break
+      path = os.path.join(self.directory, name)
+      for p in (path, path + '.meta'):
+        try:
+          os.remove(p)
+        except OSError:
+          pass
+      size -= entry_size
+    self._size = size
+
+def _cache_directory():
+  if app_settings.DOCUMENT_CACHE_DIR is not None:
+    return app_settings.DOCUMENT_CACHE_DIR
+  return os.path.join(tempfile.gettempdir(), 'assessment-documents')
+
+cache = DocumentCache(_cache_directory(), app_settings.DOCUMENT_CACHE_SIZE)
+
+def fetch(document):
+  '''Fetches a document from the document server into the cache, and
+  returns its CachedDocument.  If it's too big for the cache, or can't be
+  written to it or read back, it's returned as a FetchedDocument instead.
+  Raises urllib2.URLError if it can't be fetched.'''
+  response = urllib2.urlopen(app_settings.DOCSERVER_URL_PATTERN % document,
+                             timeout = app_settings.DOCUMENT_PROXY_TIMEOUT)
+  try:
+    content = response.read()
+    headers = response.info()
+  finally:
+    response.close()
+  meta = _meta(content, headers.get('Content-Type', 'text/html'),
+               headers.get('ETag'), headers.get('Last-Modified'))
+  if len(content) <= cache.max_size:
+    try:
+      cache.put(document, content, meta['content_type'], meta['etag'],
+                meta['last_modified'])
+    except (IOError, OSError):
+      logger.exception('Error caching document %s' % document)
+    else:
+      # it may have been evicted already
+      cached = cache.get(document)
+      if cached is not None:
+        return cached
+  return FetchedDocument(content, meta)
+
+def get(document):
+  '''The CachedDocument for document, fetching it if it isn't cached'''
+  cached = cache.get(document)
+  if cached is None:
+    cached = fetch(document)
+  return cached
+
+def prefetch(documents):
+  '''Fetches any of the documents that aren't already cached.  Errors are
+  logged, since the documents will be fetched again when they're asked
+  for.'''
+  if not app_settings.DOCUMENT_PROXY:
+    return
+  for document in documents:
+    try:
+      cached = cache.get(document)
+      if cached is None:
+        cached = fetch(document)
+      cached.close()
+    except Exception:
+      logger.exception('Error prefetching document %s' % document)
@@ -0,0 +1,177 @@
+# A compact directed graph for preference judgements.  Vertices are
+# arbitrary (hashable, sortable) labels, internally numbered 0..n-1, and the
+# adjacency is stored CSR-style in two int arrays: the targets of vertex v
+# are targets[offsets[v]:offsets[v + 1]].  Reachability is computed with
+# Python ints as bitsets.
+from array import array
+
+def _csr(n, edges):
+  '''(offsets, targets) arrays for a list of (source, target) vertex number
+  pairs'''
+  offsets = array('l', [0]) * (n + 1)
+  for (source, _) in edges:
+    offsets[source + 1] += 1
+  for v in xrange(n):
+    offsets[v + 1] += offsets[v]
+  targets = array('l', [0]) * len(edges)
+  position = array('l', offsets)
+  for (source, target) in edges:
+    targets[position[source]] = target
+    position[source] += 1
+  return (offsets, targets)
+
+def _bits(bitset):
+  '''A generator over the numbers of the set bits of an int'''
+  while bitset:
+    low = bitset & -bitset
+    yield low.bit_length() - 1
+    bitset ^= low
+
+class Graph(object):
+  '''A directed graph with array-backed (CSR) adjacency.'''
+  def __init__(self, edges, vertices = ()):
+    edges = list(edges)
+    self.labels = sorted(set(vertices) | set(s for (s, _) in edges) | \
+                         set(t for (_, t) in edges))
+    self.index = dict((label, v) for (v, label) in enumerate(self.labels))
+    self.edges = [(self.index[s], self.index[t]) for (s, t) in edges]
+    (self.offsets, self.targets) = _csr(len(self.labels), self.edges)
+    self._reversed = None
+
+  @classmethod
+  def from_relations(cls, relations, vertices = ()):
+    '''The preference graph of (source, target, relation_type) tuples:
+    preferences are edges from source to target, and duplicates are edges in
+    both directions.  Bad judgements aren't added.'''
+    edges = []
+    for (source, target, relation_type) in relations:
+      if relation_type == 'P':
+        edges.append((source, target))
+      elif relation_type == 'D':
+        edges.append((source, target))
+        edges.append((target, source))
+    return cls(edges, vertices)
+
+  def __len__(self):
+    return len(self.labels)
+
+  def _successors(self, v):
+    return self.targets[self.offsets[v]:self.offsets[v + 1]]
+
+  def successors(self, label):
+    '''The labels of the vertices with an edge from label'''
+    if label not in self.index:
+      return []
+    return [self.labels[w] for w in self._successors(self.index[label])]
+
+  def reversed(self):
+    '''The graph with every edge reversed.  It shares the vertex labels, and is
+    only built once.'''
+    if self._reversed is None:
+      graph = Graph.__new__(Graph)
+      graph.labels = self.labels
+      graph.index = self.index
+      graph.edges = [(t, s) for (s, t) in self.edges]
+      (graph.offsets, graph.targets) = _csr(len(self.labels), graph.edges)
+      graph._reversed = self
+      self._reversed = graph
+    return self._reversed
+
+  def reachable_from(self, label):
+    '''The set of labels reachable from label (not including label itself,
+    unless it's on a cycle)'''
+    if label not in self.index:
+      return set()
+    visited = 0
+    frontier = [self.index[label]]
+    while frontier:
+      for w in self._successors(frontier.pop()):
+        if not (visited >> w) & 1:
+          visited |= 1 << w
+          frontier.append(w)
+    return set(self.labels[w] for w in _bits(visited))
+
+  def _components(self):
+    '''The strongly connected components, as lists of vertex numbers, in
+    reverse topological order (Tarjan's algorithm, without recursion).'''
+    n = len(self.labels)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    components = []
+    counter = 0
+    for root in xrange(n):
+      if index[root] != -1:
+        continue
+      index[root] = low[root] = counter
+      counter += 1
+      stack.append(root)
+      on_stack[root] = True
+      work = [(root, self.offsets[root])]
+      while work:
+        (v, i) = work[-1]
+        if i < self.offsets[v + 1]:
+          work[-1] = (v, i + 1)
+          w = self.targets[i]
+          if index[w] == -1:
+            index[w] = low[w] = counter
+            counter += 1
+            stack.append(w)
+            on_stack[w] = True
+            work.append((w, self.offsets[w]))
+          elif on_stack[w]:
+            low[v] = min(low[v], index[w])
+        else:
+          work.pop()
+          if work:
+            u = work[-1][0]
+            low[u] = min(low[u], low[v])
+          if low[v] == index[v]:
+            component = []
+            while True:
+              w = stack.pop()
+              on_stack[w] = False
+              component.append(w)
+              if w == v:
+                break
+            components.append(component)
+    return components
+
+  def closure(self):
+    '''A list with the bitset of vertices reachable from each vertex.  Each
+    strongly connected component is handled once, sinks first, by OR-ing the
+    bitsets of the components it has edges to.'''
+    n = len(self.labels)
+    component_of = [0] * n
+    components = self._components()
+    members = []
+    for (c, component) in enumerate(components):
+      bits = 0
+      for v in component:
+        component_of[v] = c
+        bits |= 1 << v
+      members.append(bits)
+
+    reach = [0] * len(components)
+    for (c, component) in enumerate(components):
+      bits = 0
+      cyclic = len(component) > 1
+      for v in component:
+        for w in self._successors(v):
+          d = component_of[w]
+          if d == c:
+            cyclic = True
+          else:
+            bits |= members[d] | reach[d]
+      if cyclic:
+        bits |= members[c]
+      reach[c] = bits
+    return [reach[component_of[v]] for v in xrange(n)]
+
+  def reachable_pairs(self):
+    '''A generator over all (source, target) label pairs where target is
+    reachable from source'''
+    for (v, bits) in enumerate(self.closure()):
+      for w in _bits(bits):
+        yield (self.labels[v], self.labels[w])
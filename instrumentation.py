@@ -0,0 +1,251 @@
+# Per-request SQL and timing instrumentation.  When INSTRUMENTATION is set
+# and InstrumentationMiddleware is installed, every request records its wall
+# time and SQL query count and time, split into the strategy, template and
+# (the rest of the) view phases, and how much it raised the process's peak
+# resident memory.  Records are kept in a
+# rolling in-process histogram per URL name, shown on the instrumentation
+# admin page.  Records only keep their SQL query count and time: the SQL
+# itself is only kept for the slowest INSTRUMENTATION_SLOWEST requests, and
+# logged for requests slower than INSTRUMENTATION_SLOW_REQUEST_MS.
+from django import shortcuts
+from django.core.urlresolvers import resolve, Resolver404
+from django.db import connection
+from assessment import app_settings
+from contextlib import contextmanager
+from collections import deque
+from threading import local, Lock
+from time import time
+import heapq
+import logging
+import resource
+
+logger = logging.getLogger('assessment.instrumentation')
+
+# upper bounds (ms) of the histogram buckets; the last bucket is unbounded
+BUCKETS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+PHASES = ('view', 'strategy', 'template')
+
+_current = local()
+
+def _peak_rss():
+  '''Peak resident memory of the process (KB on Linux).  This only grows
+  when the process reaches a new high, so a request's growth in it isn't how
+  much it allocated: most requests reuse memory freed by earlier ones.'''
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class PhaseTotals(object):
+  def __init__(self):
+    self.time = 0.0
+    self.queries = 0
+    self.query_time = 0.0
+
+class RequestRecord(object):
+  '''The measurements for one request.  Phase totals are exclusive: the view
+  phase is whatever isn't spent in the strategy or template phases.'''
+  def __init__(self):
+    self.start = time()
+    self.start_peak_rss = _peak_rss()
+    self.url_name = None
+    self.phases = dict((p, PhaseTotals()) for p in PHASES)
+    self.active = []
+    self.wall_time = None
+
+  def finish(self, queries):
+    '''Completes the record, given the request's SQL queries, which are
+    counted and timed but not kept.'''
+    self.wall_time = time() - self.start
+    self.peak_rss_growth = _peak_rss() - self.start_peak_rss
+    self.queries = len(queries)
+    self.query_time = sum(float(q['time']) for q in queries)
+    view = self.phases['view']
+    view.time = self.wall_time - sum(self.phases[p].time for p in PHASES)
+    view.queries = self.queries - \
+                   sum(self.phases[p].queries for p in PHASES)
+    view.query_time = self.query_time - \
+                      sum(self.phases[p].query_time for p in PHASES)
+
+@contextmanager
+def phase(name):
+  '''Records the time and SQL queries of the enclosed code under the named
+  phase of the current request.  Does nothing when instrumentation is off or
+  when already inside the same phase.'''
+  record = getattr(_current, 'record', None)
+  if record is None or name in record.active:
+    yield
+    return
+  record.active.append(name)
+  start, n_queries = time(), len(connection.queries)
+  try:
+    yield
+  finally:
+    record.active.remove(name)
+    totals = record.phases[name]
+    totals.time += time() - start
+    new_queries = connection.queries[n_queries:]
+    totals.queries += len(new_queries)
+    totals.query_time += sum(float(q['time']) for q in new_queries)
+
+class Timed(object):
+  '''A proxy that records every method call on the wrapped object under the
+  named phase.'''
+  def __init__(self, obj, phase_name):
+    self._obj = obj
+    self._phase_name = phase_name
+
+  def __getattr__(self, name):
+    value = getattr(self._obj, name)
+    if not callable(value):
+      return value
+    def timed(*args, **kwargs):
+      with phase(self._phase_name):
+        return value(*args, **kwargs)
+    return timed
+
+def render_to_response(*args, **kwargs):
+  '''django.shortcuts.render_to_response, recorded as the template phase'''
+  with phase('template'):
+    return shortcuts.render_to_response(*args, **kwargs)
+
+class RollingHistogram(object):
+  '''The most recent INSTRUMENTATION_WINDOW request records for a URL name.'''
+  def __init__(self, size):
+    self.records = deque(maxlen = size)
+    self.count = 0
+
+  def add(self, record):
+    self.records.append(record)
+    self.count += 1
+
+  def summary(self):
+    records = list(self.records)
+    n = len(records)
+    times = sorted(r.wall_time * 1000 for r in records)
+    buckets = [0] * (len(BUCKETS) + 1)
+    for t in times:
+      buckets[len([b for b in BUCKETS if t > b])] += 1
+    percentile = lambda p: times[min(n - 1, int(p / 100.0 * n))]
+    mean = lambda values: sum(values) / float(n)
+    return { 'n': n,
+             'total': self.count,
+             'p50': percentile(50), 'p90': percentile(90),
+             'p99': percentile(99), 'max': times[-1],
+             'queries': mean([r.queries for r in records]),
+             'query_time': mean([r.query_time * 1000 for r in records]),
+             'peak_rss_growth': mean([r.peak_rss_growth for r in records]),
+             'phases': [ { 'name': p,
+                           'time': mean([r.phases[p].time * 1000 \
+                                         for r in records]),
+                           'queries': mean([r.phases[p].queries \
+                                            for r in records]) } \
+                         for p in PHASES ],
+             'buckets': zip([None] + list(BUCKETS),
+                            list(BUCKETS) + [None], buckets) }
+
+class SlowestRequests(object):
+  '''The slowest requests seen, up to a maximum number, with their SQL.'''
+  def __init__(self, size):
+    self.size = size
+    # a min-heap of (wall time, sequence number, details), so the fastest
+    # of the kept requests is the one replaced
+    self.heap = []
+    self.sequence = 0
+    self.lock = Lock()
+
+  def add(self, record, method, path, queries):
+    if self.size <= 0:
+      return
+    self.lock.acquire()
+    try:
+      if len(self.heap) == self.size and record.wall_time <= self.heap[0][0]:
+        return
+      self.sequence += 1
+      entry = (record.wall_time, self.sequence,
+               { 'url_name': record.url_name, 'method': method, 'path': path,
+                 'time': record.wall_time * 1000,
+                 'query_time': record.query_time * 1000,
+                 'queries': [(q['time'], q['sql']) for q in queries] })
+      if len(self.heap) < self.size:
+        heapq.heappush(self.heap, entry)
+      else:
+        heapq.heapreplace(self.heap, entry)
+    finally:
+      self.lock.release()
+
+  def requests(self):
+    '''The kept requests' details, slowest first'''
+    self.lock.acquire()
+    try:
+      return [details for (_, _, details) in sorted(self.heap, reverse=True)]
+    finally:
+      self.lock.release()
+
+slowest = SlowestRequests(app_settings.INSTRUMENTATION_SLOWEST)
+
+_histograms = {}
+_histograms_lock = Lock()
+
+def record_request(record):
+  _histograms_lock.acquire()
+  try:
+    if record.url_name not in _histograms:
+      _histograms[record.url_name] = \
+        RollingHistogram(app_settings.INSTRUMENTATION_WINDOW)
+    _histograms[record.url_name].add(record)
+  finally:
+    _histograms_lock.release()
+
+def summaries():
+  '''A list of (url name, summary) tuples for this process, sorted by name'''
+  _histograms_lock.acquire()
+  try:
+    histograms = sorted(_histograms.items())
+  finally:
+    _histograms_lock.release()
+  return [(name, h.summary()) for (name, h) in histograms]
+
+class InstrumentationMiddleware(object):
+  '''Records every request, when INSTRUMENTATION is set.'''
+  def process_request(self, request):
+    if not app_settings.INSTRUMENTATION:
+      return None
+    # the debug cursor records queries even when DEBUG is off
+    connection.use_debug_cursor = True
+    connection.queries = []
+    _current.record = RequestRecord()
+    return None
+
+  def process_view(self, request, view_func, view_args, view_kwargs):
+    record = getattr(_current, 'record', None)
+    if record is not None:
+      try:
+        record.url_name = resolve(request.path_info).url_name
+      except Resolver404:
+        pass
+      if record.url_name is None:
+        record.url_name = view_func.__name__
+    return None
+
+  def process_response(self, request, response):
+    record = getattr(_current, 'record', None)
+    if record is None:
+      return response
+    _current.record = None
+    queries = connection.queries
+    record.finish(queries)
+    connection.use_debug_cursor = None
+    connection.queries = []
+    if record.url_name is None:
+      record.url_name = request.path_info
+    record_request(record)
+    slowest.add(record, request.method, request.path, queries)
+
+    slow_ms = app_settings.INSTRUMENTATION_SLOW_REQUEST_MS
+    if slow_ms is not None and record.wall_time * 1000 > slow_ms:
+      logger.warning('Slow request: %s %s took %.0fms, %d queries ' \
+          '(%.0fms):\n%s' % (request.method, request.path,
+                             record.wall_time * 1000, record.queries,
+                             record.query_time * 1000,
+                             '\n'.join('[%sms] %s' % (q['time'], q['sql']) \
+                                       for q in queries)))
+    return response
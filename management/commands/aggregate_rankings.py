@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from assessment.ranking import aggregate, GROUP_FIELDS
+import sys
+
+class Command(BaseCommand):
+  help = 'Aggregates the preference judgements into per-query document ' \
+         'rankings or graded qrels, written to standard output.'
+  option_list = BaseCommand.option_list + (
+    make_option('--by', default='query',
+                help='Aggregate by "query" (pooling all assessors) or by ' \
+                     '"assignment".  Default: query'),
+    make_option('--format', default='qrels',
+                help='Output "qrels" or "rankings" (a TREC run).  ' \
+                     'Default: qrels'),
+    make_option('--grades', type='int', default=3,
+                help='Number of relevance grades for ranked documents.  ' \
+                     'Default: 3'),
+    make_option('--iterations', type='int', default=50,
+                help='Bradley-Terry iterations.  Default: 50'),
+  )
+
+  def handle(self, *args, **options):
+    if options['by'] not in GROUP_FIELDS:
+      raise CommandError('--by must be one of: %s' % ', '.join(GROUP_FIELDS))
+    if options['format'] not in ('qrels', 'rankings'):
+      raise CommandError('--format must be "qrels" or "rankings"')
+    rankings = aggregate(options['by'], options['iterations'],
+                         options['grades'])
+    if options['format'] == 'qrels':
+      rankings.write_qrels(sys.stdout)
+    else:
+      rankings.write_rankings(sys.stdout)
@@ -0,0 +1,19 @@
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from assessment.models import AssessedDocumentRelation
+import sys
+
+class Command(NoArgsCommand):
+  help = 'Fills in the assignment of AssessedDocumentRelations saved before ' \
+         'the field was added, from their source documents.'
+
+  @transaction.commit_on_success
+  def handle_noargs(self, **options):
+    missing = AssessedDocumentRelation.objects.filter(assignment__isnull = True)
+    assignment_ids = missing.values_list('source_doc__assignment', flat=True) \
+                            .distinct()
+    n = 0
+    for assignment_id in list(assignment_ids):
+      n += missing.filter(source_doc__assignment = assignment_id) \
+                  .update(assignment = assignment_id)
+    sys.stdout.write('Filled in the assignment of %d relations.\n' % n)
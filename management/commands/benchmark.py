@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import simplejson
+from optparse import make_option
+from assessment import benchmark
+import sys
+
+class Command(BaseCommand):
+  help = 'Benchmarks the assessment views against synthetic datasets, each ' \
+         'in a freshly created test database, reporting latency ' \
+         'percentiles and SQL query counts per view.'
+  option_list = BaseCommand.option_list + (
+    make_option('--scales', default='10x50x3,50x200x5',
+                help='Comma-separated <queries>x<documents>x<assessors> ' \
+                     'dataset sizes.  Default: 10x50x3,50x200x5'),
+    make_option('--judgements', type='int', default=20,
+                help='Judgements made in each synthetic assignment.  ' \
+                     'Default: 20'),
+    make_option('--repeat', type='int', default=5,
+                help='Assessors, and assignments per assessor, to drive ' \
+                     'the views with.  Default: 5'),
+    make_option('--seed', type='int', default=0,
+                help='Random seed for the synthetic data.  Default: 0'),
+    make_option('--output', default=None,
+                help='Write the results as JSON to this file.'),
+    make_option('--compare', default=None,
+                help='Compare against results previously written with ' \
+                     '--output.'),
+  )
+
+  def handle(self, *args, **options):
+    try:
+      scales = [benchmark.Scale.parse(s, options['judgements']) \
+                for s in options['scales'].split(',')]
+    except ValueError:
+      raise CommandError('Scales must look like 10x50x3')
+    results = benchmark.run(scales, options['repeat'], options['seed'],
+                            sys.stdout)
+
+    if options['output']:
+      output = open(options['output'], 'w')
+      simplejson.dump(results, output, indent=2)
+      output.close()
+
+    if options['compare']:
+      old = simplejson.load(open(options['compare']))
+      sys.stdout.write('%-12s %-20s %10s %10s %9s %9s\n' % \
+          ('scale', 'view', 'old p50', 'new p50', 'old SQL', 'new SQL'))
+      for row in benchmark.compare(old, results):
+        sys.stdout.write('%-12s %-20s %10.1f %10.1f %9.1f %9.1f\n' % row)
@@ -0,0 +1,12 @@
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from assessment.models import Assignment, AssignmentProgress
+
+class Command(NoArgsCommand):
+  help = 'Recalculates the AssignmentProgress of every assignment, which is ' \
+         'needed after changing the selection strategy settings.'
+
+  @transaction.commit_on_success
+  def handle_noargs(self, **options):
+    for assignment in Assignment.objects.all():
+      AssignmentProgress.refresh(assignment)
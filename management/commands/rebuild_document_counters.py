@@ -0,0 +1,27 @@
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from django.db.models import Count
+from assessment.models import AssessedDocument, AssessedDocumentRelation
+
+class Command(NoArgsCommand):
+  help = 'Recalculates the times_assessed, is_bad and is_dup counters of ' \
+         'all AssessedDocuments from their relations.'
+
+  @transaction.commit_on_success
+  def handle_noargs(self, **options):
+    relations = AssessedDocumentRelation.objects
+    counts = {}
+    for field in ('source_doc', 'target_doc'):
+      for c in relations.values(field).annotate(n = Count('id')):
+        counts[c[field]] = counts.get(c[field], 0) + c['n']
+    bad = set(relations.filter(relation_type = 'B') \
+                       .values_list('source_doc', flat=True))
+    dup = set(relations.filter(relation_type = 'D') \
+                       .values_list('target_doc', flat=True))
+
+    AssessedDocument.objects.update(times_assessed = 0, is_bad = False,
+                                    is_dup = False)
+    for doc_id in set(counts) | bad | dup:
+      AssessedDocument.objects.filter(id = doc_id).update(
+          times_assessed = counts.get(doc_id, 0),
+          is_bad = doc_id in bad, is_dup = doc_id in dup)
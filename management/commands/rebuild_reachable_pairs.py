@@ -0,0 +1,10 @@
+from django.core.management.base import NoArgsCommand
+from assessment.models import Assignment, ReachablePair
+
+class Command(NoArgsCommand):
+  help = 'Rebuilds the ReachablePair transitive closure index, which is ' \
+         'needed after turning on ASSUME_TRANSITIVITY.'
+
+  def handle_noargs(self, **options):
+    for assignment in Assignment.objects.all():
+      ReachablePair.rebuild(assignment)
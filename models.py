@@ -1,10 +1,16 @@
 # Models for document relevance assessment app.
-from django.db import models
+from django.db import models, connection, transaction
 from django.contrib.auth.models import User
 from django.core.mail import mail_admins
-from django.db.models import Count
+from django.db.models import F, Q
+from django.db.models.signals import post_save, post_delete
+from contextlib import contextmanager
 from datetime import datetime
+from threading import local
 from assessment import app_settings
+from assessment.caching import bump_version, commit_on_success, memoize
+from assessment.graph import Graph
+from assessment.routers import primary
 
 def _flatten(listOfLists):
   "Flatten one level of nesting"
@@ -27,6 +33,24 @@ class Query(models.Model):
   def __unicode__(self):
     return '%s: %s' % (self.qid, self.text)
 
+  def claim(self, assessor):
+    '''Takes one of this query's remaining assignments for the assessor and
+    creates the Assignment, in one transaction.  The remaining assignments
+    are decremented with a conditional UPDATE, so concurrent claims can't
+    over-assign the query.  Returns None if no assignments remain, and raises
+    IntegrityError (releasing the claim) if the query is already assigned to
+    the assessor.'''
+    with commit_on_success():
+      claimed = Query.objects.filter(id = self.id,
+                                     remaining_assignments__gt = 0) \
+                   .update(remaining_assignments = \
+                           F('remaining_assignments') - 1)
+      if not claimed:
+        return None
+      assignment = Assignment(assessor = assessor, query = self)
+      assignment.save()
+    return assignment
+
 class Assignment(models.Model):
   '''An assignment of a query to an assessor.  Each assignment is also contains
   the information need data and provides access to the complete & pending
@@ -61,6 +85,23 @@ class Assignment(models.Model):
       self.started_date = datetime.now()
     super(Assignment, self).save()
 
+  def abandon(self):
+    '''Marks this assignment abandoned and gives its query's assignment back,
+    in one transaction.  Returns False if it was already abandoned, so
+    concurrent requests only give it back once.'''
+    with commit_on_success():
+      abandoned = Assignment.objects.filter(id = self.id, abandoned = False) \
+                                    .update(abandoned = True)
+      if not abandoned:
+        return False
+      Query.objects.filter(id = self.query_id) \
+                   .update(remaining_assignments = \
+                           F('remaining_assignments') + 1)
+    self.abandoned = True
+    # update() doesn't send post_save
+    bump_version('assignment', self.id)
+    return True
+
   def doc_judgement_counts(self):
     docs = self.query.documents.all()
     doc_counts = []
@@ -75,87 +116,136 @@ class Assignment(models.Model):
     return ('assignment_detail', [str(self.id)])
 
   def num_assessments_complete(self, assume_transitivity = False):
-    '''The number of assessments complete for this assignment.'''
+    '''The number of assessments complete for this assignment.  When assuming
+    transitivity, this is the number of (ordered) document pairs connected in
+    the preference graph, read from the ReachablePair index.'''
     if assume_transitivity:
-      g = self.assessment_graph()
-      return len(g.all_path_lengths())
+      return self.reachable_pairs.count()
     else:
       return self.assessments().count()
 
   def latest_assessment(self):
     '''The most recent assessment, or None if no assessments have been
     completed'''
-    all_assessments = self.assessments()
-    if all_assessments.count() == 0:
-      return None
-    return all_assessments.order_by('-created_date')[0]
+    for assessment in self.relations.order_by('-created_date')[:1]:
+      return assessment
+    return None
 
   def elapsed_time(self):
     '''The time elapsed between the population of the info need and the most
-    recent assessment.  Returns None if no assessments have been completed.'''
+    recent assessment, for complete assignments, or until now otherwise.
+    Returns 0 if the info need hasn't been filled in.'''
     if self.started_date is None:
       return 0
-    latest = self.latest_assessment()
-    if self.complete() and latest:
-      return latest.created_date - self.started_date
+    progress = self.get_progress()
+    if self.complete and progress.last_assessment_date is not None:
+      return progress.last_assessment_date - self.started_date
     else:
       return datetime.now() - self.started_date
 
+  def get_progress(self):
+    '''The assignment's AssignmentProgress, calculated without saving it if
+    the assignment was made before progress was kept (see the
+    rebuild_assignment_progress management command)'''
+    try:
+      return self.progress
+    except AssignmentProgress.DoesNotExist:
+      return AssignmentProgress.calculate(self)
+
+  def assessments_done(self):
+    return self.get_progress().assessments_done
+
+  def pending_assessments(self):
+    # nothing is pending once the assignment is complete, whatever its
+    # progress says
+    if self.complete:
+      return 0
+    return self.get_progress().pending_assessments
+
+  def last_assessment_date(self):
+    return self.get_progress().last_assessment_date
+
+  def all_documents(self):
+    '''All the Documents in the query's pool, whether or not they have been
+    materialized as AssessedDocuments for this assignment.'''
+    return self.query.documents.all()
+
+  def materialize_documents(self):
+    '''Creates AssessedDocuments for all the query's documents, with a single
+    INSERT ... SELECT statement.'''
+    qn = connection.ops.quote_name
+    opts = AssessedDocument._meta
+    doc_opts = Document._meta
+    columns = [qn(opts.get_field(f).column) for f in \
+        ('assignment', 'document', 'times_assessed', 'is_bad', 'is_dup')]
+    sql = 'INSERT INTO %s (%s) SELECT %%s, %s, 0, %%s, %%s FROM %s ' \
+          'WHERE %s = %%s' % \
+          (qn(opts.db_table), ', '.join(columns),
+           qn(doc_opts.pk.column), qn(doc_opts.db_table),
+           qn(doc_opts.get_field('query').column))
+    connection.cursor().execute(sql, [self.id, False, False, self.query_id])
+    transaction.commit_unless_managed()
+
+  def assessed_documents(self, document_ids):
+    '''A dict of Document id -> AssessedDocument for the given Document ids,
+    creating any AssessedDocuments that don't exist yet.'''
+    docs = dict((d.document_id, d) for d in \
+        self.documents.select_related('document') \
+                      .filter(document__in = document_ids))
+    for document_id in document_ids:
+      if document_id not in docs:
+        docs[document_id] = AssessedDocument.objects.get_or_create(
+            assignment = self, document_id = document_id)[0]
+    return docs
+
   def assessments(self):
     '''Returns all the AssessedDocumentRelation objects associated with this
     assignment.'''
-    docs = self.documents.values('id')
-    assessments = AssessedDocumentRelation.objects.filter(source_doc__in=docs)
-    return assessments
+    return self.relations.all()
 
+  @memoize()
   def assessment_graph(self):
-    '''Returns a joepy.graph.Graph version of the document assessments, with the
-    (internal) document ID as the vertex labels.  Bad documents are not added
-    to the graph, and Duplicates relations are added both directions with a zero
-    weight.  Preferences are added with a weight of 1.0'''
-    from joepy.graph import Graph
-    g = Graph()
-    for a in self.assessments():
-      if a.relation_type == 'D':
-        g.add_edge(a.source_doc.id, a.target_doc.id, 0)
-        g.add_edge(a.target_doc.id, a.source_doc.id, 0)
-      elif a.relation_type == 'P':
-        g.add_edge(a.source_doc.id, a.target_doc.id, 1)
-    return g
-
+    '''Returns an assessment.graph.Graph version of the document assessments,
+    with the (internal) AssessedDocument ID as the vertex labels, built from a
+    single values_list fetch.  Bad documents are not added to the graph, and
+    Duplicates relations are added in both directions.'''
+    return Graph.from_relations(self.assessments().values_list(
+                                  'source_doc', 'target_doc', 'relation_type'))
+
+  @memoize()
   def bad_documents(self):
     '''returns a set of bad document ids'''
     return set( \
       self.assessments().filter(relation_type = 'B').values_list('source_doc', \
                                                           flat=True))
+  @memoize()
   def dup_documents(self):
     '''returns a set of bad document ids'''
     return set( \
       self.assessments().filter(relation_type = 'D').values_list('target_doc', \
                                                           flat=True))
 
-  def available_documents(self):
-    '''All documents that haven't been judged as bad, or as a duplicate, and
-    also haven't been judged more than MAX_ASSESSMENTS_PER_DOC times.'''
-    assessments = self.assessments()
-    docs = self.documents.exclude( id__in = self.bad_documents() | \
-                                            self.dup_documents() )
+  def unavailable_documents(self):
+    '''The AssessedDocuments that have been judged as bad, or as a
+    duplicate, or more than MAX_ASSESSMENTS_PER_DOC times.'''
+    unavailable = Q(is_bad = True) | Q(is_dup = True)
     if app_settings.MAX_ASSESSMENTS_PER_DOC > 0:
-      docs = docs.annotate(src_count=Count('as_source'), \
-                          tar_count=Count('as_target'))
-      # there's probably a way to do this without explicitly looping over all
-      # documents, but I can't figure it out.
-      docs = (d.id for d in docs if  \
-        (d.src_count + d.tar_count) <= app_settings.MAX_ASSESSMENTS_PER_DOC)
-      # make sure we return a QuerySet, not a list
-      docs = self.documents.filter(id__in=docs)
-    return docs
+      unavailable |= Q(times_assessed__gt = app_settings.MAX_ASSESSMENTS_PER_DOC)
+    return self.documents.filter(unavailable)
+
+  def available_documents(self):
+    '''All Documents that haven't been judged as bad, or as a duplicate, and
+    also haven't been judged more than MAX_ASSESSMENTS_PER_DOC times.
+    Documents without an AssessedDocument are available.'''
+    excluded = self.unavailable_documents().values('id')
+    return self.all_documents().exclude(assesseddocument__id__in = excluded)
 
   def unassessed_documents(self):
-    '''Documents that have not been judged at all'''
+    '''Documents that have not been judged at all, including those without an
+    AssessedDocument'''
     assessed_docs = set(_flatten( \
         self.assessments().values_list('source_doc', 'target_doc')))
-    return self.documents.exclude(id__in = assessed_docs)
+    return self.all_documents().exclude(assesseddocument__id__in = assessed_docs)
 
   def __unicode__(self):
     return '%s assigned to %s' % (self.assessor, self.query)
@@ -183,18 +273,32 @@ class AssessedDocument(models.Model):
   # duplicate and bad-document judgements
   relations = models.ManyToManyField('self', symmetrical=False,
                                      through='AssessedDocumentRelation')
-
-  def is_bad(self):
-    '''Indicates whether the document has been judged bad.'''
-    return self.as_source.exists(relation_type = 'B')
-
-  def is_dup(self):
-    '''Indicates whether the document has been judged a duplicate.'''
-    return self.as_target.exists(relation_type = 'D')
+  # denormalized judgement counters, kept up to date by signals as relations
+  # are saved and deleted.  See the rebuild_document_counters command.
+  times_assessed = models.IntegerField(default=0, db_index=True,
+                                       editable=False)
+  # has the document been judged bad?
+  is_bad = models.BooleanField(default=False, db_index=True, editable=False)
+  # has the document been judged a duplicate?
+  is_dup = models.BooleanField(default=False, db_index=True, editable=False)
 
   def n_times_assessed(self):
     '''The number of times this document was assessed with any other document'''
-    return self.as_source.count() + self.as_target.count()
+    return self.times_assessed
+
+  @classmethod
+  def refresh_counters(cls, doc_ids):
+    '''Recalculates the judgement counters of the given documents from their
+    relations.'''
+    relations = AssessedDocumentRelation.objects
+    for doc_id in doc_ids:
+      cls.objects.filter(id = doc_id).update(
+        times_assessed = relations.filter(source_doc = doc_id).count() + \
+                         relations.filter(target_doc = doc_id).count(),
+        is_bad = relations.filter(source_doc = doc_id,
+                                  relation_type = 'B').exists(),
+        is_dup = relations.filter(target_doc = doc_id,
+                                  relation_type = 'D').exists())
 
   def n_times_preferred(self):
     '''The number of times this document is preferred to other documents'''
@@ -209,6 +313,7 @@ class AssessedDocument(models.Model):
     return self.as_source.filter(relation_type = 'P').values_list( \
                                 'target_doc', flat=True)
 
+  @memoize(version_of = lambda doc: ('assignment', doc.assignment_id))
   def judged_with(self):
     '''The other documents this doc. has been presented with'''
     return set(self.as_source.values_list('target_doc', flat=True)) | \
@@ -216,22 +321,20 @@ class AssessedDocument(models.Model):
 
   def transitively_judged_with(self):
     '''All documents transitively preferred (or unpreferred) to this one'''
-    g = self.assignment.assessment_graph()
-    reachable = g.reachable_from(self.id)
-    g.reverse()
-    reachable = reachable | g.reachable_from(self.id)
-    return reachable
+    return set(self.reaches.values_list('target_doc', flat=True)) | \
+            set(self.reached_from.values_list('source_doc', flat=True))
 
   def available_pairs(self, assume_transitivity = False):
-    '''The other documents that aren't bad or duplicates that this document
+    '''The other Documents that aren't bad or duplicates that this document
     can be judged with'''
     available = self.assignment.available_documents() # excludes bad & dups
-    available = available.exclude(id = self.id) # exclude self
+    available = available.exclude(id = self.document_id) # exclude self
     if assume_transitivity:
       judged_with = self.transitively_judged_with()
     else:
       judged_with = self.judged_with()
-    available = available.exclude(id__in = judged_with) # exclude jud. w/
+    # exclude jud. w/
+    available = available.exclude(assesseddocument__id__in = judged_with)
     return available
 
   class Meta:
@@ -250,17 +353,21 @@ class AssessedDocumentRelation(models.Model):
   #       is just used as a placeholder for calculating the "next assessment"
   source_doc = models.ForeignKey('AssessedDocument', related_name='as_source')
   target_doc = models.ForeignKey('AssessedDocument', related_name='as_target')
+  # denormalized source_doc.assignment, filled in by save(), so an
+  # assignment's relations can be found with an index range scan.  The
+  # composite indexes are in sql/assesseddocumentrelation.sql, and
+  # relations saved before this field existed are filled in by the
+  # backfill_relation_assignments command.
+  assignment = models.ForeignKey(Assignment, related_name='relations',
+                                 null=True, editable=False)
   created_date = models.DateTimeField('started date', editable=False)
   relation_type = models.CharField(max_length=1, choices=RELATION_TYPES)
   reasons = models.ManyToManyField('PreferenceReason', blank=True,
                                     related_name='relations')
   source_presented_left = models.BooleanField(default=True)
 
-  def assignment(self):
-    return self.source_doc.assignment
-
   def assessor(self):
-    return self.assignment().assessor
+    return self.assignment.assessor
 
   def source_docname(self):
     return self.source_doc.document.document
@@ -269,12 +376,14 @@ class AssessedDocumentRelation(models.Model):
     return self.target_doc.document.document
 
   def query(self):
-    return self.assignment().query
+    return self.assignment.query
 
   def save(self):
     '''Custom save method that handles automatically filling in the date'''
     if not self.id:
       self.created_date = datetime.now()
+    if self.assignment_id is None:
+      self.assignment_id = self.source_doc.assignment_id
     super(AssessedDocumentRelation, self).save()
 
   @models.permalink
@@ -293,19 +402,162 @@ class AssessedDocumentRelation(models.Model):
   def __unicode__(self):
     if self.relation_type == 'P':
       return '[%s] document %s preferred to %s' % \
-        (self.source_doc.assignment.query,
+        (self.assignment.query,
          self.source_doc.document.document,
          self.target_doc.document.document)
     elif self.relation_type == 'D':
       return '[%s] document %s duplicate of %s' % \
-        (self.source_doc.assignment.query,
+        (self.assignment.query,
          self.source_doc.document.document,
          self.target_doc.document.document)
     elif self.relation_type == 'B':
       return '[%s] document %s is bad' % \
-        (self.source_doc.assignment.query,
+        (self.assignment.query,
          self.source_doc.document.document)
 
+class ReachablePair(models.Model):
+  '''An index of the transitive closure of an assignment's preference graph:
+  one row for every (source, target) pair where the target document is
+  reachable from the source through preference and duplicate judgements.
+  Only maintained when ASSUME_TRANSITIVITY is set; see the
+  rebuild_reachable_pairs management command.'''
+  assignment = models.ForeignKey(Assignment, related_name='reachable_pairs')
+  source_doc = models.ForeignKey(AssessedDocument, related_name='reaches')
+  target_doc = models.ForeignKey(AssessedDocument, related_name='reached_from')
+
+  class Meta:
+    unique_together = ('source_doc', 'target_doc')
+
+  @classmethod
+  def add_edge(cls, assignment_id, source, target):
+    '''Adds all the pairs made reachable by a new source -> target edge: every
+    document reaching source (and source itself) now reaches target and every
+    document target reaches.'''
+    from assessment.util import bulk_insert
+    ancestors = set(cls.objects.filter(target_doc = source) \
+                               .values_list('source_doc', flat=True))
+    ancestors.add(source)
+    descendants = set(cls.objects.filter(source_doc = target) \
+                                 .values_list('target_doc', flat=True))
+    descendants.add(target)
+    existing = set(cls.objects.filter(source_doc__in = ancestors,
+                                      target_doc__in = descendants) \
+                              .values_list('source_doc', 'target_doc'))
+    bulk_insert(cls, ('assignment', 'source_doc', 'target_doc'),
+                ((assignment_id, a, d) for a in ancestors for d in descendants \
+                  if a != d and (a, d) not in existing))
+
+  @classmethod
+  def add_relation(cls, relation):
+    '''Incrementally updates the index for a newly created relation.'''
+    assignment_id = relation.assignment_id
+    if relation.relation_type == 'P':
+      cls.add_edge(assignment_id, relation.source_doc_id, relation.target_doc_id)
+    elif relation.relation_type == 'D':
+      cls.add_edge(assignment_id, relation.source_doc_id, relation.target_doc_id)
+      cls.add_edge(assignment_id, relation.target_doc_id, relation.source_doc_id)
+
+  @classmethod
+  def rebuild(cls, assignment):
+    '''Recalculates the index for an assignment from scratch.  Needed when a
+    relation is changed or deleted, since edges can't be removed
+    incrementally.'''
+    from assessment.util import bulk_insert
+    graph = Graph.from_relations(assignment.relations \
+      .values_list('source_doc', 'target_doc', 'relation_type'))
+    cls.objects.filter(assignment = assignment).delete()
+    bulk_insert(cls, ('assignment', 'source_doc', 'target_doc'),
+                ((assignment.id, s, t) for (s, t) in graph.reachable_pairs() \
+                   if s != t))
+
+  def __unicode__(self):
+    return '%s reaches %s' % (self.source_doc, self.target_doc)
+
+class AssignmentProgress(models.Model):
+  '''An assignment's progress, materialized in a single row.  It's created
+  with the assignment, and recalculated by signals whenever one of its
+  relations is saved or deleted, in the same transaction when the relation
+  is written inside one, and its pending assessments are cleared when the
+  assignment is marked complete.  See the rebuild_assignment_progress
+  management command.'''
+  assignment = models.OneToOneField(Assignment, primary_key=True,
+                                    related_name='progress')
+  assessments_done = models.IntegerField(default=0)
+  # number of documents judged bad, and judged duplicates
+  bad_documents = models.IntegerField(default=0)
+  dup_documents = models.IntegerField(default=0)
+  # as calculated by the selection strategy
+  pending_assessments = models.IntegerField(default=0)
+  last_assessment_date = models.DateTimeField(null=True)
+  # seconds between the information need and the last assessment
+  elapsed_seconds = models.IntegerField(null=True)
+
+  class Meta:
+    verbose_name_plural = 'assignment progress'
+
+  @classmethod
+  def calculate(cls, assignment):
+    '''Calculates an assignment's progress, without saving it.'''
+    from assessment.selection_strategies import get_strategy
+    # this may be called from a reporting view, but it's read for a write
+    with primary():
+      documents = assignment.documents
+      progress = cls(assignment = assignment,
+          assessments_done = assignment.relations.count(),
+          bad_documents = documents.filter(is_bad = True).count(),
+          dup_documents = documents.filter(is_dup = True).count(),
+          pending_assessments = get_strategy().pending_assessments(assignment))
+      latest = assignment.latest_assessment()
+    if latest is not None:
+      progress.last_assessment_date = latest.created_date
+      if assignment.started_date is not None:
+        elapsed = latest.created_date - assignment.started_date
+        progress.elapsed_seconds = elapsed.days * 86400 + elapsed.seconds
+    return progress
+
+  @classmethod
+  def refresh(cls, assignment):
+    '''Recalculates and saves an assignment's progress.'''
+    progress = cls.calculate(assignment)
+    progress.save()
+    return progress
+
+  @classmethod
+  def for_assignments(cls, assignments):
+    '''A dict of assignment id -> AssignmentProgress for several assignments,
+    from a single query.  Assignments made before progress was kept have no
+    row until the rebuild_assignment_progress management command is run, and
+    are left out rather than calculated in the middle of a page view.'''
+    return cls.objects.in_bulk([a.id for a in assignments])
+
+  def __unicode__(self):
+    return '%d of %d assessments' % \
+      (self.assessments_done,
+       self.assessments_done + self.pending_assessments)
+
+_deferred = local()
+
+@contextmanager
+def deferred_progress():
+  '''Defers the AssignmentProgress refreshes the signals make as relations
+  are saved and deleted in the enclosed code, and refreshes each affected
+  assignment once at the end instead, so a batch of judgements recalculates
+  its assignment's progress once rather than for every judgement.  Use it
+  inside the batch's transaction, so the progress is committed with the
+  judgements.'''
+  if getattr(_deferred, 'assignment_ids', None) is not None:
+    # the outermost block does the refreshing
+    yield
+    return
+  _deferred.assignment_ids = set()
+  try:
+    yield
+    assignment_ids = _deferred.assignment_ids
+  finally:
+    _deferred.assignment_ids = None
+  for assignment in Assignment.objects.filter(id__in = assignment_ids):
+    AssignmentProgress.refresh(assignment)
+
 class PreferenceReason(models.Model):
   '''Options for selecting a preference assessment reason'''
   short_name = models.CharField(max_length=100, unique=True)
@@ -335,3 +587,111 @@ class Comment(models.Model):
 
   def __unicode__(self):
     return 'by %s on %s' % (self.assessor, self.created_date)
+
+def _update_reachable_pairs(sender, instance, created, raw = False, **kwargs):
+  '''Keeps the ReachablePair index up to date as relations are saved.'''
+  if raw or not app_settings.ASSUME_TRANSITIVITY:
+    return
+  if created:
+    ReachablePair.add_relation(instance)
+  else:
+    ReachablePair.rebuild(instance.assignment)
+post_save.connect(_update_reachable_pairs, sender=AssessedDocumentRelation)
+
+def _remove_reachable_pairs(sender, instance, **kwargs):
+  '''Keeps the ReachablePair index up to date as relations are deleted.'''
+  if not app_settings.ASSUME_TRANSITIVITY:
+    return
+  ReachablePair.rebuild(instance.assignment)
+post_delete.connect(_remove_reachable_pairs, sender=AssessedDocumentRelation)
+
+def _update_document_counters(sender, instance, created, raw = False,
+                              **kwargs):
+  '''Keeps the AssessedDocument judgement counters up to date as relations
+  are saved.'''
+  if raw:
+    return
+  if created:
+    # atomic increments, so concurrent judgements don't lose updates
+    AssessedDocument.objects \
+      .filter(id__in = (instance.source_doc_id, instance.target_doc_id)) \
+      .update(times_assessed = F('times_assessed') + 1)
+    if instance.relation_type == 'B':
+      AssessedDocument.objects.filter(id = instance.source_doc_id) \
+                              .update(is_bad = True)
+    elif instance.relation_type == 'D':
+      AssessedDocument.objects.filter(id = instance.target_doc_id) \
+                              .update(is_dup = True)
+  else:
+    # the relation type may have changed
+    AssessedDocument.refresh_counters(
+        (instance.source_doc_id, instance.target_doc_id))
+post_save.connect(_update_document_counters, sender=AssessedDocumentRelation)
+
+def _remove_document_counters(sender, instance, **kwargs):
+  '''Keeps the AssessedDocument judgement counters up to date as relations
+  are deleted.'''
+  AssessedDocument.refresh_counters(
+      (instance.source_doc_id, instance.target_doc_id))
+post_delete.connect(_remove_document_counters,
+                    sender=AssessedDocumentRelation)
+
+def _invalidate_relation_assignment(sender, instance, **kwargs):
+  '''Invalidates the cached values for a relation's assignment, and the
+  reports over all the judgements.'''
+  bump_version('assignment', instance.assignment_id)
+  bump_version('judgements', 'all')
+post_save.connect(_invalidate_relation_assignment,
+                  sender=AssessedDocumentRelation)
+post_delete.connect(_invalidate_relation_assignment,
+                    sender=AssessedDocumentRelation)
+
+def _update_assignment_progress(sender, instance, raw = False, **kwargs):
+  '''Recalculates the progress of a saved relation's assignment.  This is
+  connected last, so the counters and cached values it reads are already up
+  to date.'''
+  if raw:
+    return
+  if getattr(_deferred, 'assignment_ids', None) is not None:
+    _deferred.assignment_ids.add(instance.assignment_id)
+  else:
+    AssignmentProgress.refresh(instance.assignment)
+post_save.connect(_update_assignment_progress,
+                  sender=AssessedDocumentRelation)
+
+def _remove_assignment_progress(sender, instance, **kwargs):
+  '''Recalculates the progress of a deleted relation's assignment, unless
+  the assignment (and its progress) is being deleted too.'''
+  if getattr(_deferred, 'assignment_ids', None) is not None:
+    # refreshed at the end if the assignment still exists
+    _deferred.assignment_ids.add(instance.assignment_id)
+  elif AssignmentProgress.objects.filter(assignment = instance.assignment_id) \
+                                 .exists():
+    AssignmentProgress.refresh(instance.assignment)
+post_delete.connect(_remove_assignment_progress,
+                    sender=AssessedDocumentRelation)
+
+def _create_assignment_progress(sender, instance, created, raw = False,
+                                **kwargs):
+  '''Creates a new assignment's progress, so every assignment made since
+  progress was kept has a row.'''
+  if raw or not created:
+    return
+  AssignmentProgress.refresh(instance)
+post_save.connect(_create_assignment_progress, sender=Assignment)
+
+def _complete_assignment_progress(sender, instance, raw = False, **kwargs):
+  '''Clears the pending assessments of an assignment's progress when the
+  assignment is marked complete, which doesn't change its relations.'''
+  if raw or not instance.complete:
+    return
+  AssignmentProgress.objects.filter(assignment = instance.id) \
+                            .exclude(pending_assessments = 0) \
+                            .update(pending_assessments = 0)
+post_save.connect(_complete_assignment_progress, sender=Assignment)
+
+def _invalidate_assignment(sender, instance, **kwargs):
+  '''Invalidates the cached values for an assignment.'''
+  bump_version('assignment', instance.id)
+post_save.connect(_invalidate_assignment, sender=Assignment)
+post_delete.connect(_invalidate_assignment, sender=Assignment)
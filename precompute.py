@@ -0,0 +1,123 @@
+# Background precomputation of the next document pairs for assignments.
+# After a judgement is saved, the assignment is queued for a pool of worker
+# threads, which compute the next PRECOMPUTE_PAIRS pairs (looking ahead as if
+# each is judged with its fixed document preferred) and cache them for the
+# assignment, along with the judgement each assumes.  A queue is cached under
+# the number of judgements it was computed from, so a slow worker never
+# replaces a newer queue.  Queues outlive the judgements that follow: when
+# one is read, the judgements saved since must be the ones it assumed for
+# its first pairs, which are dropped, and the rest are served in order while
+# the workers catch up.  If any of those judgements differ, the whole queue
+# is dropped.
+from django.core.cache import cache
+from django.db import connection
+from assessment.models import Assignment, AssessedDocumentRelation
+from assessment.selection_strategies import AssignmentState, get_strategy
+from assessment.caching import VALUE_TIMEOUT
+from assessment import app_settings, docproxy
+from Queue import Queue
+from threading import Thread, Lock
+import logging
+
+logger = logging.getLogger('assessment.precompute')
+
+strategy = get_strategy()
+
+_queue = Queue()
+_workers = []
+_workers_lock = Lock()
+
+def _pairs_key(assignment_id, n_judged):
+  return 'assessment:assignment:%s:next_pairs:%s' % (assignment_id, n_judged)
+
+def precomputed_pairs(assignment):
+  '''The precomputed pairs for the assignment that haven't been judged, in
+  order, as DocumentPairPresentation.to_args() tuples, or None if there
+  aren't any, or the judgements since they were computed aren't the ones
+  they assumed.'''
+  if assignment.complete:
+    return None
+  n_judged = assignment.relations.count()
+  # the newest queue computed from the last PRECOMPUTE_PAIRS judgements
+  keys = [_pairs_key(assignment.id, n) \
+          for n in xrange(n_judged, n_judged - app_settings.PRECOMPUTE_PAIRS,
+                          -1)]
+  queues = cache.get_many(keys)
+  for (n_assumed, key) in enumerate(keys):
+    if key in queues:
+      break
+  else:
+    return None
+  # pairs of (to_args() tuple, assumed (preferred, other) AssessedDocument
+  # ids)
+  queue = queues[key]
+  if n_assumed >= len(queue):
+    return None
+  doc_ids = set()
+  for ((left, _, right, _), _) in queue:
+    doc_ids.update((left, right))
+  judged = dict(((source, target), relation_type) \
+                for (source, target, relation_type) in \
+                AssessedDocumentRelation.objects \
+                  .filter(assignment = assignment, source_doc__in = doc_ids,
+                          target_doc__in = doc_ids) \
+                  .values_list('source_doc', 'target_doc', 'relation_type'))
+  if [judged.get(tuple(assumed)) for (_, assumed) in queue[:n_assumed]] != \
+     ['P'] * n_assumed:
+    return None
+  # the rest of the pairs are served up to the first with a document that
+  # can no longer be presented
+  unavailable = set(assignment.unavailable_documents() \
+                              .filter(id__in = doc_ids) \
+                              .values_list('id', flat=True))
+  pairs = []
+  for ((left, lf, right, rf), _) in queue[n_assumed:]:
+    if left in unavailable or right in unavailable or \
+       (left, right) in judged or (right, left) in judged:
+      break
+    pairs.append((left, lf, right, rf))
+  return pairs or None
+
+def precompute(assignment_id):
+  '''Computes and caches the next pairs for an assignment.'''
+  assignment = Assignment.objects.get(id = assignment_id)
+  state = AssignmentState(assignment)
+  n_judged = state.n_assessments
+  pairs = strategy.next_pairs(assignment, app_settings.PRECOMPUTE_PAIRS,
+                              state)
+  queue = [(p.to_args(), [d.id for d in p.assumed_preference()]) \
+           for p in pairs]
+  cache.set(_pairs_key(assignment_id, n_judged), queue, VALUE_TIMEOUT)
+  # get the next pair's documents into the document cache
+  if pairs:
+    docproxy.prefetch([pairs[0].left_doc(), pairs[0].right_doc()])
+
+def schedule(assignment_id):
+  '''Queues an assignment for precomputation.  This must be called after the
+  judgement is committed, or the workers may not see it.'''
+  if app_settings.PRECOMPUTE_PAIRS <= 0:
+    return
+  _start_workers()
+  _queue.put(assignment_id)
+
+def _start_workers():
+  _workers_lock.acquire()
+  try:
+    while len(_workers) < app_settings.PRECOMPUTE_WORKERS:
+      worker = Thread(target = _work)
+      worker.setDaemon(True)
+      worker.start()
+      _workers.append(worker)
+  finally:
+    _workers_lock.release()
+
+def _work():
+  while True:
+    assignment_id = _queue.get()
+    try:
+      precompute(assignment_id)
+    except Exception:
+      logger.exception('Error precomputing pairs for assignment %s' % \
+                       assignment_id)
+    # each thread has its own connection, which shouldn't be left open
+    connection.close()
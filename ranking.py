@@ -0,0 +1,176 @@
+# Aggregation of pairwise preference judgements into document rankings and
+# graded relevance judgements (qrels).  All the judgements are loaded into
+# NumPy arrays with a single query, and the scores for every query (or
+# assignment) are computed together in vectorized form.
+#
+# Requires NumPy.
+import numpy as np
+from assessment.models import AssessedDocumentRelation, Document, Query, \
+                              Assignment
+
+# the field grouping the judgements, for each way of aggregating them
+GROUP_FIELDS = { 'query': 'assignment__query',
+                 'assignment': 'assignment' }
+
+class Rankings(object):
+  '''The aggregated scores for every judged (group, document) pair.  Each
+  attribute is an array with one entry per pair, sorted by group and then by
+  descending strength:
+
+    groups     - query (or assignment) ids
+    docs       - Document ids
+    wins, losses, ties - judgement counts ('D' duplicates are ties)
+    copeland   - wins minus losses
+    win_ratio  - (wins + ties / 2) / comparisons
+    strength   - Bradley-Terry strength, with a geometric mean of 1 per group
+    elo        - the Bradley-Terry strength on the Elo rating scale
+    grade      - graded relevance, from 1 up to the number of grades for
+                 ranked documents, or 0 for bad documents
+  '''
+  def __init__(self, by, **arrays):
+    self.by = by
+    for (name, array) in arrays.items():
+      setattr(self, name, array)
+
+  def __len__(self):
+    return len(self.docs)
+
+  def group_names(self):
+    '''A dict of group id -> name (the qid, or the assignment's description)'''
+    ids = np.unique(self.groups).tolist()
+    if self.by == 'query':
+      return dict(Query.objects.filter(id__in = ids).values_list('id', 'qid'))
+    return dict((a.id, unicode(a)) for a in \
+        Assignment.objects.select_related().filter(id__in = ids))
+
+  def doc_names(self):
+    '''A dict of Document id -> document name'''
+    return dict(Document.objects.filter(id__in = np.unique(self.docs).tolist())
+                                .values_list('id', 'document'))
+
+  def rows(self):
+    '''A generator over (group name, document name, copeland, win ratio,
+    strength, elo, grade) tuples'''
+    groups, docs = self.group_names(), self.doc_names()
+    for i in xrange(len(self)):
+      yield (groups[self.groups[i]], docs[self.docs[i]], self.copeland[i],
+             self.win_ratio[i], self.strength[i], self.elo[i], self.grade[i])
+
+  def write_qrels(self, file):
+    '''Writes TREC-format qrels: <qid> 0 <document> <grade>'''
+    for (group, doc, _, _, _, _, grade) in self.rows():
+      file.write('%s 0 %s %d\n' % (group, doc, grade))
+
+  def write_rankings(self, file):
+    '''Writes TREC-format runs, leaving out bad documents:
+    <qid> Q0 <document> <rank> <strength> <tag>'''
+    rank = _rank_within_groups(self.groups)
+    for (i, (group, doc, _, _, strength, _, grade)) in enumerate(self.rows()):
+      if grade > 0:
+        file.write('%s Q0 %s %d %f bradley-terry\n' % \
+                   (group, doc, rank[i] + 1, strength))
+
+def load_judgements(by = 'query'):
+  '''Loads all the judgements into arrays of group ids, source and target
+  Document ids and relation types.'''
+  rows = AssessedDocumentRelation.objects.values_list(GROUP_FIELDS[by],
+            'source_doc__document', 'target_doc__document', 'relation_type')
+  rows = list(rows)
+  if not rows:
+    empty = np.zeros(0, dtype=np.int64)
+    return (empty, empty, empty, np.zeros(0, dtype='S1'))
+  (groups, sources, targets, types) = zip(*rows)
+  return (np.array(groups, dtype=np.int64), np.array(sources, dtype=np.int64),
+          np.array(targets, dtype=np.int64), np.array(types, dtype='S1'))
+
+def _rank_within_groups(groups):
+  '''The 0-based position of each element within its run of equal groups
+  (groups must be sorted)'''
+  positions = np.arange(len(groups))
+  starts = np.r_[0, np.flatnonzero(groups[1:] != groups[:-1]) + 1]
+  run_lengths = np.diff(np.r_[starts, len(groups)])
+  return positions - np.repeat(starts, run_lengths)
+
+def _bradley_terry(n_items, winners, losers, tie_a, tie_b, item_groups,
+                   iterations, prior = 0.1):
+  '''Bradley-Terry strengths by minorization-maximization (Hunter, 2004),
+  counting ties as half a win for each document.  Every document also gets
+  prior wins and losses against a virtual opponent of strength 1, so
+  undefeated and winless documents have finite strengths.'''
+  first = np.r_[winners, tie_a]
+  second = np.r_[losers, tie_b]
+  won = np.bincount(winners, minlength=n_items) + \
+        0.5 * np.bincount(tie_a, minlength=n_items) + \
+        0.5 * np.bincount(tie_b, minlength=n_items) + prior
+  group_sizes = np.bincount(item_groups)
+
+  strength = np.ones(n_items)
+  for _ in xrange(iterations):
+    inverse_sum = 1.0 / (strength[first] + strength[second])
+    denominator = np.bincount(first, weights=inverse_sum, minlength=n_items) \
+                + np.bincount(second, weights=inverse_sum, minlength=n_items) \
+                + 2 * prior / (strength + 1)
+    strength = won / denominator
+    # normalize to a geometric mean of 1 within each group
+    log_strength = np.log(strength)
+    group_mean = np.bincount(item_groups, weights=log_strength) / group_sizes
+    strength = np.exp(log_strength - group_mean[item_groups])
+  return strength
+
+def aggregate(by = 'query', iterations = 50, grades = 3):
+  '''Aggregates all the judgements, grouped by query or by assignment, into
+  a Rankings object.  Documents judged bad within a group are dropped from
+  its ranking (and given a grade of 0), and duplicates count as ties.'''
+  (groups, sources, targets, types) = load_judgements(by)
+
+  # (group, document) pairs are encoded as single integers
+  stride = max(sources.max() if len(sources) else 0,
+               targets.max() if len(targets) else 0) + 1
+  bad = np.unique(groups[types == 'B'] * stride + sources[types == 'B'])
+  source_keys = groups * stride + sources
+  target_keys = groups * stride + targets
+  judged = (types != 'B') & ~np.in1d(source_keys, bad) & \
+           ~np.in1d(target_keys, bad)
+  (keys, inverse) = np.unique(np.r_[source_keys[judged], target_keys[judged]],
+                              return_inverse=True)
+  n_judged = judged.sum()
+  (source_items, target_items) = (inverse[:n_judged], inverse[n_judged:])
+  is_pref = types[judged] == 'P'
+  n_items = len(keys)
+
+  wins = np.bincount(source_items[is_pref], minlength=n_items)
+  losses = np.bincount(target_items[is_pref], minlength=n_items)
+  ties = np.bincount(source_items[~is_pref], minlength=n_items) + \
+         np.bincount(target_items[~is_pref], minlength=n_items)
+  comparisons = wins + losses + ties
+
+  item_groups = np.unique(keys // stride, return_inverse=True)[1]
+  strength = _bradley_terry(n_items, source_items[is_pref],
+                            target_items[is_pref], source_items[~is_pref],
+                            target_items[~is_pref], item_groups, iterations)
+
+  # sort by group, then by descending strength, and grade by rank
+  order = np.lexsort((-strength, keys // stride))
+  keys, strength = keys[order], strength[order]
+  (wins, losses, ties, comparisons) = (wins[order], losses[order],
+                                       ties[order], comparisons[order])
+  group_ids = keys // stride
+  rank = _rank_within_groups(group_ids)
+  group_sizes = np.bincount(np.unique(group_ids, return_inverse=True)[1])
+  sizes = np.repeat(group_sizes, group_sizes)
+  grade = grades - (rank * grades) // sizes
+
+  # bad documents go at the end of their group, with a grade of 0
+  all_keys = np.r_[keys, bad]
+  order = np.lexsort((np.r_[np.zeros(len(keys)), np.ones(len(bad))],
+                      all_keys // stride))
+  pad = lambda a, fill: np.r_[a, np.repeat(fill, len(bad))][order]
+  return Rankings(by,
+      groups = (all_keys // stride)[order],
+      docs = (all_keys % stride)[order],
+      wins = pad(wins, 0), losses = pad(losses, 0), ties = pad(ties, 0),
+      copeland = pad(wins - losses, 0),
+      win_ratio = pad((wins + ties / 2.0) / np.maximum(comparisons, 1), 0.0),
+      strength = pad(strength, 0.0),
+      elo = pad(1500 + 400 * np.log10(strength), np.nan),
+      grade = pad(grade, 0))
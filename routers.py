@@ -0,0 +1,137 @@
+# Database routing for reporting reads.  When REPORTING_DATABASE names a
+# replica in DATABASES and ReportingRouter is in DATABASE_ROUTERS, the reads
+# made inside reporting() -- by the report and export views and the admin
+# changelists -- go to the replica, so their scans don't load the database
+# assessors write to.  Everything else, including every write and the
+# selection strategy's reads, stays on the primary.  If the replica falls
+# more than REPORTING_MAX_LAG seconds behind, or can't be reached, reporting
+# reads go to the primary too.
+from django.db import DEFAULT_DB_ALIAS, router
+from assessment import app_settings
+from contextlib import contextmanager
+from functools import wraps
+from threading import local, Lock
+from time import time
+import logging
+
+logger = logging.getLogger('assessment.routers')
+
+_state = local()
+
+@contextmanager
+def reporting():
+  '''Routes the enclosed code's reads to the reporting replica'''
+  _state.reporting = getattr(_state, 'reporting', 0) + 1
+  try:
+    yield
+  finally:
+    _state.reporting -= 1
+
+@contextmanager
+def primary():
+  '''Routes the enclosed code's reads to the primary, even inside
+  reporting(), for reads that writes depend on'''
+  (saved, _state.reporting) = (getattr(_state, 'reporting', 0), 0)
+  try:
+    yield
+  finally:
+    _state.reporting = saved
+
+def reads_from_replica(model):
+  '''Whether reads of the model made here and now go to the reporting
+  replica, so may be behind the primary'''
+  return router.db_for_read(model) != DEFAULT_DB_ALIAS
+
+def reporting_view(view):
+  '''Decorates a view so its reads go to the reporting replica'''
+  @wraps(view)
+  def wrapper(*args, **kwargs):
+    with reporting():
+      return view(*args, **kwargs)
+  return wrapper
+
+def reporting_iterator(iterable):
+  '''Wraps a lazy iterable, such as a streamed response's content, so the
+  reads it makes as it's consumed go to the reporting replica'''
+  iterator = iter(iterable)
+  while True:
+    with reporting():
+      try:
+        item = iterator.next()
+      except StopIteration:
+        return
+    yield item
+
+class LagGuard(object):
+  '''Checks, at most every REPORTING_LAG_CHECK_INTERVAL seconds, whether the
+  replica is usable: reachable, and with its latest judgement no more than
+  REPORTING_MAX_LAG seconds older than the primary's.'''
+  def __init__(self):
+    self.checked = None
+    self.usable = False
+    self.lock = Lock()
+
+  def latest_judgement(self, alias):
+    from assessment.models import AssessedDocumentRelation
+    for (created_date,) in AssessedDocumentRelation.objects.using(alias) \
+        .order_by('-id').values_list('created_date')[:1]:
+      return created_date
+    return None
+
+  def check(self):
+    alias = app_settings.REPORTING_DATABASE
+    try:
+      primary_latest = self.latest_judgement(DEFAULT_DB_ALIAS)
+      replica_latest = self.latest_judgement(alias)
+    except Exception:
+      logger.exception('Error checking the reporting database %s' % alias)
+      return False
+    if primary_latest is None:
+      return True
+    if replica_latest is None:
+      lag = None
+    else:
+      lag = primary_latest - replica_latest
+      lag = lag.days * 86400 + lag.seconds
+    if lag is None or lag > app_settings.REPORTING_MAX_LAG:
+      logger.warning('Reporting database %s is lagging by %s seconds: ' \
+                     'using the primary' % (alias, lag))
+      return False
+    return True
+
+  def replica_usable(self):
+    self.lock.acquire()
+    try:
+      if self.checked is None or \
+          time() - self.checked > app_settings.REPORTING_LAG_CHECK_INTERVAL:
+        self.usable = self.check()
+        self.checked = time()
+      return self.usable
+    finally:
+      self.lock.release()
+
+lag_guard = LagGuard()
+
+class ReportingRouter(object):
+  '''Sends reads inside reporting() to REPORTING_DATABASE, when it's set and
+  the replica is usable, and every write to the primary.'''
+  def db_for_read(self, model, **hints):
+    alias = app_settings.REPORTING_DATABASE
+    if alias is None:
+      return None
+    if getattr(_state, 'reporting', 0) and lag_guard.replica_usable():
+      return alias
+    # objects read from the replica shouldn't pull later reads there
+    return DEFAULT_DB_ALIAS
+
+  def db_for_write(self, model, **hints):
+    if app_settings.REPORTING_DATABASE is None:
+      return None
+    return DEFAULT_DB_ALIAS
+
+  def allow_relation(self, obj1, obj2, **hints):
+    # the replica holds the same data as the primary
+    return True
+
+  def allow_syncdb(self, db, model):
+    return None
@@ -1,9 +1,192 @@
 from assessment.models import Assignment
+from assessment.graph import Graph
 from assessment import app_settings
+from assessment.caching import get_version, versioned_key, \
+                               VALUE_TIMEOUT
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.urlresolvers import reverse
+from collections import defaultdict
+from math import ceil, log
+from random import shuffle
 
 def _choose_2(n):
   return 0 if n < 2 else n * (n-1) / 2
 
+def _nearest_first(lo, hi, mid):
+  '''Generates the positions in [lo, hi) in order of their distance from mid,
+  which is in the range: mid, mid - 1, mid + 1, mid - 2, ...'''
+  yield mid
+  for distance in xrange(1, max(mid - lo, hi - 1 - mid) + 1):
+    if mid - distance >= lo:
+      yield mid - distance
+    if mid + distance < hi:
+      yield mid + distance
+
+class AssignmentState(object):
+  '''An in-memory snapshot of an assignment's documents and judgements.  The
+  documents and all the relations are each loaded with a single values_list
+  fetch, and the strategies answer all their questions about the assignment
+  from this object rather than going back to the database.  Document ids are
+  Document (not AssessedDocument) ids, so documents that haven't been
+  materialized as AssessedDocuments yet are treated as unassessed.'''
+  def __init__(self, assignment):
+    self.assignment = assignment
+    # document ids, ordered by descending score
+    self.doc_ids = list(assignment.all_documents().order_by('-score') \
+                                  .values_list('id', flat=True))
+    self.counts = dict.fromkeys(self.doc_ids, 0)
+    self.judged = defaultdict(set)
+    # (source, target) -> relation_type of every judgement
+    self.outcomes = {}
+    # (source, target, relation_type) of every judgement, for building the
+    # preference graph when it's needed
+    self.relations = []
+    self._graph = None
+    self._closure = None
+    self.bad = set()
+    self.dups = set()
+    self.n_assessments = 0
+    # (source_doc, target_doc, relation_type, source_presented_left) of the
+    # most recent assessment, or None
+    self.latest = None
+    relations = assignment.relations \
+      .order_by('created_date', 'id') \
+      .values_list('source_doc__document', 'target_doc__document',
+                   'relation_type', 'source_presented_left')
+    for relation in relations:
+      self.add_relation(*relation)
+
+  def add_relation(self, source, target, relation_type,
+                   source_presented_left = True):
+    '''Updates the state with a new judgement.'''
+    self.n_assessments += 1
+    self.counts[source] = self.counts.get(source, 0) + 1
+    self.counts[target] = self.counts.get(target, 0) + 1
+    self.judged[source].add(target)
+    self.judged[target].add(source)
+    if relation_type == 'B':
+      self.bad.add(source)
+    elif relation_type == 'D':
+      self.dups.add(target)
+    self.outcomes[(source, target)] = relation_type
+    self.relations.append((source, target, relation_type))
+    self._graph = None
+    self._closure = None
+    self.latest = (source, target, relation_type, source_presented_left)
+
+  def graph(self):
+    '''The preference graph of the judgements'''
+    if self._graph is None:
+      self._graph = Graph.from_relations(self.relations)
+    return self._graph
+
+  def closure(self):
+    '''The transitive closure of the preference graph (see Graph.closure),
+    computed once for the state's judgements'''
+    if self._closure is None:
+      self._closure = self.graph().closure()
+    return self._closure
+
+  def num_assessments_complete(self, assume_transitivity = False):
+    '''The number of assessments complete for this assignment.'''
+    if assume_transitivity:
+      return self.assignment.num_assessments_complete(True)
+    return self.n_assessments
+
+  def order(self, a, b):
+    '''1 if document a is preferred to b, -1 if b is preferred to a, 0 if
+    they're duplicates or None if that isn't known, either from a judgement
+    of the pair or transitively through the preference graph.'''
+    for (pair, sign) in (((a, b), 1), ((b, a), -1)):
+      relation_type = self.outcomes.get(pair)
+      if relation_type == 'P':
+        return sign
+      elif relation_type == 'D':
+        return 0
+    graph = self.graph()
+    if a not in graph.index or b not in graph.index:
+      return None
+    (v, w) = (graph.index[a], graph.index[b])
+    closure = self.closure()
+    a_reaches_b = (closure[v] >> w) & 1
+    b_reaches_a = (closure[w] >> v) & 1
+    if a_reaches_b and b_reaches_a:
+      return 0
+    elif a_reaches_b:
+      return 1
+    elif b_reaches_a:
+      return -1
+    return None
+
+  def has_capacity(self, doc_id):
+    '''Whether the document can be presented again without going over
+    MAX_ASSESSMENTS_PER_DOC'''
+    return app_settings.MAX_ASSESSMENTS_PER_DOC <= 0 or \
+        self.counts[doc_id] < app_settings.MAX_ASSESSMENTS_PER_DOC
+
+  def bad_dup_documents(self):
+    '''The set of documents judged bad or as a duplicate'''
+    return self.bad | self.dups
+
+  def is_available(self, doc_id):
+    '''Whether the document hasn't been judged as bad, or as a duplicate, and
+    also hasn't been judged more than MAX_ASSESSMENTS_PER_DOC times.'''
+    if doc_id in self.bad or doc_id in self.dups:
+      return False
+    return app_settings.MAX_ASSESSMENTS_PER_DOC <= 0 or \
+        self.counts[doc_id] <= app_settings.MAX_ASSESSMENTS_PER_DOC
+
+  def available_documents(self):
+    '''Available documents (see is_available), by descending score'''
+    return [d for d in self.doc_ids if self.is_available(d)]
+
+  def unassessed_documents(self):
+    '''Documents that have not been judged at all, by descending score'''
+    return [d for d in self.doc_ids if self.counts[d] == 0]
+
+  def judged_with(self, doc_id):
+    '''The other documents this doc. has been presented with'''
+    return self.judged[doc_id]
+
+  def transitively_judged_with(self, doc_id):
+    '''All documents transitively preferred (or unpreferred) to this one'''
+    graph = self.graph()
+    return graph.reachable_from(doc_id) | \
+           graph.reversed().reachable_from(doc_id)
+
+  def available_pairs(self, doc_id, assume_transitivity = False):
+    '''The other available documents this document can be judged with, by
+    descending score'''
+    if assume_transitivity:
+      judged_with = self.transitively_judged_with(doc_id)
+    else:
+      judged_with = self.judged_with(doc_id)
+    return [d for d in self.available_documents() \
+              if d != doc_id and d not in judged_with]
+
+  def assume_judged(self, docpair):
+    '''Updates the state as if the pair had been judged with the fixed (or
+    otherwise the left) document preferred, for looking ahead at the pairs
+    that are likely to come next.'''
+    (preferred, other) = docpair.assumed_preference()
+    self.add_relation(preferred.document_id, other.document_id, 'P',
+                      preferred is docpair.docs[0])
+
+  def presentation(self, left_id, right_id, left_fixed, right_fixed):
+    '''A DocumentPairPresentation for the two document ids, materializing
+    their AssessedDocuments if necessary'''
+    docs = self.assignment.assessed_documents([left_id, right_id])
+    return DocumentPairPresentation(docs[left_id], docs[right_id],
+                                    left_fixed, right_fixed)
+
+def document_url(document):
+  '''The URL a document is shown from: the document proxy, if DOCUMENT_PROXY
+  is set, otherwise the document server'''
+  if app_settings.DOCUMENT_PROXY:
+    return reverse('document_proxy', args = [document])
+  return app_settings.DOCSERVER_URL_PATTERN % document
+
 class DocumentPairPresentation(object):
   '''Deals with which document is presented on the left/right and which
   document is fixed in place from the last presentation.'''
@@ -31,10 +214,17 @@ class DocumentPairPresentation(object):
     return self.docs[1].n_times_assessed()
 
   def left_doc_url(self):
-    return app_settings.DOCSERVER_URL_PATTERN % self.left_doc()
+    return document_url(self.left_doc())
 
   def right_doc_url(self):
-    return app_settings.DOCSERVER_URL_PATTERN % self.right_doc()
+    return document_url(self.right_doc())
+
+  def assumed_preference(self):
+    '''(preferred, other) AssessedDocuments, assuming the fixed (or otherwise
+    the left) document is preferred'''
+    if self.fixed[1]:
+      return (self.docs[1], self.docs[0])
+    return self.docs
 
   @classmethod
   def from_assessment(cls, assessment):
@@ -64,23 +254,79 @@ class Strategy(object):
   def __init__(self, max_assessments_per_query):
     self.max_assessments_per_query = max_assessments_per_query
 
-  def next_pair(self, assignment):
+  def next_pair(self, assignment, state = None):
     return None
 
-  def assignment_complete(self, assignment):
-    return self.pending_assessments(assignment) <= 0
+  def next_pairs(self, assignment, n, state = None):
+    '''Up to n pairs likely to be presented next, looking ahead by assuming
+    each pair is judged with its fixed document preferred.'''
+    if state is None:
+      state = AssignmentState(assignment)
+    pairs = []
+    n = min(n, self.pending_assessments(assignment, state))
+    while len(pairs) < n:
+      docpair = self.next_pair(assignment, state)
+      if docpair is None:
+        break
+      pairs.append(docpair)
+      state.assume_judged(docpair)
+    return pairs
+
+  def assignment_complete(self, assignment, state = None):
+    return self.pending_assessments(assignment, state) <= 0
+
+  def cache_name(self):
+    '''Identifies this strategy's configuration in cache keys'''
+    return '%s-%d-%d' % (self.__class__.__name__,
+                         self.max_assessments_per_query,
+                         self.assume_transitivity)
 
-  def pending_assessments(self, assignment):
+  def pending_assessments(self, assignment, state = None):
+    '''The number of assessments remaining for the assignment.  The result is
+    cached until the assignment or any of its relations change.  If an
+    AssignmentState is given, which may include judgements only assumed while
+    looking ahead, it's calculated from that instead, without the cache.'''
+    if state is not None:
+      return self.calculate_pending_assessments(assignment, state)
     if assignment.complete: return 0
-    assessments_done = \
+    key = versioned_key('assignment', assignment.id,
+                        get_version('assignment', assignment.id),
+                        self.cache_name() + ':pending')
+    pending = cache.get(key)
+    if pending is None:
+      pending = self.calculate_pending_assessments(assignment)
+      cache.set(key, pending, VALUE_TIMEOUT)
+    return pending
+
+  def calculate_pending_assessments(self, assignment, state = None):
+    '''Calculates pending_assessments without the cache.  If an
+    AssignmentState is given, it's used instead of querying the database.'''
+    if assignment.complete: return 0
+    if state is None:
+      assessments_done = \
                 assignment.num_assessments_complete(self.assume_transitivity)
+    else:
+      assessments_done = \
+                state.num_assessments_complete(self.assume_transitivity)
     if assessments_done >= self.max_assessments_per_query:
       # this assignment should be marked complete
       assignment.complete = True
       assignment.save()
       return 0
-    n_docs = assignment.documents.count()
-    n_bad_dups = len(assignment.bad_documents() | assignment.dup_documents())
+    if state is None:
+      n_docs = assignment.all_documents().count()
+      n_bad_dups = len(assignment.bad_documents() | assignment.dup_documents())
+    else:
+      n_docs = len(state.doc_ids)
+      n_bad_dups = len(state.bad_dup_documents())
+    return self.pending_from_counts(assessments_done, n_docs, n_bad_dups)
+
+  def pending_from_counts(self, assessments_done, n_docs, n_bad_dups):
+    '''The number of pending assessments given the number of assessments
+    done, documents and bad or duplicate documents.  Doesn't touch the
+    database, so it can be applied to aggregate query results.'''
+    if assessments_done >= self.max_assessments_per_query:
+      return 0
     # preference assessments only (not bad or dup judgements):
     prefs_done = assessments_done - n_bad_dups
     # total pref assessments given the number of bads & dups
@@ -101,14 +347,17 @@ class Strategy(object):
       else:
         return [None, assignment.source_doc]
 
-  def new_pair(self, assignment, order_by = '?'):
-    '''Gets a pair of documents, using the ordering relation specified.'''
-    available_docs = assignment.available_documents().order_by(order_by)
+  def new_pair(self, state, randomize = True):
+    '''Gets a pair of documents, either in random order or by descending
+    score.'''
+    available_docs = state.available_documents()
+    if randomize:
+      shuffle(available_docs)
     for next_doc in available_docs:
-      available_others = next_doc.available_pairs(self.assume_transitivity)
-      if available_others.exists():
-        return DocumentPairPresentation(next_doc, available_others[0],
-                                        False, False)
+      available_others = state.available_pairs(next_doc,
+                                               self.assume_transitivity)
+      if available_others:
+        return state.presentation(next_doc, available_others[0], False, False)
     # we haven't found any suitable new pair, so we may be done
     return None
 
@@ -118,44 +367,209 @@ class BubbleSortStrategy(Strategy):
   exposing the assessor to the whole document set as soon as possible, finding
   the 'best' document in a single pass, and keeping one document in the pair
   fixed to the greatest extent possible.'''
-  def next_pair(self, assignment):
-    if self.assignment_complete(assignment): return None
-    latest_assessment = assignment.latest_assessment()
-    if latest_assessment is None:
+  def next_pair(self, assignment, state = None):
+    if state is None:
+      state = AssignmentState(assignment)
+    if self.assignment_complete(assignment, state): return None
+    if state.latest is None:
       # just grab the first 2 docs for assessment
-      return self.new_pair(assignment, order_by='-document__score')
+      return self.new_pair(state, randomize=False)
 
-    if latest_assessment.relation_type == 'B':
-      keep_doc = latest_assessment.target_doc
-      keep_left = not latest_assessment.source_presented_left
+    (source_doc, target_doc, relation_type, source_presented_left) = \
+        state.latest
+    if relation_type == 'B':
+      keep_doc = target_doc
+      keep_left = not source_presented_left
     else:
-      keep_doc = latest_assessment.source_doc
-      keep_left = latest_assessment.source_presented_left
+      keep_doc = source_doc
+      keep_left = source_presented_left
 
     if app_settings.MAX_ASSESSMENTS_PER_DOC > 0 and \
-        keep_doc.n_times_assessed() >= app_settings.MAX_ASSESSMENTS_PER_DOC:
+        state.counts[keep_doc] >= app_settings.MAX_ASSESSMENTS_PER_DOC:
       # just grab the next 2 docs for assessment
-      return self.new_pair(assignment, order_by='-document__score')
+      return self.new_pair(state, randomize=False)
 
     # find the next document in the pair.  First, favor documents that haven't
     # been judged at all, then favor docs. that haven't been judged with the
     # keep_doc
-    other_docs = assignment.unassessed_documents()
-    if other_docs.exists():
-      other_doc = other_docs.order_by('-document__score')[0]
-    else:
-      other_docs = keep_doc.available_pairs(self.assume_transitivity)
-      if other_docs.exists():
-        other_doc = other_docs.order_by('-document__score')[0]
-      else:
-        other_doc = None
-
-    if other_doc:
+    other_docs = state.unassessed_documents() or \
+                 state.available_pairs(keep_doc, self.assume_transitivity)
+    if other_docs:
+      other_doc = other_docs[0]
       if keep_left:
-        return DocumentPairPresentation(keep_doc, other_doc, True, False)
+        return state.presentation(keep_doc, other_doc, True, False)
       else:
-        return DocumentPairPresentation(other_doc, keep_doc, False, True)
+        return state.presentation(other_doc, keep_doc, False, True)
     else:
       # there weren't any available other documents with this one, so do
       # a new pair
-      return self.new_pair(assignment, order_by='-document__score')
+      return self.new_pair(state, randomize=False)
+
+class BinaryInsertionStrategy(Strategy):
+  '''A strategy that builds a total order of the documents by binary
+  insertion: documents are taken in descending score order, and each is
+  compared with the middle of the part of the already-ordered documents it
+  could belong in, so ordering n documents takes O(n log n) judgements.  The
+  document being inserted is kept fixed.
+
+  The order is rebuilt from the judgements each time, so documents judged
+  bad or as duplicates simply drop out of it.  Pairs whose order is already
+  known (directly or transitively) are never presented, and documents that
+  have been presented MAX_ASSESSMENTS_PER_DOC times are compared with a
+  neighbour instead, or placed without a comparison.'''
+  def _probe(self, lo, hi, ordered):
+    '''The position in ordered[lo:hi] to compare a document with first'''
+    return (lo + hi) // 2
+
+  def _insert(self, ordered, doc, position):
+    ordered.insert(position, doc)
+
+  def _search(self, state, ordered, doc, lo = 0, hi = None):
+    '''Binary searches for doc's position in ordered[lo:hi] (the ordered
+    documents are most preferred first).  Returns (position, None) if it's
+    found, or (None, other_doc) if doc needs to be compared with other_doc
+    first.'''
+    if hi is None:
+      hi = len(ordered)
+    while lo < hi:
+      mid = self._probe(lo, hi, ordered)
+      # try the middle, then its nearest neighbours, for a document whose
+      # order with doc is known or that can still be presented
+      for i in _nearest_first(lo, hi, mid):
+        order = state.order(doc, ordered[i])
+        if order is not None:
+          break
+        if state.has_capacity(doc) and state.has_capacity(ordered[i]):
+          return (None, ordered[i])
+      else:
+        # no comparisons are possible: put it in the middle
+        return (mid, None)
+      if order > 0:
+        hi = i
+      else:
+        lo = i + 1
+    return (lo, None)
+
+  def _replay(self, state):
+    '''Rebuilds the order from the judgements.  Returns (ordered docs, number
+    of docs still to insert, doc being inserted, doc to compare it with),
+    where the last two are None once the order is complete.'''
+    ordered = []
+    docs = [d for d in state.doc_ids if d not in state.bad_dup_documents()]
+    for (i, doc) in enumerate(docs):
+      (position, other) = self._search(state, ordered, doc)
+      if other is not None:
+        return (ordered, len(docs) - i, doc, other)
+      self._insert(ordered, doc, position)
+    return (ordered, 0, None, None)
+
+  def _comparisons_needed(self, n_ordered):
+    '''The number of comparisons to insert a document into n_ordered'''
+    return int(ceil(log(n_ordered + 1, 2)))
+
+  def _remaining_comparisons(self, state):
+    (ordered, n_remaining, doc, other) = self._replay(state)
+    n_ordered = len(ordered)
+    return sum(self._comparisons_needed(n_ordered + i) \
+               for i in xrange(n_remaining))
+
+  def calculate_pending_assessments(self, assignment, state = None):
+    if assignment.complete: return 0
+    if state is None:
+      state = AssignmentState(assignment)
+    assessments_done = \
+              state.num_assessments_complete(self.assume_transitivity)
+    if assessments_done >= self.max_assessments_per_query:
+      # this assignment should be marked complete
+      assignment.complete = True
+      assignment.save()
+      return 0
+    return max(0, min(self._remaining_comparisons(state),
+                      self.max_assessments_per_query - assessments_done))
+
+  def next_pair(self, assignment, state = None):
+    if state is None:
+      state = AssignmentState(assignment)
+    if self.assignment_complete(assignment, state): return None
+    (ordered, n_remaining, doc, other) = self._replay(state)
+    if doc is None:
+      return None
+
+    # keep the document being inserted where it was last presented
+    fixed = False
+    keep_left = True
+    if state.latest is not None:
+      (source_doc, target_doc, relation_type, source_presented_left) = \
+          state.latest
+      if doc == source_doc:
+        (fixed, keep_left) = (True, source_presented_left)
+      elif doc == target_doc:
+        (fixed, keep_left) = (True, not source_presented_left)
+    if keep_left:
+      return state.presentation(doc, other, fixed, False)
+    else:
+      return state.presentation(other, doc, False, fixed)
+
+class TopKStrategy(BinaryInsertionStrategy):
+  '''A binary-insertion strategy that only orders the k most preferred
+  documents.  Once k documents are ordered, each further document is first
+  compared with the k-th, and only inserted (and so compared with the
+  others) if it beats it; otherwise it's dropped.  The assignment is done
+  once every document has been through this tournament, so pending
+  assessments are counted against that, rather than a full ordering.'''
+  def __init__(self, max_assessments_per_query, k = None):
+    BinaryInsertionStrategy.__init__(self, max_assessments_per_query)
+    if k is None:
+      k = app_settings.TOP_K
+    self.k = k
+
+  def cache_name(self):
+    return '%s-%d' % (BinaryInsertionStrategy.cache_name(self), self.k)
+
+  def _insert(self, ordered, doc, position):
+    if position < self.k:
+      ordered.insert(position, doc)
+      del ordered[self.k:]
+
+  def _search(self, state, ordered, doc, lo = 0, hi = None):
+    if len(ordered) < self.k:
+      return BinaryInsertionStrategy._search(self, state, ordered, doc)
+    last = ordered[self.k - 1]
+    order = state.order(doc, last)
+    if order is None:
+      if state.has_capacity(doc) and state.has_capacity(last):
+        return (None, last)
+      # the k-th can't be compared with: search the rest for a place
+      return BinaryInsertionStrategy._search(self, state, ordered, doc)
+    if order <= 0:
+      return (self.k, None)
+    return BinaryInsertionStrategy._search(self, state, ordered, doc,
+                                           0, self.k - 1)
+
+  def _comparisons_needed(self, n_ordered):
+    # an estimate once the top k are full: most documents are only compared
+    # with the k-th
+    if n_ordered < self.k:
+      return BinaryInsertionStrategy._comparisons_needed(self, n_ordered)
+    return 1
+
+  def _remaining_comparisons(self, state):
+    (ordered, n_remaining, doc, other) = self._replay(state)
+    return sum(self._comparisons_needed(min(len(ordered) + i, self.k)) \
+               for i in xrange(n_remaining))
+
+# the strategies that can be chosen with the SELECTION_STRATEGY setting
+STRATEGIES = { 'bubble_sort': BubbleSortStrategy,
+               'binary_insertion': BinaryInsertionStrategy,
+               'top_k': TopKStrategy }
+
+def get_strategy():
+  '''The selection strategy configured in app_settings'''
+  try:
+    strategy_class = STRATEGIES[app_settings.SELECTION_STRATEGY]
+  except KeyError:
+    raise ImproperlyConfigured('SELECTION_STRATEGY must be one of: %s' % \
+                               ', '.join(sorted(STRATEGIES)))
+  strategy = strategy_class(app_settings.ASSESSMENTS_PER_QUERY)
+  strategy.assume_transitivity = app_settings.ASSUME_TRANSITIVITY
+  return strategy
@@ -0,0 +1,8 @@
+-- Composite indexes for AssessedDocumentRelation, created by syncdb along
+-- with the table.  To upgrade an existing table, which also needs the
+-- assignment_id column, run sql/upgrade/assesseddocumentrelation_assignment.sql
+-- by hand instead.
+CREATE INDEX assessment_assesseddocumentrelation_assignment_created ON assessment_assesseddocumentrelation (assignment_id, created_date);
+CREATE INDEX assessment_assesseddocumentrelation_assignment_type ON assessment_assesseddocumentrelation (assignment_id, relation_type);
+CREATE INDEX assessment_assesseddocumentrelation_source_type ON assessment_assesseddocumentrelation (source_doc_id, relation_type);
+CREATE INDEX assessment_assesseddocumentrelation_target_type ON assessment_assesseddocumentrelation (target_doc_id, relation_type);
@@ -0,0 +1,10 @@
+-- Adds the judgement counters to an AssessedDocument table created before
+-- they existed.  syncdb creates them for new tables, so this is only run by
+-- hand when upgrading, followed by "manage.py rebuild_document_counters" to
+-- fill them in from the existing judgements.
+ALTER TABLE assessment_assesseddocument ADD COLUMN times_assessed integer NOT NULL DEFAULT 0;
+ALTER TABLE assessment_assesseddocument ADD COLUMN is_bad boolean NOT NULL DEFAULT FALSE;
+ALTER TABLE assessment_assesseddocument ADD COLUMN is_dup boolean NOT NULL DEFAULT FALSE;
+CREATE INDEX assessment_assesseddocument_times_assessed ON assessment_assesseddocument (times_assessed);
+CREATE INDEX assessment_assesseddocument_is_bad ON assessment_assesseddocument (is_bad);
+CREATE INDEX assessment_assesseddocument_is_dup ON assessment_assesseddocument (is_dup);
@@ -0,0 +1,12 @@
+-- Adds the denormalized assignment to an AssessedDocumentRelation table
+-- created before it existed, with the indexes syncdb creates for new tables
+-- (the assignment_id foreign key's, and the composite ones from
+-- sql/assesseddocumentrelation.sql).  This is only run by hand when
+-- upgrading, followed by "manage.py backfill_relation_assignments" to fill
+-- the column in from the relations' source documents.
+ALTER TABLE assessment_assesseddocumentrelation ADD COLUMN assignment_id integer NULL REFERENCES assessment_assignment (id);
+CREATE INDEX assessment_assesseddocumentrelation_assignment_id ON assessment_assesseddocumentrelation (assignment_id);
+CREATE INDEX assessment_assesseddocumentrelation_assignment_created ON assessment_assesseddocumentrelation (assignment_id, created_date);
+CREATE INDEX assessment_assesseddocumentrelation_assignment_type ON assessment_assesseddocumentrelation (assignment_id, relation_type);
+CREATE INDEX assessment_assesseddocumentrelation_source_type ON assessment_assesseddocumentrelation (source_doc_id, relation_type);
+CREATE INDEX assessment_assesseddocumentrelation_target_type ON assessment_assesseddocumentrelation (target_doc_id, relation_type);
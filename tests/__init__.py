@@ -0,0 +1,19 @@
+# Tests for the assessment app, run with "manage.py test assessment".  Each
+# module covers one part of the app, and they're all imported here for
+# Django's test runner.
+from assessment.tests.strategies import *
+from assessment.tests.transitivity import *
+from assessment.tests.data import *
+from assessment.tests.models import *
+from assessment.tests.views import *
+from assessment.tests.caching import *
+from assessment.tests.precompute import *
+from assessment.tests.ranking import *
+from assessment.tests.benchmark import *
+from assessment.tests.instrumentation import *
+from assessment.tests.graph import *
+from assessment.tests.claims import *
+from assessment.tests.api import *
+from assessment.tests.docproxy import *
+from assessment.tests.agreement import *
+from assessment.tests.routers import *
@@ -0,0 +1,119 @@
+from assessment.tests.base import AssessmentTestCase
+from assessment.agreement import Judgements, Agreement, CATEGORIES, \
+                                 load_judgements, analyze
+from django.core.urlresolvers import reverse
+import numpy as np
+
+def _judgements(queries, assessors, doc_a, doc_b, categories):
+  return Judgements(*[np.array(a, dtype=np.int64) for a in \
+                      (queries, assessors, doc_a, doc_b, categories)])
+
+class AgreementTest(AssessmentTestCase):
+  def two_raters(self):
+    '''Two assessors judging four items: [0, 0, 1, 2] and [0, 1, 1, 2]'''
+    doc_a = np.repeat(np.arange(4), 2)
+    return _judgements([1] * 8, [10, 20] * 4, doc_a, doc_a + 100,
+                       [0, 0, 0, 1, 1, 1, 2, 2])
+
+  def test_statistics(self):
+    agreement = Agreement(self.two_raters())
+    self.assertEqual(agreement.query_ids.tolist(), [1])
+    self.assertEqual(agreement.query_items.tolist(), [4])
+    self.assertAlmostEqual(agreement.query_agreement[0], 0.75)
+    # observed .75, expected from the pooled proportions (3/8, 3/8, 2/8)
+    expected = 22 / 64.0
+    self.assertAlmostEqual(agreement.fleiss_kappa[0],
+                           (0.75 - expected) / (1 - expected))
+    self.assertEqual(agreement.assessor_ids.tolist(), [10, 20])
+    self.assertEqual(agreement.assessor_judgements.tolist(), [4, 4])
+    self.assertEqual(agreement.assessor_agreement.tolist(), [0.75, 0.75])
+    self.assertEqual((agreement.pair_a.tolist(), agreement.pair_b.tolist(),
+                      agreement.pair_items.tolist()), ([10], [20], [4]))
+    self.assertAlmostEqual(agreement.pair_agreement[0], 0.75)
+    # expected from each assessor's own proportions
+    expected = 0.5 * 0.25 + 0.25 * 0.5 + 0.25 * 0.25
+    self.assertAlmostEqual(agreement.cohen_kappa[0],
+                           (0.75 - expected) / (1 - expected))
+    self.assertEqual(agreement.conflict_doc_a.tolist(), [1])
+    self.assertEqual(agreement.conflict_counts.tolist(), [[1, 1, 0, 0, 0]])
+
+  def test_keeps_each_assessors_last_judgement(self):
+    judgements = _judgements([1, 1, 1], [10, 10, 20], [1, 1, 1], [2, 2, 2],
+                             [0, 1, 1])
+    self.assertEqual(len(judgements), 2)
+    agreement = Agreement(judgements)
+    self.assertEqual(agreement.query_agreement.tolist(), [1.0])
+    self.assertEqual(len(agreement.conflict_queries), 0)
+
+  def test_items_judged_once_dont_count(self):
+    agreement = Agreement(_judgements([1, 1, 1, 2], [10, 20, 10, 10],
+                                      [1, 1, 3, 1], [2, 2, 4, 2],
+                                      [0, 1, 2, 0]))
+    self.assertEqual(agreement.query_ids.tolist(), [1])
+    self.assertEqual(agreement.query_items.tolist(), [1])
+    self.assertEqual(agreement.assessor_judgements.tolist(), [1, 1])
+
+  def test_three_raters(self):
+    agreement = Agreement(_judgements([1] * 3, [10, 20, 30], [1] * 3,
+                                      [2] * 3, [0, 0, 2]))
+    self.assertAlmostEqual(agreement.query_agreement[0], 1 / 3.0)
+    self.assertEqual(agreement.assessor_agreement.tolist(), [0.5, 0.5, 0.0])
+    self.assertEqual(zip(agreement.pair_a.tolist(), agreement.pair_b.tolist(),
+                         agreement.pair_agreement.tolist()),
+                     [(10, 20, 1.0), (10, 30, 0.0), (20, 30, 0.0)])
+
+  def test_empty(self):
+    agreement = Agreement(_judgements([], [], [], [], []))
+    self.assertEqual(len(agreement.query_ids), 0)
+    self.assertEqual(len(agreement.pair_a), 0)
+
+class LoadJudgementsTest(AssessmentTestCase):
+  def setUp(self):
+    super(LoadJudgementsTest, self).setUp()
+    query = self.make_query(n_docs = 3)
+    self.first = self.make_assignment(query = query)
+    self.second = self.make_assignment(query = query,
+                                       user = self.make_user('second'))
+
+  def test_orientation(self):
+    (d0, d1, d2) = self.docs(self.first)
+    (e0, e1, e2) = self.docs(self.second)
+    # doc0 has the lower Document id
+    self.judge(d0, d1)
+    self.judge(e1, e0)
+    self.judge(d2, d1, 'B')
+    self.judge(e1, e2, 'B')
+    self.judge(e0, e2, 'D')
+    j = load_judgements()
+    categories = dict(((a, b, u), CATEGORIES[c]) for (a, b, u, c) in \
+        zip(j.doc_a, j.doc_b, j.assessors, j.categories))
+    (doc0, doc1, doc2) = [d.document_id for d in (d0, d1, d2)]
+    (first, second) = (self.first.assessor_id, self.second.assessor_id)
+    self.assertEqual(categories, {
+        (doc0, doc1, first): 'a preferred',
+        (doc0, doc1, second): 'b preferred',
+        (doc1, doc2, first): 'b bad',
+        (doc1, doc2, second): 'a bad',
+        (doc0, doc2, second): 'duplicates' })
+    self.assertEqual(len(load_judgements([self.first.query_id + 1])), 0)
+
+  def test_report(self):
+    (d0, d1, _) = self.docs(self.first)
+    (e0, e1, _) = self.docs(self.second)
+    self.judge(d0, d1)
+    self.judge(e1, e0)
+    report = analyze().report()
+    self.assertEqual(report['queries'], [('q1', 1, 0.0, report['queries'][0][3])])
+    self.assertEqual(report['pairs'][0][:4], ('assessor', 'second', 1, 0.0))
+    self.assertEqual(report['conflicts'],
+                     [('q1', 'q1-doc0', 'q1-doc1', [1, 1, 0, 0, 0])])
+
+  def test_view(self):
+    (d0, d1, _) = self.docs(self.first)
+    self.judge(d0, d1)
+    admin = self.make_user('admin')
+    admin.is_superuser = True
+    admin.save()
+    self.client.login(username = 'admin', password = 'secret')
+    response = self.client.get(reverse('agreement_report'))
+    self.assertEqual(response.status_code, 200)
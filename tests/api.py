@@ -0,0 +1,142 @@
+from assessment.tests.base import AssessmentTestCase, overridden
+from assessment.models import AssessedDocumentRelation
+from assessment.selection_strategies import get_strategy
+from django.core.urlresolvers import reverse
+from django.utils import simplejson
+
+class PairQueueApiTest(AssessmentTestCase):
+  app_settings = { 'CLIENT_PAIR_QUEUE': 3 }
+
+  def setUp(self):
+    super(PairQueueApiTest, self).setUp()
+    self.assignment = self.make_assignment(n_docs = 5)
+    self.d = self.docs(self.assignment)
+    self.client.login(username = 'assessor', password = 'secret')
+
+  def get_pairs(self, n = None):
+    url = reverse('api_next_pairs', args=[self.assignment.id])
+    if n is not None:
+      url += '?n=%s' % n
+    return self.client.get(url)
+
+  def post(self, data):
+    return self.client.post(reverse('api_judgements',
+                                    args=[self.assignment.id]),
+                            simplejson.dumps(data),
+                            content_type = 'application/json')
+
+  def test_pairs(self):
+    response = self.get_pairs()
+    self.assertEqual(response.status_code, 200)
+    data = simplejson.loads(response.content)
+    self.assertEqual(data['pending'], self.assignment.pending_assessments())
+    self.assertEqual(len(data['pairs']), 3)
+    first = data['pairs'][0]
+    self.assertEqual((first['left']['id'], first['right']['id']),
+                     (self.d[0].id, self.d[1].id))
+    self.assertEqual(first['left']['document'], 'q1-doc0')
+    self.assertEqual(first['url'], reverse('new_assessment',
+        args=(self.assignment.id, self.d[0].id, '', self.d[1].id, '')))
+    # each pair after the first assumes the one before it goes the way its
+    # assumed preference says
+    self.assertEqual(first['assumed'], 'L')
+    self.assertEqual(data['pairs'][1]['left']['id'], self.d[0].id)
+    self.assertTrue(data['pairs'][1]['left']['fixed'])
+
+  def test_pairs_follow_the_saved_judgements(self):
+    first = simplejson.loads(self.get_pairs().content)['pairs']
+    # judged against the assumed preference, so the look-ahead is stale
+    self.post({ 'judgements': [{ 'left_doc': first[0]['left']['id'],
+        'right_doc': first[0]['right']['id'], 'preference': 'R' }] })
+    pairs = simplejson.loads(self.get_pairs().content)['pairs']
+    next_pair = get_strategy().next_pair(self.reload(self.assignment))
+    self.assertEqual((pairs[0]['left']['id'], pairs[0]['right']['id']),
+                     tuple(d.id for d in next_pair.docs))
+    self.assertNotEqual(pairs[0]['url'], first[1]['url'])
+
+  def test_pairs_limited_to_the_queue_size(self):
+    self.assertEqual(len(simplejson.loads(self.get_pairs(10).content) \
+                                    ['pairs']), 3)
+    self.assertEqual(len(simplejson.loads(self.get_pairs(1).content) \
+                                    ['pairs']), 1)
+    self.assertEqual(self.get_pairs('x').status_code, 400)
+
+  def test_batch(self):
+    d = self.d
+    response = self.post({ 'judgements': [
+        { 'left_doc': d[0].id, 'right_doc': d[1].id, 'preference': 'L' },
+        { 'left_doc': d[2].id, 'right_doc': d[0].id, 'preference': 'R' },
+        { 'left_doc': d[3].id, 'right_doc': d[4].id, 'preference': 'RB' } ],
+      'n': 2 })
+    self.assertEqual(response.status_code, 200)
+    data = simplejson.loads(response.content)
+    self.assertEqual(len(data['pairs']), 2)
+    # the progress was refreshed after the batch
+    self.assertEqual(data['pending'], get_strategy() \
+        .calculate_pending_assessments(self.reload(self.assignment)))
+    relations = set(AssessedDocumentRelation.objects.values_list(
+        'source_doc', 'target_doc', 'relation_type', 'source_presented_left'))
+    self.assertEqual(relations, set([(d[0].id, d[1].id, 'P', True),
+                                     (d[0].id, d[2].id, 'P', False),
+                                     (d[4].id, d[3].id, 'B', False)]))
+
+  def test_updates_an_existing_judgement(self):
+    self.judge(self.d[0], self.d[1])
+    response = self.post({ 'judgements': [{ 'left_doc': self.d[1].id,
+        'right_doc': self.d[0].id, 'preference': 'L' }] })
+    self.assertEqual(response.status_code, 200)
+    relation = AssessedDocumentRelation.objects.get()
+    self.assertEqual((relation.source_doc, relation.target_doc,
+                      relation.source_presented_left),
+                     (self.d[1], self.d[0], True))
+
+  def test_invalid(self):
+    d = self.d
+    other = self.docs(self.make_assignment(n_docs = 2, query = \
+        self.make_query('q2', 2), user = self.make_user('other')))
+    for judgements in (
+        [{ 'left_doc': d[0].id, 'right_doc': d[1].id, 'preference': 'X' }],
+        [{ 'left_doc': d[0].id, 'right_doc': d[0].id, 'preference': 'L' }],
+        [{ 'left_doc': d[0].id, 'right_doc': other[0].id,
+           'preference': 'L' }],
+        [{ 'left_doc': d[0].id, 'preference': 'L' }],
+        'judgements'):
+      # a bad judgement anywhere in the batch saves none of it
+      batch = [{ 'left_doc': d[2].id, 'right_doc': d[3].id,
+                 'preference': 'L' }]
+      if isinstance(judgements, list):
+        judgements = batch + judgements
+      self.assertEqual(self.post({ 'judgements': judgements }).status_code,
+                       400)
+    self.assertEqual(AssessedDocumentRelation.objects.count(), 0)
+
+  def test_must_post(self):
+    response = self.client.get(reverse('api_judgements',
+                                       args=[self.assignment.id]))
+    self.assertEqual(response.status_code, 405)
+
+  def test_information_need_first(self):
+    self.assignment.description = ''
+    self.assignment.save()
+    response = self.post({ 'judgements': [{ 'left_doc': self.d[0].id,
+        'right_doc': self.d[1].id, 'preference': 'L' }] })
+    self.assertEqual(response.status_code, 403)
+    self.assertEqual(AssessedDocumentRelation.objects.count(), 0)
+    with overridden(COLLECT_INFORMATION_NEED = False):
+      response = self.post({ 'judgements': [] })
+    self.assertEqual(response.status_code, 200)
+
+  def test_someone_elses_assignment(self):
+    self.make_user('other')
+    self.client.login(username = 'other', password = 'secret')
+    self.assertEqual(self.get_pairs().status_code, 403)
+    self.assertEqual(self.post({ 'judgements': [] }).status_code, 403)
+
+  def test_page_queues_pairs(self):
+    response = self.client.get(reverse('new_assessment',
+        args=(self.assignment.id, self.d[0].id, '', self.d[1].id, '')))
+    self.assertContains(response, 'var pairQueue')
+    with overridden(CLIENT_PAIR_QUEUE = 0):
+      response = self.client.get(reverse('new_assessment',
+          args=(self.assignment.id, self.d[0].id, '', self.d[1].id, '')))
+    self.assertNotContains(response, 'var pairQueue')
@@ -0,0 +1,100 @@
+# Fixtures shared by the assessment tests.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from assessment.models import Query, Document, Assignment, AssessedDocument, \
+                              AssessedDocumentRelation
+from assessment.caching import local_cache
+from assessment import app_settings
+from contextlib import contextmanager
+
+@contextmanager
+def overridden(**values):
+  '''Overrides app_settings values for the enclosed code'''
+  saved = dict((name, getattr(app_settings, name)) for name in values)
+  for (name, value) in values.items():
+    setattr(app_settings, name, value)
+  try:
+    yield
+  finally:
+    for (name, value) in saved.items():
+      setattr(app_settings, name, value)
+
+class FixturesMixin(object):
+  '''Builds queries, assignments and judgements.  The cache is cleared
+  before each test, since the database ids it's keyed on are reused.'''
+  # app_settings overridden for every test of the class
+  app_settings = {}
+
+  def setUp(self):
+    cache.clear()
+    local_cache.clear()
+    self._overridden = overridden(**self.app_settings)
+    self._overridden.__enter__()
+
+  def tearDown(self):
+    self._overridden.__exit__(None, None, None)
+
+  def make_user(self, username = 'assessor'):
+    user = User.objects.create_user(username, '%s@example.com' % username,
+                                    'secret')
+    return user
+
+  def make_query(self, qid = 'q1', n_docs = 5, remaining_assignments = 1):
+    '''A query with n_docs documents, named <qid>-doc<i>, with descending
+    scores'''
+    query = Query(qid = qid, text = 'query %s' % qid,
+                  remaining_assignments = remaining_assignments)
+    query.save()
+    for i in xrange(n_docs):
+      Document(query = query, document = '%s-doc%d' % (qid, i),
+               score = float(n_docs - i)).save()
+    return query
+
+  def make_assignment(self, n_docs = 5, user = None, query = None,
+                      description = 'information need'):
+    '''An assignment, with its AssessedDocuments'''
+    if user is None:
+      user = self.make_user()
+    if query is None:
+      query = self.make_query(n_docs = n_docs)
+    assignment = Assignment(assessor = user, query = query,
+                            description = description)
+    assignment.save()
+    assignment.materialize_documents()
+    return assignment
+
+  def docs(self, assignment):
+    '''The assignment's AssessedDocuments, by descending score'''
+    return list(assignment.documents.select_related('document') \
+                                    .order_by('-document__score'))
+
+  def judge(self, source, target, relation_type = 'P',
+            source_presented_left = True):
+    relation = AssessedDocumentRelation(source_doc = source,
+        target_doc = target, relation_type = relation_type,
+        source_presented_left = source_presented_left)
+    relation.save()
+    return relation
+
+  def reload(self, obj):
+    return obj.__class__.objects.get(pk = obj.pk)
+
+class AssessmentTestCase(FixturesMixin, TestCase):
+  def setUp(self):
+    TestCase.setUp(self)
+    FixturesMixin.setUp(self)
+
+  def tearDown(self):
+    FixturesMixin.tearDown(self)
+    TestCase.tearDown(self)
+
+class AssessmentTransactionTestCase(FixturesMixin, TransactionTestCase):
+  '''For tests that need real commits and rollbacks'''
+  def setUp(self):
+    TransactionTestCase.setUp(self)
+    FixturesMixin.setUp(self)
+
+  def tearDown(self):
+    FixturesMixin.tearDown(self)
+    TransactionTestCase.tearDown(self)
@@ -0,0 +1,48 @@
+from assessment.tests.base import AssessmentTestCase, overridden
+from assessment import benchmark
+
+class BenchmarkTest(AssessmentTestCase):
+  def test_scale(self):
+    scale = benchmark.Scale.parse('10x50x3', 20)
+    self.assertEqual((scale.n_queries, scale.n_docs, scale.n_assessors,
+                      scale.judgements), (10, 50, 3, 20))
+    self.assertEqual(str(scale), '10x50x3')
+    self.assertRaises(ValueError, benchmark.Scale.parse, '10x50', 20)
+
+  def test_percentile(self):
+    values = range(1, 11)
+    self.assertEqual(benchmark.percentile(values, 50), 5)
+    self.assertEqual(benchmark.percentile(values, 90), 9)
+    self.assertEqual(benchmark.percentile(values, 99), 10)
+    self.assertEqual(benchmark.percentile(values, 0), 1)
+    self.assertEqual(benchmark.percentile([], 50), None)
+
+  def test_run_scale(self):
+    summary = benchmark.run_scale(benchmark.Scale(2, 6, 2, 3), repeat = 1)
+    self.assertEqual(set(summary), set(benchmark.VIEWS))
+    for view in benchmark.VIEWS:
+      self.assertEqual(summary[view]['n'], 1)
+      self.assertTrue(summary[view]['queries']['mean'] > 0)
+
+  def test_run_scale_direct_pair_rendering(self):
+    with overridden(DIRECT_PAIR_RENDERING = True):
+      summary = benchmark.run_scale(benchmark.Scale(2, 6, 2, 3), repeat = 1)
+    self.assertEqual(set(summary), set(benchmark.VIEWS))
+    self.assertEqual(summary['new_assessment_post']['n'], 1)
+
+  def test_private_cache(self):
+    benchmark.cache.set('benchmark-test', 1)
+    with benchmark._private_cache():
+      self.assertEqual(benchmark.cache.get('benchmark-test'), None)
+      benchmark.cache.set('benchmark-test', 2)
+    self.assertEqual(benchmark.cache.get('benchmark-test'), 1)
+
+  def test_compare(self):
+    views = lambda p50, queries: { 'admin_dashboard': {
+        'latency_ms': { 'p50': p50 }, 'queries': { 'mean': queries } } }
+    old = { 'results': [ { 'scale': '1x2x3', 'views': views(10.0, 4.0) },
+                         { 'scale': '4x5x6', 'views': views(1.0, 1.0) } ] }
+    new = { 'results': [ { 'scale': '1x2x3', 'views': views(5.0, 2.0) },
+                         { 'scale': '7x8x9', 'views': views(1.0, 1.0) } ] }
+    self.assertEqual(list(benchmark.compare(old, new)),
+                     [('1x2x3', 'admin_dashboard', 10.0, 5.0, 4.0, 2.0)])
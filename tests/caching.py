@@ -0,0 +1,161 @@
+from assessment.tests.base import AssessmentTestCase
+from assessment import caching
+from assessment.caching import get_version, get_versions, bump_version, \
+                               commit_on_success, LocalCache, local_cache
+from assessment.models import Assignment, AssessedDocumentRelation
+from assessment.selection_strategies import AssignmentState, \
+                                            BubbleSortStrategy
+
+class CountingStrategy(BubbleSortStrategy):
+  '''Counts the pending assessments it actually calculates'''
+  calculated = 0
+
+  def calculate_pending_assessments(self, assignment, state = None):
+    self.calculated += 1
+    return super(CountingStrategy, self) \
+             .calculate_pending_assessments(assignment, state)
+
+class VersionTest(AssessmentTestCase):
+  def test_versions(self):
+    version = get_version('thing', 1)
+    self.assertEqual(get_version('thing', 1), version)
+    self.assertEqual(get_versions('thing', [1, 2])[1], version)
+    bump_version('thing', 1)
+    self.assertNotEqual(get_version('thing', 1), version)
+
+  def test_bumped_by_signals(self):
+    assignment = self.make_assignment(n_docs = 3)
+    version = get_version('assignment', assignment.id)
+    d = self.docs(assignment)
+    relation = self.judge(d[0], d[1])
+    judged = get_version('assignment', assignment.id)
+    self.assertNotEqual(judged, version)
+    relation.delete()
+    self.assertNotEqual(get_version('assignment', assignment.id), judged)
+
+  def test_bumped_again_after_commit(self):
+    version = get_version('thing', 1)
+    with commit_on_success():
+      bump_version('thing', 1)
+      # another request may cache what it reads before the commit under this
+      # version
+      uncommitted = get_version('thing', 1)
+      self.assertNotEqual(uncommitted, version)
+    self.assertNotEqual(get_version('thing', 1), uncommitted)
+
+  def test_bumped_again_after_rollback(self):
+    try:
+      with commit_on_success():
+        with commit_on_success():
+          bump_version('thing', 1)
+        uncommitted = get_version('thing', 1)
+        raise ValueError
+    except ValueError:
+      pass
+    self.assertNotEqual(get_version('thing', 1), uncommitted)
+    # nothing is left to bump after the outermost block
+    with commit_on_success():
+      pass
+    self.assertEqual(caching._pending.bumps, None)
+
+class PendingAssessmentsCacheTest(AssessmentTestCase):
+  def test_cached_until_judged(self):
+    assignment = self.make_assignment(n_docs = 4)
+    strategy = CountingStrategy(25)
+    pending = strategy.pending_assessments(assignment)
+    self.assertEqual(strategy.pending_assessments(assignment), pending)
+    self.assertEqual(strategy.calculated, 1)
+
+    d = self.docs(assignment)
+    self.judge(d[0], d[1])
+    self.assertEqual(strategy.pending_assessments(assignment), pending - 1)
+    self.assertEqual(strategy.calculated, 2)
+
+  def test_cached_per_strategy(self):
+    assignment = self.make_assignment(n_docs = 4)
+    CountingStrategy(25).pending_assessments(assignment)
+    other = CountingStrategy(2)
+    self.assertEqual(other.pending_assessments(assignment), 2)
+    self.assertEqual(other.calculated, 1)
+
+  def test_look_ahead_state_not_cached(self):
+    assignment = self.make_assignment(n_docs = 4)
+    strategy = CountingStrategy(25)
+    state = AssignmentState(assignment)
+    pair = strategy.next_pair(assignment, state)
+    state.assume_judged(pair)
+    assumed = strategy.pending_assessments(assignment, state)
+    pending = strategy.pending_assessments(assignment)
+    self.assertEqual(assumed, pending - 1)
+    # the hypothetical count was neither read from nor written to the cache
+    self.assertEqual(strategy.pending_assessments(assignment, state), assumed)
+    self.assertEqual(strategy.pending_assessments(assignment), pending)
+
+  def test_complete(self):
+    assignment = self.make_assignment(n_docs = 4)
+    assignment.complete = True
+    assignment.save()
+    strategy = CountingStrategy(25)
+    self.assertEqual(strategy.pending_assessments(assignment), 0)
+    self.assertEqual(strategy.calculated, 0)
+
+class LocalCacheTest(AssessmentTestCase):
+  def test_least_recently_used_evicted(self):
+    c = LocalCache(2)
+    c.set('a', (1,))
+    c.set('b', (2,))
+    self.assertEqual(c.get('a'), (1,))
+    c.set('c', (3,))
+    self.assertEqual(c.get('b'), None)
+    self.assertEqual(c.get('a'), (1,))
+    self.assertEqual(c.get('c'), (3,))
+
+class MemoizeTest(AssessmentTestCase):
+  def setUp(self):
+    super(MemoizeTest, self).setUp()
+    self.shared_cache = caching._shared_cache
+    self.get_version = caching.get_version
+
+  def tearDown(self):
+    caching._shared_cache = self.shared_cache
+    caching.get_version = self.get_version
+    super(MemoizeTest, self).tearDown()
+
+  def test_invalidated_by_judgement(self):
+    assignment = self.make_assignment(n_docs = 3)
+    d = self.docs(assignment)
+    self.assertEqual(assignment.bad_documents(), set())
+    self.judge(d[0], d[1], 'B')
+    self.assertEqual(assignment.bad_documents(), set([d[0].id]))
+
+  def test_invalidate(self):
+    assignment = self.make_assignment(n_docs = 3)
+    d = self.docs(assignment)
+    relation = self.judge(d[0], d[1], 'P')
+    self.assertEqual(assignment.dup_documents(), set())
+    # changed without any signals, so the memoized value is stale
+    AssessedDocumentRelation.objects.filter(id = relation.id) \
+                                    .update(relation_type = 'D')
+    self.assertEqual(assignment.dup_documents(), set())
+    Assignment.dup_documents.invalidate(assignment)
+    self.assertEqual(assignment.dup_documents(), set([d[1].id]))
+
+  def test_no_local_tier_without_shared_cache(self):
+    assignment = self.make_assignment(n_docs = 3)
+    assignment.bad_documents()
+    self.assertEqual(len(local_cache.items), 0)
+
+  def test_local_tier_with_shared_cache(self):
+    caching._shared_cache = lambda: True
+    assignment = self.make_assignment(n_docs = 3)
+    # creating the assignment's progress memoizes other values
+    local_cache.clear()
+    assignment.bad_documents()
+    self.assertEqual(len(local_cache.items), 1)
+
+  def test_no_local_tier_without_version(self):
+    caching._shared_cache = lambda: True
+    caching.get_version = lambda namespace, id: None
+    assignment = self.make_assignment(n_docs = 3)
+    self.assertEqual(assignment.bad_documents(), set())
+    self.assertEqual(len(local_cache.items), 0)
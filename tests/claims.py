@@ -0,0 +1,162 @@
+from assessment.tests.base import AssessmentTestCase, \
+                                  AssessmentTransactionTestCase, overridden
+from assessment.models import Query, Assignment
+from assessment.claim_pool import ClaimPool
+from assessment.util import bulk_insert, bulk_save_queries
+from assessment import claim_pool
+from django.core.urlresolvers import reverse
+from django.db import IntegrityError
+
+class ClaimTest(AssessmentTransactionTestCase):
+  def test_claim(self):
+    query = self.make_query(remaining_assignments = 2)
+    assignment = query.claim(self.make_user('first'))
+    self.assertEqual((assignment.query, assignment.assessor.username),
+                     (query, 'first'))
+    self.assertEqual(self.reload(query).remaining_assignments, 1)
+    self.assertNotEqual(query.claim(self.make_user('second')), None)
+    self.assertEqual(query.claim(self.make_user('third')), None)
+    self.assertEqual(self.reload(query).remaining_assignments, 0)
+    self.assertEqual(Assignment.objects.count(), 2)
+
+  def test_already_assigned(self):
+    query = self.make_query(remaining_assignments = 2)
+    user = self.make_user()
+    query.claim(user)
+    self.assertRaises(IntegrityError, query.claim, user)
+    # the claim was rolled back with the assignment
+    self.assertEqual(self.reload(query).remaining_assignments, 1)
+    self.assertEqual(Assignment.objects.count(), 1)
+
+  def test_abandon(self):
+    query = self.make_query(remaining_assignments = 1)
+    assignment = query.claim(self.make_user())
+    self.assertTrue(assignment.abandon())
+    self.assertTrue(self.reload(assignment).abandoned)
+    self.assertEqual(self.reload(query).remaining_assignments, 1)
+    # a concurrent request only gives it back once
+    self.assertFalse(Assignment.objects.get(id = assignment.id).abandon())
+    self.assertEqual(self.reload(query).remaining_assignments, 1)
+
+  def test_claim_view_when_already_assigned(self):
+    query = self.make_query(remaining_assignments = 2)
+    assignment = query.claim(self.make_user())
+    self.client.login(username = 'assessor', password = 'secret')
+    response = self.client.post(reverse('select_query_confirm',
+                                        args=[query.id]))
+    self.assertTrue(response['Location'].endswith(
+        reverse('next_assessment', args=[assignment.id])))
+    self.assertEqual(self.reload(query).remaining_assignments, 1)
+
+class ClaimPoolTest(AssessmentTestCase):
+  def test_swap_remove(self):
+    pool = ClaimPool()
+    pool.load([1, 2, 3, 4])
+    pool.remove(2)
+    # the last id moves into the removed one's place
+    self.assertEqual(pool.ids, [1, 4, 3])
+    self.assertEqual(pool.positions, {1: 0, 4: 1, 3: 2})
+    pool.remove(3)
+    pool.remove(5)
+    self.assertEqual((pool.ids, pool.positions), ([1, 4], {1: 0, 4: 1}))
+    pool.add(4)
+    pool.add(6)
+    self.assertEqual((pool.ids, pool.positions),
+                     ([1, 4, 6], {1: 0, 4: 1, 6: 2}))
+    self.assertEqual(len(pool), 3)
+
+  def test_choose(self):
+    pool = ClaimPool()
+    pool.load(range(10))
+    for _ in xrange(20):
+      chosen = pool.choose(3, exclude_ids = set([0, 1]))
+      self.assertEqual(len(set(chosen)), 3)
+      self.assertFalse(set(chosen) & set([0, 1]))
+
+  def test_choose_scans_when_mostly_excluded(self):
+    pool = ClaimPool()
+    pool.load(range(100))
+    # the random picks will almost always be excluded, so the pool is
+    # scanned for the rest
+    with overridden(CLAIM_POOL_ATTEMPTS = 1):
+      for _ in xrange(10):
+        chosen = pool.choose(2, exclude_ids = set(range(98)))
+        self.assertEqual(sorted(chosen), [98, 99])
+
+  def test_choose_from_empty(self):
+    self.assertEqual(ClaimPool().choose(3), [])
+
+class ClaimPoolQueriesTest(AssessmentTestCase):
+  def setUp(self):
+    super(ClaimPoolQueriesTest, self).setUp()
+    claim_pool.pool.load([])
+    claim_pool.pool.loaded = None
+
+  def test_offer(self):
+    taken = self.make_query('taken', n_docs = 1, remaining_assignments = 0)
+    mine = self.make_query('mine', n_docs = 1)
+    other = self.make_query('other', n_docs = 1)
+    for _ in xrange(10):
+      self.assertEqual(claim_pool.offer([mine.id]), other)
+    self.assertEqual(claim_pool.offer([mine.id, other.id]), None)
+
+  def test_offer_reloads_at_most_every_min_reload(self):
+    claim_pool.reload()
+    # saved without the signals, as if by another process
+    bulk_insert(Query, ('qid', 'text', 'remaining_assignments'),
+                [('q1', 'q1', 1)])
+    with overridden(CLAIM_POOL_MIN_RELOAD = 60):
+      self.assertEqual(claim_pool.offer(), None)
+    with overridden(CLAIM_POOL_MIN_RELOAD = 0):
+      self.assertEqual(claim_pool.offer().qid, 'q1')
+
+  def test_bulk_saved_queries_added(self):
+    claim_pool.reload()
+    bulk_save_queries([Query(qid = 'q1', text = 'q1')])
+    self.assertEqual([q.qid for q in claim_pool.candidates()], ['q1'])
+
+  def test_kept_up_to_date(self):
+    query = self.make_query(remaining_assignments = 1)
+    self.assertEqual(claim_pool.candidates(), [query])
+    assignment = claim_pool.claim(self.make_user(), query)
+    self.assertFalse(query.id in claim_pool.pool.positions)
+    claim_pool.abandon(assignment)
+    self.assertTrue(query.id in claim_pool.pool.positions)
+    query.delete()
+    self.assertFalse(query.id in claim_pool.pool.positions)
+
+  def test_taken_elsewhere(self):
+    query = self.make_query(remaining_assignments = 1)
+    claim_pool.reload()
+    # taken by another process, without this one's pool knowing
+    Query.objects.filter(id = query.id).update(remaining_assignments = 0)
+    self.assertEqual(claim_pool.candidates(), [])
+    self.assertEqual(len(claim_pool.pool), 0)
+    self.assertEqual(claim_pool.claim(self.make_user(), query), None)
+
+  def test_taken_query_redirects_to_another(self):
+    query = self.make_query('q1', remaining_assignments = 1)
+    other = self.make_query('q2', remaining_assignments = 1)
+    claim_pool.reload()
+    Query.objects.filter(id = query.id).update(remaining_assignments = 0)
+    self.make_user()
+    self.client.login(username = 'assessor', password = 'secret')
+    response = self.client.post(reverse('select_query_confirm',
+                                        args=[query.id]))
+    self.assertTrue(response['Location'].endswith(
+        reverse('select_query_confirm', args=[other.id]) + '?taken=1'))
+    self.assertEqual(Assignment.objects.count(), 0)
+    response = self.client.get(reverse('select_query_confirm',
+                                       args=[other.id]) + '?taken=1')
+    self.assertContains(response, 'just been taken')
+
+  def test_taken_query_redirects_to_dashboard(self):
+    query = self.make_query(remaining_assignments = 1)
+    claim_pool.reload()
+    Query.objects.filter(id = query.id).update(remaining_assignments = 0)
+    self.make_user()
+    self.client.login(username = 'assessor', password = 'secret')
+    response = self.client.post(reverse('select_query_confirm',
+                                        args=[query.id]))
+    self.assertTrue(response['Location'].endswith(
+        reverse('assessor_dashboard')))
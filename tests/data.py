@@ -0,0 +1,75 @@
+from assessment.tests.base import AssessmentTestCase
+from assessment.models import Query, Document
+from assessment.util import relations_csv, bulk_save_queries, \
+                            bulk_save_documents
+from django.core.urlresolvers import reverse
+import csv
+
+class RelationsCsvTest(AssessmentTestCase):
+  def test_chunks(self):
+    assignment = self.make_assignment(n_docs = 4)
+    d = self.docs(assignment)
+    self.judge(d[0], d[1], 'P')
+    self.judge(d[1], d[2], 'D')
+    self.judge(d[3], d[0], 'B')
+    chunks = list(relations_csv(chunk_size = 2))
+    # the header, then two chunks of rows
+    self.assertEqual(len(chunks), 3)
+    rows = list(csv.reader(''.join(chunks).splitlines()))
+    self.assertEqual(rows[0], ['qid', 'source_doc', 'target_doc',
+                               'relation_type', 'assessor', 'time'])
+    self.assertEqual([row[:5] for row in rows[1:]],
+                     [['q1', 'q1-doc0', 'q1-doc1', 'P', 'assessor'],
+                      ['q1', 'q1-doc1', 'q1-doc2', 'D', 'assessor'],
+                      ['q1', 'q1-doc3', 'q1-doc0', 'B', 'assessor']])
+
+  def test_no_relations(self):
+    self.assertEqual(len(list(relations_csv())), 1)
+
+  def test_download_view(self):
+    assignment = self.make_assignment(n_docs = 2)
+    d = self.docs(assignment)
+    self.judge(d[0], d[1])
+    admin = self.make_user('admin')
+    admin.is_superuser = True
+    admin.save()
+    self.client.login(username = 'admin', password = 'secret')
+    response = self.client.get(reverse('download_data'))
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response['Content-Type'], 'text/csv')
+    self.assertEqual(len(response.content.splitlines()), 2)
+
+class BulkSaveTest(AssessmentTestCase):
+  def test_queries(self):
+    Query(qid = 'q1', text = 'existing', remaining_assignments = 1).save()
+    messages = []
+    queries = [Query(qid = qid, text = 'query %s' % qid) \
+               for qid in ['q1', 'q2', 'q3', 'q2', 'q4']]
+    saved = bulk_save_queries(queries, remaining_assignments = 3,
+                              batch_size = 2,
+                              message_callback = messages.append)
+    self.assertEqual(saved, 3)
+    self.assertEqual(sorted(Query.objects.values_list('qid', flat=True)),
+                     ['q1', 'q2', 'q3', 'q4'])
+    self.assertEqual(Query.objects.get(qid = 'q1').text, 'existing')
+    self.assertEqual(Query.objects.get(qid = 'q4').remaining_assignments, 3)
+    self.assertEqual(messages,
+        ['Query batch 1: saved 1, rejected 1 duplicates',
+         'Query batch 2: saved 1, rejected 1 duplicates',
+         'Query batch 3: saved 1, rejected 0 duplicates'])
+
+  def test_documents(self):
+    q1 = self.make_query('q1', n_docs = 2)
+    q2 = self.make_query('q2', n_docs = 0)
+    docs = [Document(query = q1, document = 'q1-doc0', score = 1),
+            Document(query = q1, document = 'q1-doc2', score = 1),
+            Document(query = q2, document = 'q1-doc0', score = 1),
+            Document(query = q2, document = 'q1-doc0', score = 2)]
+    messages = []
+    saved = bulk_save_documents(docs, batch_size = 10,
+                                message_callback = messages.append)
+    self.assertEqual(saved, 2)
+    self.assertEqual(messages,
+        ['Document batch 1: saved 2, rejected 2 duplicates'])
+    self.assertEqual(q1.documents.count(), 3)
+    self.assertEqual(q2.documents.get().score, 1)
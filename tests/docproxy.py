@@ -0,0 +1,182 @@
+from assessment.tests.base import AssessmentTestCase, overridden
+from assessment import docproxy
+from assessment.models import Document
+from assessment.docproxy import DocumentCache
+from assessment.selection_strategies import document_url
+from django.core.urlresolvers import reverse
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+import urlparse
+import shutil
+import tempfile
+import os
+
+class StandInDocserver(object):
+  '''A document server on a local port, in a thread, serving "document
+  <docid>" for every docid except "missing", and counting the requests for
+  each.'''
+  def __init__(self):
+    hits = self.hits = {}
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        docid = urlparse.parse_qs(urlparse.urlparse(self.path).query) \
+                        ['docid'][0]
+        hits[docid] = hits.get(docid, 0) + 1
+        if docid == 'missing':
+          self.send_error(404)
+          return
+        content = 'document %s' % docid
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', '"etag-%s"' % docid)
+        self.end_headers()
+        self.wfile.write(content)
+
+      def log_message(self, *args):
+        pass
+
+    self.server = HTTPServer(('127.0.0.1', 0), Handler)
+    self.thread = Thread(target = self.server.serve_forever)
+    self.thread.setDaemon(True)
+    self.thread.start()
+
+  def url_pattern(self):
+    return 'http://127.0.0.1:%d/doc?docid=%%s' % self.server.server_port
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+class DocumentCacheTest(AssessmentTestCase):
+  def setUp(self):
+    super(DocumentCacheTest, self).setUp()
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+    super(DocumentCacheTest, self).tearDown()
+
+  def test_put_and_get(self):
+    cache = DocumentCache(self.directory, 1000)
+    self.assertEqual(cache.get('doc'), None)
+    cache.put('doc', 'content', 'text/plain')
+    cached = cache.get('doc')
+    self.assertEqual((cached.content_type, cached.size),
+                     ('text/plain', 7))
+    self.assertEqual(''.join(cached), 'content')
+    # an empty document
+    cache.put('empty', '', 'text/plain', etag = '"e"')
+    cached = cache.get('empty')
+    self.assertEqual((list(cached), cached.etag), ([], '"e"'))
+
+  def test_least_recently_used_evicted(self):
+    cache = DocumentCache(self.directory, 25)
+    cache.put('a', 'a' * 10, 'text/plain')
+    cache.put('b', 'b' * 10, 'text/plain')
+    os.utime(cache._path('a'), (1000, 1000))
+    os.utime(cache._path('b'), (2000, 2000))
+    cache.get('a').close()
+    cache.put('c', 'c' * 10, 'text/plain')
+    self.assertEqual(cache.get('b'), None)
+    for document in ('a', 'c'):
+      cached = cache.get(document)
+      self.assertEqual(''.join(cached), document * 10)
+
+class DocumentProxyTest(AssessmentTestCase):
+  app_settings = { 'DOCUMENT_PROXY': True }
+
+  def setUp(self):
+    super(DocumentProxyTest, self).setUp()
+    self.docserver = StandInDocserver()
+    self.directory = tempfile.mkdtemp()
+    self.cache = docproxy.cache
+    docproxy.cache = DocumentCache(self.directory, 1000)
+    self._docserver_url = overridden(
+        DOCSERVER_URL_PATTERN = self.docserver.url_pattern())
+    self._docserver_url.__enter__()
+    self.query = self.make_query(n_docs = 2)
+    self.make_user()
+    self.client.login(username = 'assessor', password = 'secret')
+
+  def tearDown(self):
+    self._docserver_url.__exit__(None, None, None)
+    docproxy.cache = self.cache
+    shutil.rmtree(self.directory)
+    self.docserver.stop()
+    super(DocumentProxyTest, self).tearDown()
+
+  def get(self, document, **headers):
+    return self.client.get(reverse('document_proxy', args=[document]),
+                           **headers)
+
+  def test_document_url(self):
+    self.assertEqual(document_url('q1-doc0'),
+                     reverse('document_proxy', args=['q1-doc0']))
+
+  def test_fetched_once(self):
+    for i in xrange(2):
+      response = self.get('q1-doc0')
+      self.assertEqual(response.status_code, 200)
+      self.assertEqual(response.content, 'document q1-doc0')
+      self.assertEqual(response['Content-Type'], 'text/plain')
+      self.assertEqual(response['ETag'], '"etag-q1-doc0"')
+    self.assertEqual(self.docserver.hits, {'q1-doc0': 1})
+
+  def test_too_big_to_cache(self):
+    docproxy.cache = DocumentCache(self.directory, 5)
+    for i in xrange(2):
+      response = self.get('q1-doc0')
+      self.assertEqual(response.status_code, 200)
+      self.assertEqual(response.content, 'document q1-doc0')
+      self.assertEqual(response['Content-Length'], '16')
+    self.assertEqual(self.docserver.hits, {'q1-doc0': 2})
+    self.assertEqual(os.listdir(self.directory), [])
+
+  def test_unwritable_cache(self):
+    # the cache directory is a file
+    path = os.path.join(self.directory, 'file')
+    open(path, 'w').close()
+    docproxy.cache = DocumentCache(path, 1000)
+    docproxy.logger.disabled = True
+    try:
+      response = self.get('q1-doc0')
+    finally:
+      docproxy.logger.disabled = False
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.content, 'document q1-doc0')
+    self.assertEqual(response['ETag'], '"etag-q1-doc0"')
+    self.assertEqual(os.listdir(self.directory), ['file'])
+
+  def test_prefetch(self):
+    docproxy.prefetch(['q1-doc0', 'q1-doc1', 'q1-doc0'])
+    self.assertEqual(self.docserver.hits, {'q1-doc0': 1, 'q1-doc1': 1})
+    self.assertEqual(self.get('q1-doc1').status_code, 200)
+    self.assertEqual(self.docserver.hits['q1-doc1'], 1)
+
+  def test_not_modified(self):
+    self.get('q1-doc0')
+    response = self.get('q1-doc0', HTTP_IF_NONE_MATCH = '"etag-q1-doc0"')
+    self.assertEqual(response.status_code, 304)
+    self.assertEqual(response.content, '')
+
+  def test_unknown_document(self):
+    self.assertEqual(self.get('not-in-the-pool').status_code, 404)
+    self.assertEqual(self.docserver.hits, {})
+
+  def test_docserver_errors(self):
+    Document(query = self.query, document = 'missing', score = 0.0).save()
+    self.assertEqual(self.get('missing').status_code, 404)
+    self.assertEqual(self.docserver.hits, {'missing': 1})
+
+  def test_docserver_down(self):
+    self.docserver.stop()
+    self.assertEqual(self.get('q1-doc0').status_code, 502)
+    # for tearDown
+    self.docserver = StandInDocserver()
+
+  def test_off(self):
+    with overridden(DOCUMENT_PROXY = False):
+      self.assertEqual(self.get('q1-doc0').status_code, 404)
+      docproxy.prefetch(['q1-doc0'])
+    self.assertEqual(self.docserver.hits, {})
@@ -0,0 +1,82 @@
+from django.test import TestCase
+from assessment.graph import Graph
+import random
+
+def _brute_force_reachable(edges, source):
+  '''The labels reachable from source, by breadth-first search over the edge
+  list'''
+  reached, frontier = set(), [source]
+  while frontier:
+    v = frontier.pop(0)
+    for (s, t) in edges:
+      if s == v and t not in reached:
+        reached.add(t)
+        frontier.append(t)
+  return reached
+
+def _random_edges(rng, n, m):
+  return [(rng.randrange(n), rng.randrange(n)) for _ in xrange(m)]
+
+class GraphTest(TestCase):
+  def test_successors(self):
+    graph = Graph([('b', 'c'), ('a', 'b'), ('a', 'c')], vertices = ['d'])
+    self.assertEqual(len(graph), 4)
+    self.assertEqual(sorted(graph.successors('a')), ['b', 'c'])
+    self.assertEqual(graph.successors('d'), [])
+    self.assertEqual(graph.successors('z'), [])
+    self.assertEqual(sorted(graph.reversed().successors('c')), ['a', 'b'])
+    self.assertTrue(graph.reversed().reversed() is graph)
+
+  def test_from_relations(self):
+    graph = Graph.from_relations([(1, 2, 'P'), (2, 3, 'D'), (4, 1, 'B')])
+    self.assertEqual(graph.successors(1), [2])
+    self.assertEqual(graph.successors(2), [3])
+    self.assertEqual(graph.successors(3), [2])
+    self.assertEqual(graph.successors(4), [])
+    self.assertEqual(graph.reachable_from(1), set([2, 3]))
+    # 2 and 3 are duplicates, so each is on a cycle
+    self.assertEqual(graph.reachable_from(2), set([2, 3]))
+
+  def test_components(self):
+    # a cycle a <-> b, which reaches another c -> d -> e -> c, and f alone
+    graph = Graph([('a', 'b'), ('b', 'a'), ('b', 'c'), ('c', 'd'),
+                   ('d', 'e'), ('e', 'c')], vertices = ['f'])
+    components = [sorted(graph.labels[v] for v in component) \
+                  for component in graph._components()]
+    self.assertEqual(sorted(components),
+                     [['a', 'b'], ['c', 'd', 'e'], ['f']])
+    # reverse topological order: components are after those they reach
+    self.assertTrue(components.index(['c', 'd', 'e']) < \
+                    components.index(['a', 'b']))
+
+  def test_closure_matches_brute_force(self):
+    for seed in xrange(20):
+      rng = random.Random(seed)
+      n = rng.randint(1, 30)
+      edges = _random_edges(rng, n, rng.randint(0, 3 * n))
+      graph = Graph(edges, vertices = range(n))
+      pairs = set(graph.reachable_pairs())
+      for v in xrange(n):
+        expected = _brute_force_reachable(edges, v)
+        self.assertEqual(graph.reachable_from(v), expected)
+        self.assertEqual(set(t for (s, t) in pairs if s == v), expected)
+
+  def test_components_partition_in_reverse_topological_order(self):
+    for seed in xrange(20):
+      rng = random.Random(seed)
+      n = rng.randint(1, 30)
+      graph = Graph(_random_edges(rng, n, rng.randint(0, 2 * n)),
+                    vertices = range(n))
+      components = graph._components()
+      self.assertEqual(sorted(sum(components, [])), range(n))
+      position = {}
+      for (c, component) in enumerate(components):
+        for v in component:
+          position[v] = c
+      closure = graph.closure()
+      for (v, w) in graph.edges:
+        # an edge never leads to a later component
+        self.assertTrue(position[w] <= position[v])
+        # and within a component, every vertex reaches every other
+        if position[w] == position[v]:
+          self.assertTrue((closure[w] >> v) & 1)
@@ -0,0 +1,122 @@
+from assessment.tests.base import AssessmentTestCase, overridden
+from assessment import instrumentation
+from assessment.instrumentation import RequestRecord, RollingHistogram, \
+                                       SlowestRequests, \
+                                       InstrumentationMiddleware
+from assessment.models import Query
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.test.client import RequestFactory
+
+def _record(wall_time, url_name = 'view'):
+  record = RequestRecord()
+  record.url_name = url_name
+  record.finish([{ 'time': '0.002', 'sql': 'SELECT 1' }])
+  record.wall_time = wall_time
+  return record
+
+class RequestRecordTest(AssessmentTestCase):
+  def test_finish(self):
+    record = RequestRecord()
+    record.phases['strategy'].queries = 1
+    record.phases['strategy'].query_time = 0.001
+    record.finish([{ 'time': '0.001', 'sql': 'SELECT 1' },
+                   { 'time': '0.002', 'sql': 'SELECT 2' }])
+    self.assertEqual(record.queries, 2)
+    self.assertAlmostEqual(record.query_time, 0.003)
+    self.assertEqual(record.phases['view'].queries, 1)
+    self.assertAlmostEqual(record.phases['view'].query_time, 0.002)
+
+  def test_phase(self):
+    record = RequestRecord()
+    instrumentation._current.record = record
+    try:
+      with instrumentation.phase('strategy'):
+        Query.objects.count()
+        # nested phases of the same name aren't counted twice
+        with instrumentation.phase('strategy'):
+          Query.objects.count()
+    finally:
+      instrumentation._current.record = None
+    self.assertEqual(record.active, [])
+    self.assertTrue(record.phases['strategy'].time > 0)
+
+  def test_histogram(self):
+    histogram = RollingHistogram(2)
+    for wall_time in (0.001, 0.003, 0.030):
+      histogram.add(_record(wall_time))
+    summary = histogram.summary()
+    self.assertEqual((summary['n'], summary['total']), (2, 3))
+    self.assertAlmostEqual(summary['max'], 30.0)
+    self.assertEqual(summary['queries'], 1)
+    self.assertTrue(summary['peak_rss_growth'] >= 0)
+    self.assertEqual([count for (_, _, count) in summary['buckets']][:4],
+                     [1, 0, 0, 1])
+
+class SlowestRequestsTest(AssessmentTestCase):
+  def test_keeps_the_slowest(self):
+    slowest = SlowestRequests(2)
+    for (i, wall_time) in enumerate((0.1, 0.3, 0.2, 0.05)):
+      slowest.add(_record(wall_time), 'GET', '/%d/' % i,
+                  [{ 'time': '0.002', 'sql': 'SELECT %d' % i }])
+    requests = slowest.requests()
+    self.assertEqual([r['path'] for r in requests], ['/1/', '/2/'])
+    self.assertEqual(requests[0]['queries'], [('0.002', 'SELECT 1')])
+    self.assertAlmostEqual(requests[0]['time'], 300.0)
+
+  def test_off(self):
+    slowest = SlowestRequests(0)
+    slowest.add(_record(0.1), 'GET', '/', [])
+    self.assertEqual(slowest.requests(), [])
+
+class InstrumentationMiddlewareTest(AssessmentTestCase):
+  app_settings = { 'INSTRUMENTATION': True }
+
+  def setUp(self):
+    super(InstrumentationMiddlewareTest, self).setUp()
+    self.slowest = instrumentation.slowest
+    instrumentation.slowest = SlowestRequests(5)
+    instrumentation._histograms.clear()
+
+  def tearDown(self):
+    instrumentation.slowest = self.slowest
+    instrumentation._histograms.clear()
+    super(InstrumentationMiddlewareTest, self).tearDown()
+
+  def request(self, path):
+    def view(request):
+      Query.objects.count()
+      with instrumentation.phase('strategy'):
+        Query.objects.count()
+      return HttpResponse('')
+    middleware = InstrumentationMiddleware()
+    request = RequestFactory().get(path)
+    self.assertEqual(middleware.process_request(request), None)
+    self.assertEqual(middleware.process_view(request, view, (), {}), None)
+    return middleware.process_response(request, view(request))
+
+  def test_records_request(self):
+    self.request(reverse('assessor_dashboard'))
+    [(name, summary)] = instrumentation.summaries()
+    self.assertEqual(name, 'assessor_dashboard')
+    self.assertEqual(summary['queries'], 2)
+    phases = dict((p['name'], p) for p in summary['phases'])
+    self.assertEqual(phases['strategy']['queries'], 1)
+    self.assertEqual(phases['view']['queries'], 1)
+    [slowest] = instrumentation.slowest.requests()
+    self.assertEqual(len(slowest['queries']), 2)
+
+  def test_off(self):
+    with overridden(INSTRUMENTATION = False):
+      self.request(reverse('assessor_dashboard'))
+    self.assertEqual(instrumentation.summaries(), [])
+
+  def test_report(self):
+    self.request(reverse('assessor_dashboard'))
+    admin = self.make_user('admin')
+    admin.is_superuser = True
+    admin.save()
+    self.client.login(username = 'admin', password = 'secret')
+    response = self.client.get(reverse('instrumentation_report'))
+    self.assertEqual(response.status_code, 200)
+    self.assertContains(response, 'Slowest Requests')
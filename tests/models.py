@@ -0,0 +1,275 @@
+from assessment.tests.base import AssessmentTestCase, overridden
+from assessment.models import Assignment, AssessedDocument, \
+                              AssessedDocumentRelation, AssignmentProgress, \
+                              deferred_progress
+from assessment.selection_strategies import BubbleSortStrategy, get_strategy
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from StringIO import StringIO
+import sys
+
+class LazyDocumentsTest(AssessmentTestCase):
+  def lazy_assignment(self, n_docs = 4):
+    assignment = Assignment(assessor = self.make_user(),
+                            query = self.make_query(n_docs = n_docs),
+                            description = 'information need')
+    assignment.save()
+    return assignment
+
+  def test_materialize_documents(self):
+    assignment = self.lazy_assignment()
+    assignment.materialize_documents()
+    docs = assignment.documents.all()
+    self.assertEqual(sorted(d.document_id for d in docs),
+                     sorted(assignment.all_documents() \
+                                      .values_list('id', flat=True)))
+    for doc in docs:
+      self.assertEqual((doc.times_assessed, doc.is_bad, doc.is_dup),
+                       (0, False, False))
+
+  def test_assessed_documents_created_on_demand(self):
+    assignment = self.lazy_assignment()
+    ids = list(assignment.all_documents().order_by('-score') \
+                         .values_list('id', flat=True))
+    self.assertEqual(assignment.documents.count(), 0)
+    docs = assignment.assessed_documents(ids[:2])
+    self.assertEqual(sorted(docs), sorted(ids[:2]))
+    self.assertEqual(assignment.documents.count(), 2)
+    # existing ones are reused
+    again = assignment.assessed_documents(ids[1:3])
+    self.assertEqual(again[ids[1]].id, docs[ids[1]].id)
+    self.assertEqual(assignment.documents.count(), 3)
+
+  def test_unmaterialized_documents_are_available(self):
+    assignment = self.lazy_assignment(n_docs = 4)
+    docs = assignment.assessed_documents(
+        list(assignment.all_documents().values_list('id', flat=True)[:2]))
+    bad = docs.values()[0]
+    bad.is_bad = True
+    bad.save()
+    self.assertEqual(assignment.available_documents().count(), 3)
+    self.assertEqual(assignment.unassessed_documents().count(), 4)
+
+  def test_strategy_materializes_only_the_pair(self):
+    assignment = self.lazy_assignment(n_docs = 5)
+    pair = BubbleSortStrategy(25).next_pair(assignment)
+    self.assertEqual(set(d.id for d in pair.docs),
+                     set(assignment.documents.values_list('id', flat=True)))
+
+  def claim(self, lazy):
+    query = self.make_query(n_docs = 3)
+    self.make_user()
+    self.client.login(username = 'assessor', password = 'secret')
+    with overridden(LAZY_ASSESSED_DOCUMENTS = lazy):
+      self.client.post(reverse('select_query_confirm', args=[query.id]))
+    return AssessedDocument.objects.count()
+
+  def test_claim_materializes(self):
+    self.assertEqual(self.claim(lazy = False), 3)
+
+  def test_lazy_claim(self):
+    self.assertEqual(self.claim(lazy = True), 0)
+
+class DocumentCountersTest(AssessmentTestCase):
+  def counters(self, docs):
+    return [(d.times_assessed, d.is_bad, d.is_dup) \
+            for d in map(self.reload, docs)]
+
+  def test_created(self):
+    d = self.docs(self.make_assignment(n_docs = 4))
+    self.judge(d[0], d[1], 'P')
+    self.judge(d[2], d[1], 'B')
+    self.judge(d[0], d[3], 'D')
+    self.assertEqual(self.counters(d), [(2, False, False),
+                                        (2, False, False),
+                                        (1, True, False),
+                                        (1, False, True)])
+
+  def test_changed_relation_type(self):
+    d = self.docs(self.make_assignment(n_docs = 2))
+    relation = self.judge(d[0], d[1], 'B')
+    relation.relation_type = 'D'
+    relation.save()
+    self.assertEqual(self.counters(d), [(1, False, False), (1, False, True)])
+
+  def test_deleted(self):
+    d = self.docs(self.make_assignment(n_docs = 3))
+    self.judge(d[0], d[1], 'P')
+    self.judge(d[1], d[2], 'B').delete()
+    self.assertEqual(self.counters(d), [(1, False, False),
+                                        (1, False, False),
+                                        (0, False, False)])
+
+  def test_rebuild_command(self):
+    d = self.docs(self.make_assignment(n_docs = 3))
+    self.judge(d[0], d[1], 'P')
+    self.judge(d[1], d[2], 'D')
+    self.judge(d[2], d[0], 'B')
+    expected = self.counters(d)
+    AssessedDocument.objects.update(times_assessed = 7, is_bad = True,
+                                    is_dup = False)
+    call_command('rebuild_document_counters')
+    self.assertEqual(self.counters(d), expected)
+
+class RelationAssignmentTest(AssessmentTestCase):
+  def test_filled_in_on_save(self):
+    assignment = self.make_assignment(n_docs = 2)
+    (a, b) = self.docs(assignment)
+    relation = self.judge(a, b)
+    self.assertEqual(self.reload(relation).assignment, assignment)
+    self.assertEqual(list(assignment.assessments()), [relation])
+
+  def test_backfill_command(self):
+    first = self.make_assignment(n_docs = 3)
+    second = self.make_assignment(n_docs = 2, query = \
+        self.make_query('q2', 2), user = self.make_user('second'))
+    d = self.docs(first)
+    self.judge(d[0], d[1])
+    self.judge(d[1], d[2])
+    e = self.docs(second)
+    self.judge(e[0], e[1])
+    AssessedDocumentRelation.objects.update(assignment = None)
+    out = StringIO()
+    stdout, sys.stdout = sys.stdout, out
+    try:
+      call_command('backfill_relation_assignments')
+    finally:
+      sys.stdout = stdout
+    self.assertEqual(out.getvalue(),
+                     'Filled in the assignment of 3 relations.\n')
+    self.assertEqual(first.assessments().count(), 2)
+    self.assertEqual(second.assessments().count(), 1)
+
+class AssignmentProgressTest(AssessmentTestCase):
+  def progress(self, assignment):
+    return AssignmentProgress.objects.get(assignment = assignment)
+
+  def assertProgress(self, assignment, done, bad, dups):
+    progress = self.progress(assignment)
+    self.assertEqual((progress.assessments_done, progress.bad_documents,
+                      progress.dup_documents), (done, bad, dups))
+    self.assertEqual(progress.pending_assessments, get_strategy() \
+        .calculate_pending_assessments(self.reload(assignment)))
+
+  def test_saved(self):
+    assignment = self.make_assignment(n_docs = 5)
+    d = self.docs(assignment)
+    self.judge(d[0], d[1])
+    self.assertProgress(assignment, 1, 0, 0)
+    self.judge(d[2], d[1], 'B')
+    self.judge(d[3], d[4], 'D')
+    self.assertProgress(assignment, 3, 1, 1)
+    relation = AssessedDocumentRelation.objects.get(relation_type = 'D')
+    self.assertEqual(self.progress(assignment).last_assessment_date,
+                     relation.created_date)
+
+  def test_changed_and_deleted(self):
+    assignment = self.make_assignment(n_docs = 4)
+    d = self.docs(assignment)
+    relation = self.judge(d[0], d[1], 'B')
+    self.judge(d[2], d[3])
+    relation.relation_type = 'P'
+    relation.save()
+    self.assertProgress(assignment, 2, 0, 0)
+    relation.delete()
+    self.assertProgress(assignment, 1, 0, 0)
+
+  def test_assignment_deleted(self):
+    assignment = self.make_assignment(n_docs = 3)
+    d = self.docs(assignment)
+    self.judge(d[0], d[1])
+    assignment.delete()
+    self.assertEqual(AssignmentProgress.objects.count(), 0)
+
+  def test_complete(self):
+    assignment = self.make_assignment(n_docs = 4)
+    d = self.docs(assignment)
+    self.judge(d[0], d[1])
+    self.assertTrue(self.progress(assignment).pending_assessments > 0)
+    assignment.complete = True
+    assignment.save()
+    self.assertEqual(self.progress(assignment).pending_assessments, 0)
+    self.assertEqual(self.reload(assignment).pending_assessments(), 0)
+
+  def test_deferred(self):
+    refresh = AssignmentProgress.__dict__['refresh']
+    refreshed = []
+    def counting_refresh(cls, assignment):
+      refreshed.append(assignment.id)
+      return refresh.__get__(None, cls)(assignment)
+    first = self.make_assignment(n_docs = 4)
+    second = self.make_assignment(n_docs = 3, query = \
+        self.make_query('q2', 3), user = self.make_user('second'))
+    (d, e) = (self.docs(first), self.docs(second))
+    AssignmentProgress.refresh = classmethod(counting_refresh)
+    try:
+      with deferred_progress():
+        self.judge(d[0], d[1])
+        with deferred_progress():
+          self.judge(d[1], d[2])
+          self.judge(e[0], e[1])
+        self.assertEqual(refreshed, [])
+        self.judge(d[2], d[3]).delete()
+    finally:
+      AssignmentProgress.refresh = refresh
+    self.assertEqual(sorted(refreshed), sorted([first.id, second.id]))
+    self.assertProgress(first, 2, 0, 0)
+    self.assertProgress(second, 1, 0, 0)
+
+  def test_created_with_the_assignment(self):
+    assignment = self.make_assignment(n_docs = 4)
+    self.assertProgress(assignment, 0, 0, 0)
+
+  def test_missing_not_calculated_in_views(self):
+    assignment = self.make_assignment(n_docs = 4)
+    self.judge(*self.docs(assignment)[:2])
+    # as if made before progress was kept
+    AssignmentProgress.objects.all().delete()
+    self.assertEqual(AssignmentProgress.for_assignments([assignment]), {})
+    self.assertEqual(self.reload(assignment).assessments_done(), 1)
+    admin = self.make_user('admin')
+    admin.is_superuser = True
+    admin.save()
+    self.client.login(username = 'admin', password = 'secret')
+    response = self.client.get(reverse('admin_dashboard'))
+    self.assertContains(response, 'Not computed')
+    self.client.login(username = 'assessor', password = 'secret')
+    response = self.client.get(reverse('assessor_dashboard'))
+    self.assertEqual(response.context['pending_assignments'][0]
+                       ['pending_assessments'],
+                     get_strategy().calculate_pending_assessments(assignment))
+    self.assertEqual(AssignmentProgress.objects.count(), 0)
+
+  def test_created_with_the_assignment(self):
+    assignment = self.make_assignment(n_docs = 4)
+    self.assertProgress(assignment, 0, 0, 0)
+
+  def test_missing_not_calculated_in_views(self):
+    assignment = self.make_assignment(n_docs = 4)
+    self.judge(*self.docs(assignment)[:2])
+    # as if made before progress was kept
+    AssignmentProgress.objects.all().delete()
+    self.assertEqual(AssignmentProgress.for_assignments([assignment]), {})
+    self.assertEqual(self.reload(assignment).assessments_done(), 1)
+    admin = self.make_user('admin')
+    admin.is_superuser = True
+    admin.save()
+    self.client.login(username = 'admin', password = 'secret')
+    response = self.client.get(reverse('admin_dashboard'))
+    self.assertContains(response, 'Not computed')
+    self.client.login(username = 'assessor', password = 'secret')
+    response = self.client.get(reverse('assessor_dashboard'))
+    self.assertEqual(response.context['pending_assignments'][0]
+                       ['pending_assessments'],
+                     get_strategy().calculate_pending_assessments(assignment))
+    self.assertEqual(AssignmentProgress.objects.count(), 0)
+
+  def test_rebuild_command(self):
+    assignment = self.make_assignment(n_docs = 4)
+    d = self.docs(assignment)
+    self.judge(d[0], d[1])
+    self.judge(d[2], d[3], 'B')
+    AssignmentProgress.objects.update(assessments_done = 9,
+                                      pending_assessments = 9)
+    call_command('rebuild_assignment_progress')
+    self.assertProgress(assignment, 2, 1, 0)
@@ -0,0 +1,99 @@
+from assessment.tests.base import AssessmentTestCase, overridden
+from assessment.models import AssessedDocument
+from assessment import precompute
+from django.core.urlresolvers import reverse
+
+class PrecomputeTest(AssessmentTestCase):
+  app_settings = { 'PRECOMPUTE_PAIRS': 3 }
+
+  def precomputed(self, n_docs = 6):
+    assignment = self.make_assignment(n_docs = n_docs)
+    precompute.precompute(assignment.id)
+    return assignment, precompute.precomputed_pairs(assignment)
+
+  def test_precompute(self):
+    assignment, pairs = self.precomputed()
+    self.assertEqual(len(pairs), 3)
+    self.assertEqual(tuple(pairs[0]),
+                     precompute.strategy.next_pair(assignment).to_args())
+
+  def queued(self, assignment, n_judged = 0):
+    return precompute.cache.get(precompute._pairs_key(assignment.id,
+                                                      n_judged))
+
+  def judge_assumed(self, assignment, i, n_judged = 0):
+    (preferred, other) = self.queued(assignment, n_judged)[i][1]
+    self.judge(AssessedDocument.objects.get(id = preferred),
+               AssessedDocument.objects.get(id = other))
+
+  def test_judged_pairs_dropped(self):
+    assignment, pairs = self.precomputed()
+    self.judge_assumed(assignment, 0)
+    self.assertEqual(precompute.precomputed_pairs(assignment), pairs[1:])
+    self.judge_assumed(assignment, 1)
+    self.assertEqual(precompute.precomputed_pairs(assignment), pairs[2:])
+    self.judge_assumed(assignment, 2)
+    self.assertEqual(precompute.precomputed_pairs(assignment), None)
+
+  def test_other_outcome_drops_queue(self):
+    assignment, pairs = self.precomputed()
+    self.judge_assumed(assignment, 0)
+    # the second pair is judged the other way round to the assumed outcome,
+    # so the third may not be what comes next
+    (preferred, other) = self.queued(assignment)[1][1]
+    self.judge(AssessedDocument.objects.get(id = other),
+               AssessedDocument.objects.get(id = preferred))
+    self.assertEqual(precompute.precomputed_pairs(assignment), None)
+
+  def test_other_pair_drops_queue(self):
+    assignment, pairs = self.precomputed()
+    (left, _, right, _) = pairs[1]
+    self.judge(AssessedDocument.objects.get(id = left),
+               AssessedDocument.objects.get(id = right))
+    self.assertEqual(precompute.precomputed_pairs(assignment), None)
+
+  def test_unavailable_pairs_dropped(self):
+    assignment, pairs = self.precomputed()
+    (_, _, right, _) = pairs[1]
+    AssessedDocument.objects.filter(id = right).update(is_bad = True)
+    self.assertEqual(precompute.precomputed_pairs(assignment), pairs[:1])
+
+  def test_newer_queue_not_replaced(self):
+    assignment, pairs = self.precomputed()
+    self.judge_assumed(assignment, 0)
+    precompute.precompute(assignment.id)
+    newer = precompute.precomputed_pairs(assignment)
+    # a slow worker finishing a queue from before the judgement
+    stale = list(reversed(self.queued(assignment)))
+    precompute.cache.set(precompute._pairs_key(assignment.id, 0), stale)
+    self.assertEqual(precompute.precomputed_pairs(assignment), newer)
+    self.assertEqual(tuple(newer[0]),
+                     precompute.strategy.next_pair(assignment).to_args())
+
+  def test_none(self):
+    assignment = self.make_assignment(n_docs = 4)
+    self.assertEqual(precompute.precomputed_pairs(assignment), None)
+    precompute.precompute(assignment.id)
+    assignment.complete = True
+    assignment.save()
+    self.assertEqual(precompute.precomputed_pairs(assignment), None)
+
+  def test_next_assessment_serves_precomputed_pair(self):
+    assignment, pairs = self.precomputed()
+    self.client.login(username = 'assessor', password = 'secret')
+    # the precomputed order is served, even if it's not the strategy's
+    # current choice
+    queue = list(reversed(self.queued(assignment)))
+    precompute.cache.set(precompute._pairs_key(assignment.id, 0), queue)
+    pairs = precompute.precomputed_pairs(assignment)
+    self.assertEqual(tuple(pairs[0]), tuple(queue[0][0]))
+    response = self.client.get(reverse('next_assessment',
+                                       args=[assignment.id]))
+    self.assertEqual(response.status_code, 302)
+    self.assertTrue(response['Location'].endswith(
+        reverse('new_assessment', args=(assignment.id,) + tuple(pairs[0]))))
+
+  def test_schedule_off(self):
+    with overridden(PRECOMPUTE_PAIRS = 0):
+      precompute.schedule(1)
+    self.assertEqual(precompute._queue.qsize(), 0)
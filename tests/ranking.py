@@ -0,0 +1,78 @@
+from assessment.tests.base import AssessmentTestCase
+from assessment.ranking import aggregate
+from StringIO import StringIO
+
+class AggregateTest(AssessmentTestCase):
+  def setUp(self):
+    super(AggregateTest, self).setUp()
+    self.assignment = self.make_assignment(n_docs = 5)
+    (a, b, c, d, e) = self.docs(self.assignment)
+    self.judge(a, b)
+    self.judge(b, c)
+    self.judge(a, c)
+    self.judge(c, d, 'D')
+    self.judge(e, a, 'B')
+    # Document ids
+    (self.a, self.b, self.c, self.d, self.e) = \
+      [doc.document_id for doc in (a, b, c, d, e)]
+
+  def by_doc(self, rankings, name):
+    return dict(zip(rankings.docs.tolist(),
+                    getattr(rankings, name).tolist()))
+
+  def test_counts(self):
+    rankings = aggregate()
+    self.assertEqual(len(rankings), 5)
+    self.assertEqual(self.by_doc(rankings, 'copeland'),
+                     { self.a: 2, self.b: 0, self.c: -2, self.d: 0,
+                       self.e: 0 })
+    self.assertEqual(self.by_doc(rankings, 'ties'),
+                     { self.a: 0, self.b: 0, self.c: 1, self.d: 1,
+                       self.e: 0 })
+    win_ratio = self.by_doc(rankings, 'win_ratio')
+    self.assertEqual(win_ratio[self.a], 1.0)
+    self.assertEqual(win_ratio[self.b], 0.5)
+    self.assertAlmostEqual(win_ratio[self.c], 0.5 / 3)
+
+  def test_order_and_grades(self):
+    rankings = aggregate()
+    docs = rankings.docs.tolist()
+    # the strongest first, and the bad document last
+    self.assertEqual(docs[0], self.a)
+    self.assertEqual(docs[3], self.c)
+    self.assertEqual(docs[4], self.e)
+    self.assertTrue((rankings.strength[:3] > rankings.strength[1:4]).all())
+    self.assertEqual(rankings.grade.tolist(), [3, 3, 2, 1, 0])
+    self.assertEqual(rankings.strength[4], 0.0)
+    self.assertEqual(set(rankings.groups.tolist()),
+                     set([self.assignment.query_id]))
+
+  def test_by_assignment(self):
+    other = self.make_assignment(query = self.assignment.query,
+                                 user = self.make_user('other'))
+    (a, b) = self.docs(other)[:2]
+    self.judge(b, a)
+    rankings = aggregate(by = 'assignment')
+    self.assertEqual(rankings.groups.tolist(),
+                     [self.assignment.id] * 5 + [other.id] * 2)
+    self.assertEqual(rankings.docs.tolist()[5:],
+                     [b.document_id, a.document_id])
+
+  def test_qrels(self):
+    out = StringIO()
+    aggregate().write_qrels(out)
+    lines = out.getvalue().splitlines()
+    self.assertEqual(lines[0], 'q1 0 q1-doc0 3')
+    self.assertEqual(lines[-1], 'q1 0 q1-doc4 0')
+
+  def test_rankings_leave_out_bad_documents(self):
+    out = StringIO()
+    aggregate().write_rankings(out)
+    lines = [line.split() for line in out.getvalue().splitlines()]
+    self.assertEqual([line[2] for line in lines][0], 'q1-doc0')
+    self.assertEqual([line[3] for line in lines], ['1', '2', '3', '4'])
+    self.assertTrue('q1-doc4' not in [line[2] for line in lines])
+
+class EmptyAggregateTest(AssessmentTestCase):
+  def test_no_judgements(self):
+    self.assertEqual(len(aggregate()), 0)
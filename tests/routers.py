@@ -0,0 +1,209 @@
+from assessment.tests.base import AssessmentTestCase, overridden
+from assessment import routers, views
+from assessment.routers import ReportingRouter, LagGuard, reporting, \
+                               primary, reporting_iterator, \
+                               reads_from_replica
+from assessment.models import AssessedDocumentRelation
+from assessment.caching import get_version, versioned_key
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connections, router, DEFAULT_DB_ALIAS
+from datetime import datetime, timedelta
+import os
+import tempfile
+
+class StubLagGuard(object):
+  def __init__(self, usable = True):
+    self.usable = usable
+
+  def replica_usable(self):
+    return self.usable
+
+class RouterTestMixin(object):
+  '''Installs ReportingRouter, reading from a replica with the given alias
+  whose lag is always acceptable'''
+  replica_alias = 'replica'
+
+  def setUp(self):
+    super(RouterTestMixin, self).setUp()
+    self._overridden_database = overridden(
+        REPORTING_DATABASE = self.replica_alias)
+    self._overridden_database.__enter__()
+    self.lag_guard = routers.lag_guard
+    routers.lag_guard = StubLagGuard()
+    self.router = ReportingRouter()
+    router.routers.insert(0, self.router)
+
+  def tearDown(self):
+    router.routers.remove(self.router)
+    routers.lag_guard = self.lag_guard
+    self._overridden_database.__exit__(None, None, None)
+    super(RouterTestMixin, self).tearDown()
+
+class ReportingRouterTest(RouterTestMixin, AssessmentTestCase):
+  def test_reads(self):
+    model = AssessedDocumentRelation
+    self.assertEqual(self.router.db_for_read(model), DEFAULT_DB_ALIAS)
+    with reporting():
+      self.assertEqual(self.router.db_for_read(model), 'replica')
+      self.assertTrue(reads_from_replica(model))
+      with reporting():
+        self.assertEqual(self.router.db_for_read(model), 'replica')
+      with primary():
+        self.assertEqual(self.router.db_for_read(model), DEFAULT_DB_ALIAS)
+        self.assertFalse(reads_from_replica(model))
+      self.assertEqual(self.router.db_for_read(model), 'replica')
+      routers.lag_guard.usable = False
+      self.assertEqual(self.router.db_for_read(model), DEFAULT_DB_ALIAS)
+    self.assertFalse(reads_from_replica(model))
+
+  def test_writes(self):
+    with reporting():
+      self.assertEqual(self.router.db_for_write(AssessedDocumentRelation),
+                       DEFAULT_DB_ALIAS)
+
+  def test_unset(self):
+    with overridden(REPORTING_DATABASE = None):
+      with reporting():
+        self.assertEqual(self.router.db_for_read(AssessedDocumentRelation),
+                         None)
+        self.assertEqual(self.router.db_for_write(AssessedDocumentRelation),
+                         None)
+        self.assertFalse(reads_from_replica(AssessedDocumentRelation))
+
+  def test_reporting_iterator(self):
+    def reads():
+      for i in xrange(3):
+        yield reads_from_replica(AssessedDocumentRelation)
+    self.assertEqual(list(reporting_iterator(reads())), [True] * 3)
+    self.assertFalse(reads_from_replica(AssessedDocumentRelation))
+
+class FakeLagGuard(LagGuard):
+  '''Reads the latest judgement times from a dict of alias -> time'''
+  def __init__(self, latest):
+    LagGuard.__init__(self)
+    self.latest = latest
+    self.checks = 0
+
+  def latest_judgement(self, alias):
+    self.checks += 1
+    value = self.latest[alias]
+    if isinstance(value, Exception):
+      raise value
+    return value
+
+class LagGuardTest(AssessmentTestCase):
+  app_settings = { 'REPORTING_DATABASE': 'replica', 'REPORTING_MAX_LAG': 60,
+                   'REPORTING_LAG_CHECK_INTERVAL': 10 }
+
+  def setUp(self):
+    super(LagGuardTest, self).setUp()
+    # the lagging replicas are logged
+    routers.logger.disabled = True
+
+  def tearDown(self):
+    routers.logger.disabled = False
+    super(LagGuardTest, self).tearDown()
+
+  def check(self, primary_latest, replica_latest):
+    return FakeLagGuard({ DEFAULT_DB_ALIAS: primary_latest,
+                          'replica': replica_latest }).check()
+
+  def test_check(self):
+    now = datetime.now()
+    self.assertTrue(self.check(None, None))
+    self.assertTrue(self.check(now, now - timedelta(seconds = 30)))
+    self.assertFalse(self.check(now, now - timedelta(seconds = 90)))
+    self.assertFalse(self.check(now, None))
+    self.assertFalse(self.check(now, Exception('unreachable')))
+
+  def test_checked_every_interval(self):
+    guard = FakeLagGuard({ DEFAULT_DB_ALIAS: None, 'replica': None })
+    self.assertTrue(guard.replica_usable())
+    self.assertTrue(guard.replica_usable())
+    self.assertEqual(guard.checks, 2)
+    guard.checked -= 11
+    guard.replica_usable()
+    self.assertEqual(guard.checks, 4)
+
+class AgreementReportCacheTest(AssessmentTestCase):
+  def setUp(self):
+    super(AgreementReportCacheTest, self).setUp()
+    self.reads_from_replica = views.reads_from_replica
+    admin = self.make_user('admin')
+    admin.is_superuser = True
+    admin.save()
+    self.client.login(username = 'admin', password = 'secret')
+
+  def tearDown(self):
+    views.reads_from_replica = self.reads_from_replica
+    super(AgreementReportCacheTest, self).tearDown()
+
+  def cached_report(self):
+    return cache.get(versioned_key('judgements', 'all',
+                                   get_version('judgements', 'all'),
+                                   'agreement_report'))
+
+  def test_cached_from_primary(self):
+    views.reads_from_replica = lambda model: False
+    self.client.get(reverse('agreement_report'))
+    self.assertNotEqual(self.cached_report(), None)
+
+  def test_not_cached_from_replica(self):
+    views.reads_from_replica = lambda model: True
+    self.client.get(reverse('agreement_report'))
+    self.assertEqual(self.cached_report(), None)
+
+class StandInReplicaTest(RouterTestMixin, AssessmentTestCase):
+  '''Reporting reads against a real, separate database'''
+  replica_alias = 'stand-in-replica'
+
+  def setUp(self):
+    (fd, self.replica_path) = tempfile.mkstemp(suffix = '.sqlite')
+    os.close(fd)
+    connections.databases[self.replica_alias] = {
+        'ENGINE': 'django.db.backends.sqlite3', 'NAME': self.replica_path }
+    call_command('syncdb', database = self.replica_alias, interactive = False,
+                 verbosity = 0)
+    super(StandInReplicaTest, self).setUp()
+    admin = self.make_user('admin')
+    admin.is_superuser = True
+    admin.save()
+    self.client.login(username = 'admin', password = 'secret')
+    assignment = self.make_assignment(n_docs = 2)
+    self.judge(*self.docs(assignment))
+
+  def tearDown(self):
+    super(StandInReplicaTest, self).tearDown()
+    connections[self.replica_alias].close()
+    del connections._connections[self.replica_alias]
+    del connections.databases[self.replica_alias]
+    os.remove(self.replica_path)
+
+  def test_export_reads_replica(self):
+    # the replica hasn't caught up with the judgement
+    response = self.client.get(reverse('download_data'))
+    self.assertEqual(len(response.content.splitlines()), 1)
+    with overridden(REPORTING_DATABASE = None):
+      # the content's streamed, so it's read as it's consumed
+      response = self.client.get(reverse('download_data'))
+      self.assertEqual(len(response.content.splitlines()), 2)
+
+  def test_agreement_report_from_replica_not_cached(self):
+    key = versioned_key('judgements', 'all', get_version('judgements', 'all'),
+                        'agreement_report')
+    self.client.get(reverse('agreement_report'))
+    self.assertEqual(cache.get(key), None)
+    with overridden(REPORTING_DATABASE = None):
+      self.client.get(reverse('agreement_report'))
+    self.assertNotEqual(cache.get(key), None)
+
+  def test_lag_guard(self):
+    routers.logger.disabled = True
+    try:
+      self.assertFalse(LagGuard().check())
+    finally:
+      routers.logger.disabled = False
+    AssessedDocumentRelation.objects.all().delete()
+    self.assertTrue(LagGuard().check())
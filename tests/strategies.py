@@ -0,0 +1,211 @@
+from assessment.tests.base import AssessmentTestCase
+from assessment.selection_strategies import AssignmentState, \
+                                            BubbleSortStrategy, \
+                                            BinaryInsertionStrategy, \
+                                            TopKStrategy, _nearest_first
+from math import ceil, log
+import random
+
+class AssignmentStateTest(AssessmentTestCase):
+  def test_loads_judgements(self):
+    assignment = self.make_assignment(n_docs = 5)
+    d = self.docs(assignment)
+    self.judge(d[0], d[1], 'P')
+    self.judge(d[2], d[3], 'B')
+    self.judge(d[3], d[4], 'D', source_presented_left = False)
+    state = AssignmentState(assignment)
+    ids = [doc.document_id for doc in d]
+
+    self.assertEqual(state.doc_ids, ids)
+    self.assertEqual(state.n_assessments, 3)
+    self.assertEqual([state.counts[i] for i in ids], [1, 1, 1, 2, 1])
+    self.assertEqual(state.bad, set([ids[2]]))
+    self.assertEqual(state.dups, set([ids[4]]))
+    self.assertEqual(state.bad_dup_documents(), set([ids[2], ids[4]]))
+    self.assertEqual(state.judged_with(ids[3]), set([ids[2], ids[4]]))
+    self.assertEqual(state.latest, (ids[3], ids[4], 'D', False))
+    self.assertEqual(state.available_documents(), [ids[0], ids[1], ids[3]])
+    self.assertEqual(state.unassessed_documents(), [])
+
+  def test_order(self):
+    assignment = self.make_assignment(n_docs = 4)
+    d = self.docs(assignment)
+    ids = [doc.document_id for doc in d]
+    self.judge(d[0], d[1], 'P')
+    self.judge(d[1], d[2], 'P')
+    self.judge(d[2], d[3], 'D')
+    state = AssignmentState(assignment)
+    self.assertEqual(state.order(ids[0], ids[1]), 1)
+    self.assertEqual(state.order(ids[1], ids[0]), -1)
+    # transitively
+    self.assertEqual(state.order(ids[0], ids[3]), 1)
+    self.assertEqual(state.order(ids[2], ids[3]), 0)
+    self.assertEqual(state.transitively_judged_with(ids[0]),
+                     set(ids[1:]))
+
+  def test_order_closure_computed_once(self):
+    assignment = self.make_assignment(n_docs = 4)
+    d = self.docs(assignment)
+    ids = [doc.document_id for doc in d]
+    self.judge(d[0], d[1], 'P')
+    self.judge(d[2], d[3], 'P')
+    state = AssignmentState(assignment)
+    closure = state.closure()
+    self.assertEqual(state.order(ids[0], ids[3]), None)
+    self.assertEqual(state.order(ids[3], ids[0]), None)
+    self.assertTrue(state.closure() is closure)
+    # an assumed judgement links the two chains
+    state.assume_judged(state.presentation(ids[1], ids[2], True, False))
+    self.assertEqual(state.order(ids[0], ids[3]), 1)
+    self.assertTrue(state.closure() is not closure)
+
+  def test_unknown_order(self):
+    assignment = self.make_assignment(n_docs = 3)
+    ids = [doc.document_id for doc in self.docs(assignment)]
+    self.assertEqual(AssignmentState(assignment).order(ids[0], ids[1]), None)
+
+class BubbleSortStrategyTest(AssessmentTestCase):
+  def test_first_pair_is_the_top_two(self):
+    assignment = self.make_assignment(n_docs = 4)
+    d = self.docs(assignment)
+    pair = BubbleSortStrategy(25).next_pair(assignment)
+    self.assertEqual(pair.docs, (d[0], d[1]))
+    self.assertEqual(pair.fixed, (False, False))
+
+  def test_keeps_the_preferred_document_fixed(self):
+    assignment = self.make_assignment(n_docs = 4)
+    d = self.docs(assignment)
+    # the right document was preferred
+    self.judge(d[1], d[0], 'P', source_presented_left = False)
+    pair = BubbleSortStrategy(25).next_pair(assignment)
+    self.assertEqual(pair.docs, (d[2], d[1]))
+    self.assertEqual(pair.fixed, (False, True))
+
+  def test_keeps_the_other_document_after_a_bad_judgement(self):
+    assignment = self.make_assignment(n_docs = 4)
+    d = self.docs(assignment)
+    self.judge(d[0], d[1], 'B', source_presented_left = True)
+    pair = BubbleSortStrategy(25).next_pair(assignment)
+    self.assertEqual(pair.docs, (d[2], d[1]))
+    self.assertEqual(pair.fixed, (False, True))
+
+  def test_next_pairs_looks_ahead_without_repeating(self):
+    assignment = self.make_assignment(n_docs = 5)
+    pairs = BubbleSortStrategy(25).next_pairs(assignment, 4)
+    self.assertEqual(len(pairs), 4)
+    keys = [frozenset(p.docs) for p in pairs]
+    self.assertEqual(len(set(keys)), 4)
+    # nothing was saved
+    self.assertEqual(assignment.relations.count(), 0)
+
+  def test_done_after_the_maximum_assessments(self):
+    assignment = self.make_assignment(n_docs = 5)
+    d = self.docs(assignment)
+    self.judge(d[0], d[1], 'P')
+    self.judge(d[0], d[2], 'P')
+    strategy = BubbleSortStrategy(2)
+    self.assertEqual(strategy.next_pair(assignment), None)
+    self.assertTrue(self.reload(assignment).complete)
+
+class OracleMixin(object):
+  def run_oracle(self, strategy, assignment, rank):
+    '''Judges the strategy's pairs until it's done, preferring the document
+    with the lower rank (a dict of Document id -> rank).  Returns the number
+    of judgements.'''
+    n = 0
+    while True:
+      pair = strategy.next_pair(assignment)
+      if pair is None:
+        return n
+      (left, right) = pair.docs
+      if rank[left.document_id] < rank[right.document_id]:
+        self.judge(left, right, source_presented_left = True)
+      else:
+        self.judge(right, left, source_presented_left = False)
+      n += 1
+
+  def shuffled_ranks(self, assignment, seed):
+    ids = [doc.document_id for doc in self.docs(assignment)]
+    random.Random(seed).shuffle(ids)
+    return (ids, dict((doc_id, i) for (i, doc_id) in enumerate(ids)))
+
+def _insertion_bound(n):
+  '''Comparisons to binary insert n documents, one at a time'''
+  return sum(int(ceil(log(i + 1, 2))) for i in xrange(n))
+
+class BinaryInsertionStrategyTest(OracleMixin, AssessmentTestCase):
+  def test_nearest_first(self):
+    for (lo, hi) in [(0, 1), (0, 6), (3, 10), (2, 9)]:
+      for mid in xrange(lo, hi):
+        expected = sorted(xrange(lo, hi), key = lambda i: (abs(i - mid), i))
+        self.assertEqual(list(_nearest_first(lo, hi, mid)), expected)
+
+  def test_orders_documents(self):
+    for seed in xrange(5):
+      assignment = self.make_assignment(n_docs = 9, query = \
+          self.make_query('q%d' % seed, 9), user = \
+          self.make_user('assessor%d' % seed))
+      (ids, rank) = self.shuffled_ranks(assignment, seed)
+      strategy = BinaryInsertionStrategy(100)
+      self.assertEqual(strategy.pending_assessments(assignment),
+                       _insertion_bound(9))
+      n = self.run_oracle(strategy, assignment, rank)
+      self.assertTrue(n <= _insertion_bound(9))
+      (ordered, n_remaining, _, _) = \
+        strategy._replay(AssignmentState(assignment))
+      self.assertEqual((ordered, n_remaining), (ids, 0))
+      self.assertEqual(strategy.pending_assessments(assignment), 0)
+
+  def test_bad_documents_drop_out(self):
+    assignment = self.make_assignment(n_docs = 5)
+    d = self.docs(assignment)
+    self.judge(d[1], d[0], 'B')
+    (ids, rank) = self.shuffled_ranks(assignment, 0)
+    strategy = BinaryInsertionStrategy(100)
+    self.run_oracle(strategy, assignment, rank)
+    (ordered, _, _, _) = strategy._replay(AssignmentState(assignment))
+    self.assertEqual(ordered, [i for i in ids if i != d[1].document_id])
+
+  def test_keeps_the_inserted_document_fixed(self):
+    assignment = self.make_assignment(n_docs = 4)
+    d = self.docs(assignment)
+    strategy = BinaryInsertionStrategy(100)
+    self.judge(d[0], d[1])
+    # d[2] is compared with the middle of [d0, d1], then with d0
+    pair = strategy.next_pair(assignment)
+    self.assertEqual((pair.docs, pair.fixed), ((d[2], d[1]), (False, False)))
+    self.judge(d[2], d[1], source_presented_left = True)
+    pair = strategy.next_pair(assignment)
+    self.assertEqual((pair.docs, pair.fixed), ((d[2], d[0]), (True, False)))
+
+class TopKStrategyTest(OracleMixin, AssessmentTestCase):
+  def test_orders_the_top_k(self):
+    for seed in xrange(5):
+      assignment = self.make_assignment(n_docs = 10, query = \
+          self.make_query('q%d' % seed, 10), user = \
+          self.make_user('assessor%d' % seed))
+      (ids, rank) = self.shuffled_ranks(assignment, seed)
+      strategy = TopKStrategy(100, k = 3)
+      n = self.run_oracle(strategy, assignment, rank)
+      # each document after the first k is compared with the k-th, then
+      # binary inserted into the rest if it beats it
+      self.assertTrue(n <= _insertion_bound(3) + 7 * 3)
+      (ordered, n_remaining, _, _) = \
+        strategy._replay(AssignmentState(assignment))
+      self.assertEqual((ordered, n_remaining), (ids[:3], 0))
+
+  def test_losers_only_compared_with_the_kth(self):
+    assignment = self.make_assignment(n_docs = 8)
+    # the documents are in preference order already
+    rank = dict((doc.document_id, i) for (i, doc) in \
+                enumerate(self.docs(assignment)))
+    strategy = TopKStrategy(100, k = 3)
+    self.assertEqual(strategy.pending_assessments(assignment),
+                     _insertion_bound(3) + 5)
+    # the third document loses to the second, so it's placed after one
+    # comparison rather than two
+    self.assertEqual(self.run_oracle(strategy, assignment, rank), 2 + 5)
+
+  def test_cache_name(self):
+    self.assertNotEqual(TopKStrategy(100, k = 3).cache_name(),
+                        TopKStrategy(100, k = 4).cache_name())
@@ -0,0 +1,70 @@
+from assessment.tests.base import AssessmentTestCase, overridden
+from assessment.models import ReachablePair
+from assessment.graph import Graph
+from random import Random
+
+class ReachablePairTest(AssessmentTestCase):
+  app_settings = { 'ASSUME_TRANSITIVITY': True }
+
+  def indexed(self, assignment):
+    return set(ReachablePair.objects.filter(assignment = assignment) \
+                            .values_list('source_doc', 'target_doc'))
+
+  def expected(self, assignment):
+    graph = Graph.from_relations(assignment.relations.values_list(
+                                   'source_doc', 'target_doc', 'relation_type'))
+    return set((s, t) for (s, t) in graph.reachable_pairs() if s != t)
+
+  def random_judgements(self, assignment, seed, n):
+    rand = Random(seed)
+    d = self.docs(assignment)
+    pairs = [(a, b) for a in d for b in d if a.id < b.id]
+    rand.shuffle(pairs)
+    for (a, b) in pairs[:n]:
+      if rand.random() < 0.5:
+        (a, b) = (b, a)
+      self.judge(a, b, rand.choice('PPPPDB'))
+
+  def test_chain(self):
+    assignment = self.make_assignment(n_docs = 3)
+    d = self.docs(assignment)
+    self.judge(d[0], d[1])
+    self.judge(d[1], d[2])
+    self.assertEqual(self.indexed(assignment),
+                     set([(d[0].id, d[1].id), (d[1].id, d[2].id),
+                          (d[0].id, d[2].id)]))
+
+  def test_incremental_matches_rebuild(self):
+    for seed in xrange(5):
+      assignment = self.make_assignment(n_docs = 7,
+          user = self.make_user('assessor%d' % seed),
+          query = self.make_query('q%d' % seed, n_docs = 7))
+      self.random_judgements(assignment, seed, 12)
+      incremental = self.indexed(assignment)
+      self.assertEqual(incremental, self.expected(assignment))
+      ReachablePair.rebuild(assignment)
+      self.assertEqual(self.indexed(assignment), incremental)
+
+  def test_changed_relation_rebuilds(self):
+    assignment = self.make_assignment(n_docs = 3)
+    d = self.docs(assignment)
+    relation = self.judge(d[0], d[1])
+    self.judge(d[1], d[2])
+    relation.relation_type = 'B'
+    relation.save()
+    self.assertEqual(self.indexed(assignment), set([(d[1].id, d[2].id)]))
+
+  def test_deleted_relation_rebuilds(self):
+    assignment = self.make_assignment(n_docs = 3)
+    d = self.docs(assignment)
+    self.judge(d[0], d[1])
+    relation = self.judge(d[1], d[2])
+    relation.delete()
+    self.assertEqual(self.indexed(assignment), set([(d[0].id, d[1].id)]))
+
+  def test_not_maintained_without_transitivity(self):
+    assignment = self.make_assignment(n_docs = 3)
+    d = self.docs(assignment)
+    with overridden(ASSUME_TRANSITIVITY = False):
+      self.judge(d[0], d[1])
+    self.assertEqual(self.indexed(assignment), set())
@@ -0,0 +1,115 @@
+from assessment.tests.base import AssessmentTestCase, overridden
+from assessment.models import AssessedDocumentRelation
+from django.core.urlresolvers import reverse
+from django.db import connection
+
+class AdminDashboardTest(AssessmentTestCase):
+  def setUp(self):
+    super(AdminDashboardTest, self).setUp()
+    admin = self.make_user('admin')
+    admin.is_superuser = True
+    admin.save()
+    self.client.login(username = 'admin', password = 'secret')
+
+  def add_assignments(self, n):
+    for i in xrange(n):
+      qid = 'q%d' % self.n_queries
+      self.n_queries += 1
+      user = self.make_user('user-%s' % qid)
+      assignment = self.make_assignment(n_docs = 3, user = user,
+                                        query = self.make_query(qid, 3))
+      d = self.docs(assignment)
+      self.judge(d[0], d[1])
+
+  def dashboard_queries(self):
+    '''The number of queries run by the dashboard, once the progress rows
+    exist'''
+    self.client.get(reverse('admin_dashboard'))
+    connection.use_debug_cursor = True
+    connection.queries = []
+    try:
+      response = self.client.get(reverse('admin_dashboard'))
+      self.assertEqual(response.status_code, 200)
+      return len(connection.queries)
+    finally:
+      connection.use_debug_cursor = None
+
+  def test_constant_queries(self):
+    self.n_queries = 0
+    self.add_assignments(2)
+    n = self.dashboard_queries()
+    self.assertTrue(n > 0)
+    self.add_assignments(2)
+    self.assertEqual(self.dashboard_queries(), n)
+
+  def test_progress(self):
+    self.n_queries = 0
+    self.add_assignments(1)
+    response = self.client.get(reverse('admin_dashboard'))
+    [row] = response.context['queries']
+    [assignment] = row['assignments']
+    self.assertEqual(assignment['complete'], 1)
+    self.assertEqual(assignment['bad_dups'], 0)
+    self.assertEqual(assignment['assessor'].username, 'user-q0')
+
+class DirectPairRenderingTest(AssessmentTestCase):
+  def setUp(self):
+    super(DirectPairRenderingTest, self).setUp()
+    self.assignment = self.make_assignment(n_docs = 4)
+    self.d = self.docs(self.assignment)
+    self.client.login(username = 'assessor', password = 'secret')
+
+  def pair_url(self, left, right, left_fixed = ''):
+    return reverse('new_assessment', args=(self.assignment.id, left.id,
+                                           left_fixed, right.id, ''))
+
+  def test_redirects(self):
+    response = self.client.get(reverse('next_assessment',
+                                       args=[self.assignment.id]))
+    self.assertEqual(response.status_code, 302)
+    self.assertTrue(response['Location'].endswith(
+        self.pair_url(self.d[0], self.d[1])))
+    response = self.client.post(self.pair_url(self.d[0], self.d[1]),
+                                {'preference': 'L'})
+    self.assertTrue(response['Location'].endswith(
+        reverse('next_assessment', args=[self.assignment.id])))
+
+  def test_renders_next_pair(self):
+    with overridden(DIRECT_PAIR_RENDERING = True):
+      response = self.client.get(reverse('next_assessment',
+                                         args=[self.assignment.id]))
+      self.assertEqual(response.status_code, 200)
+      self.assertEqual(response.context['docpair'].docs,
+                       (self.d[0], self.d[1]))
+      # the page knows its own URL
+      self.assertEqual(response.context['assessment_url'],
+                       self.pair_url(self.d[0], self.d[1]))
+
+      response = self.client.post(self.pair_url(self.d[0], self.d[1]),
+                                  {'preference': 'L'})
+      self.assertEqual(response.status_code, 200)
+      self.assertEqual(AssessedDocumentRelation.objects.count(), 1)
+      next_pair = response.context['docpair']
+      self.assertEqual(response.context['assessment_url'],
+          reverse('new_assessment', args=(self.assignment.id,) + \
+                                         next_pair.to_args()))
+      self.assertNotEqual(set(next_pair.docs), set(self.d[:2]))
+
+  def test_information_need_first(self):
+    self.assignment.description = ''
+    self.assignment.save()
+    with overridden(DIRECT_PAIR_RENDERING = True):
+      response = self.client.get(reverse('next_assessment',
+                                         args=[self.assignment.id]))
+    self.assertEqual(response.status_code, 302)
+    self.assertTrue(reverse('information_need', args=[self.assignment.id]) \
+                    in response['Location'])
+
+  def test_complete(self):
+    self.assignment.complete = True
+    self.assignment.save()
+    with overridden(DIRECT_PAIR_RENDERING = True):
+      response = self.client.get(reverse('next_assessment',
+                                         args=[self.assignment.id]))
+    self.assertTrue(response['Location'].endswith(
+        reverse('assessor_dashboard')))
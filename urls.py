@@ -19,6 +19,16 @@ urlpatterns = patterns('assessment.views',
   # Downloading data
   url(r'^admin/download_data/$', 'download_data', name='download_data'),
 
+  # Viewing the aggregated document rankings
+  url(r'^admin/rankings/$', 'ranking_report', name='ranking_report'),
+
+  # Viewing the inter-assessor agreement
+  url(r'^admin/agreement/$', 'agreement_report', name='agreement_report'),
+
+  # Viewing the request instrumentation
+  url(r'^admin/instrumentation/$', 'instrumentation_report',
+    name='instrumentation_report'),
+
   # Confirming query assignment
   url(r'^assessor/selectquery/(?P<query_id>\d+)/$', 'select_query_confirm',
     name='select_query_confirm'),
@@ -42,6 +52,12 @@ urlpatterns = patterns('assessment.views',
                        '(?P<right_doc>\d+)(?P<right_fixed>\+?)/$',
     'new_assessment', name='new_assessment'),
 
+  # JSON API: the next pairs to assess, and saving a batch of judgements
+  url(r'^assessor/assignment/(?P<assignment_id>\d+)/api/pairs/$',
+    'api_next_pairs', name='api_next_pairs'),
+  url(r'^assessor/assignment/(?P<assignment_id>\d+)/api/judgements/$',
+    'api_judgements', name='api_judgements'),
+
   # Assessment viewing
   url(r'^assessor/assessment/(?P<assessment_id>\d+)/$',
     'assessment_detail', name='assessment_detail'),
@@ -50,6 +66,10 @@ urlpatterns = patterns('assessment.views',
   url(r'^assessor/assignment/(?P<assignment_id>\d+)/infoneed/$',
     'information_need', name='information_need'),
 
+  # Documents, through the caching document proxy
+  url(r'^documents/(?P<document>.+)$', 'document_proxy',
+    name='document_proxy'),
+
   # Entering a comment
   url(r'^assessor/comment/$', 'comment', name='comment'),
 
@@ -1,20 +1,27 @@
-from django.core.cache import cache
-from assessment.models import Query, Document
-from functools import wraps
-
-def my_cache(func, timeout_secs = 30):
-  '''A decorator for caching of function output.  Only works with zero
-  argument object methods.'''
-  @wraps(func)
-  def cached_func(self):
-    key = '%s %s cache' % (str(self), str(func))
-    if cache.has_key(key):
-      return cache.get(key)
-    else:
-      result = func(self)
-      cache.set(key, result, timeout_secs)
-      return result
-  return cached_func
+from django.db import connection, transaction
+from django.utils.encoding import smart_str
+from assessment.models import Query, Document, Assignment, \
+                              AssessedDocumentRelation
+from assessment import app_settings, claim_pool
+from cStringIO import StringIO
+import csv
+
+def bulk_insert(model, fields, rows):
+  '''Inserts rows (sequences of values for the named fields) into the model's
+  table with a single executemany, bypassing save() and signals.  Returns the
+  number of rows inserted.'''
+  rows = list(rows)
+  if not rows:
+    return 0
+  opts = model._meta
+  qn = connection.ops.quote_name
+  columns = [qn(opts.get_field(f).column) for f in fields]
+  sql = 'INSERT INTO %s (%s) VALUES (%s)' % (qn(opts.db_table),
+                                            ', '.join(columns),
+                                            ', '.join(['%s'] * len(columns)))
+  connection.cursor().executemany(sql, rows)
+  transaction.commit_unless_managed()
+  return len(rows)
 
 def parse_queries_file(file, message_callback = None):
   '''A generator over (unsaved) Query objects.  Expect lines to be in the
@@ -26,8 +33,10 @@ def parse_queries_file(file, message_callback = None):
     yield Query(qid = splits[0], text = splits[1])
 
 def parse_docscores_file(file, message_callback = None):
-  '''A generator over (unsaved) QueryDocumentPair objects.  Expect lines to
+  '''A generator over (unsaved) Document objects.  Expect lines to
   be in the format: <qid>:<doc>:<score>'''
+  # resolve qids from a single in-memory map rather than a query per line
+  query_ids = dict(Query.objects.values_list('qid', 'id'))
   missing_queries = set()
   for line in file:
     splits = line.strip().split(':')
@@ -36,15 +45,105 @@ def parse_docscores_file(file, message_callback = None):
     (qid, doc, score) = splits
     if qid in missing_queries:
       continue
-    try:
-      q = Query.objects.get(qid=qid)
-    except Query.DoesNotExist:
+    if qid not in query_ids:
       missing_queries.add(qid)
       if message_callback:
         message_callback('Query "%s" in Doc Pairs File does not exist' % qid)
       continue
 
-    yield Document(query = q, document = doc, score = float(score))
+    yield Document(query_id = query_ids[qid], document = doc,
+                   score = float(score))
+
+def _batches(iterable, batch_size):
+  '''A generator over lists of up to batch_size consecutive items'''
+  batch = []
+  for item in iterable:
+    batch.append(item)
+    if len(batch) >= batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+def bulk_save_queries(queries, remaining_assignments = 1, batch_size = None,
+                      message_callback = None):
+  '''Saves (unsaved) Query objects in batches of batch_size, each batch in
+  its own transaction.  Queries whose qid already exists, in the database or
+  earlier in the input, are rejected.  Returns the number saved.'''
+  if batch_size is None:
+    batch_size = app_settings.UPLOAD_BATCH_SIZE
+  existing = set(Query.objects.values_list('qid', flat=True))
+  saved = 0
+  for (i, batch) in enumerate(_batches(queries, batch_size)):
+    rows = []
+    for query in batch:
+      if query.qid in existing:
+        continue
+      existing.add(query.qid)
+      rows.append((query.qid, query.text, remaining_assignments))
+    with transaction.commit_on_success():
+      bulk_insert(Query, ('qid', 'text', 'remaining_assignments'), rows)
+    saved += len(rows)
+    if message_callback:
+      message_callback('Query batch %d: saved %d, rejected %d duplicates' % \
+                        (i + 1, len(rows), len(batch) - len(rows)))
+  # bulk_insert skips the signals that add new queries to the claim pool
+  if saved:
+    claim_pool.reload_if_loaded()
+  return saved
+
+def bulk_save_documents(docs, batch_size = None, message_callback = None):
+  '''Saves (unsaved) Document objects in batches of batch_size, each batch in
+  its own transaction.  Documents whose (query, document) pair already exists,
+  in the database or earlier in the input, are rejected.  Returns the number
+  saved.'''
+  if batch_size is None:
+    batch_size = app_settings.UPLOAD_BATCH_SIZE
+  # query id -> set of document names, loaded the first time each query is
+  # seen (run files are usually grouped by query)
+  existing = {}
+  saved = 0
+  for (i, batch) in enumerate(_batches(docs, batch_size)):
+    rows = []
+    for doc in batch:
+      if doc.query_id not in existing:
+        existing[doc.query_id] = set(Document.objects \
+            .filter(query = doc.query_id).values_list('document', flat=True))
+      query_docs = existing[doc.query_id]
+      if doc.document in query_docs:
+        continue
+      query_docs.add(doc.document)
+      rows.append((doc.query_id, doc.document, doc.score))
+    with transaction.commit_on_success():
+      bulk_insert(Document, ('query', 'document', 'score'), rows)
+    saved += len(rows)
+    if message_callback:
+      message_callback('Document batch %d: saved %d, rejected %d duplicates' \
+                        % (i + 1, len(rows), len(batch) - len(rows)))
+  return saved
+
+def relations_csv(chunk_size = 2000):
+  '''A generator over chunks of CSV text for all AssessedDocumentRelations.
+  Each chunk is a single joined values_list query for the next chunk_size
+  relations by id, so memory use stays flat however many judgements there
+  are.'''
+  yield 'qid,source_doc,target_doc,relation_type,assessor,time\n'
+  relations = AssessedDocumentRelation.objects.order_by('id').values_list(
+      'id', 'assignment__query__qid',
+      'source_doc__document__document', 'target_doc__document__document',
+      'relation_type', 'assignment__assessor__username',
+      'created_date')
+  last_id = 0
+  while True:
+    rows = list(relations.filter(id__gt = last_id)[:chunk_size])
+    if not rows:
+      break
+    buf = StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+      writer.writerow([smart_str(v) for v in row[1:6]] + [row[6].isoformat()])
+    last_id = rows[-1][0]
+    yield buf.getvalue()
 
 def add_users(username_pattern='user%d', password_pattern=None, count=100):
   '''adds users programmatically, with username=password, following the
@@ -57,3 +156,62 @@ def add_users(username_pattern='user%d', password_pattern=None, count=100):
     u = User( username = username_pattern % i )
     u.set_password( password_pattern % i )
     u.save()
+
+def generate_synthetic_data(n_queries, n_docs, n_assessors, judgements = 10,
+                            prefix = 'synthetic', seed = None):
+  '''Builds a synthetic dataset for benchmarking: n_queries queries with n_docs
+  documents each, all assigned to n_assessors assessors (users named
+  <prefix>_user%d, with username=password).  Each assignment gets up to
+  `judgements` judgements in the fixed-document pattern of the
+  BubbleSortStrategy, decided by a hidden relevance score per document, with
+  occasional bad and duplicate judgements.  Returns the list of assessors.'''
+  from django.contrib.auth.models import User
+  import random
+  rand = random.Random(seed)
+  add_users('%s_user%%d' % prefix, count = n_assessors)
+  assessors = list(User.objects.filter(username__startswith = prefix + '_user'))
+
+  bulk_save_queries((Query(qid = '%s-%d' % (prefix, q),
+                           text = '%s query %d' % (prefix, q)) \
+                      for q in xrange(n_queries)), n_assessors)
+  query_ids = dict(Query.objects.filter(qid__startswith = prefix + '-') \
+                                .values_list('qid', 'id'))
+  bulk_save_documents(Document(query_id = query_ids['%s-%d' % (prefix, q)],
+                               document = '%s-%d-doc%d' % (prefix, q, d),
+                               score = rand.random()) \
+                      for q in xrange(n_queries) for d in xrange(n_docs))
+
+  for query in Query.objects.filter(id__in = query_ids.values()):
+    for assessor in assessors:
+      assignment = Assignment(assessor = assessor, query = query,
+                              description = 'synthetic information need')
+      assignment.save()
+      assignment.materialize_documents()
+      docs = list(assignment.documents.order_by('-document__score'))
+      relevance = dict((d.id, rand.random()) for d in docs)
+      keep = docs[0]
+      for other in docs[1:judgements + 1]:
+        roll = rand.random()
+        if roll < 0.05:
+          relation = AssessedDocumentRelation(source_doc = other,
+                                              target_doc = keep,
+                                              relation_type = 'B')
+        elif roll < 0.08:
+          relation = AssessedDocumentRelation(source_doc = keep,
+                                              target_doc = other,
+                                              relation_type = 'D')
+        else:
+          # the assessor mostly, but not always, prefers the more relevant
+          noise = rand.gauss(0, 0.1)
+          if relevance[keep.id] + noise >= relevance[other.id]:
+            (winner, loser) = (keep, other)
+          else:
+            (winner, loser) = (other, keep)
+          relation = AssessedDocumentRelation(source_doc = winner,
+                                              target_doc = loser,
+                                              relation_type = 'P')
+          keep = winner
+        relation.save()
+    query.remaining_assignments = 0
+    query.save()
+  return assessors
@@ -1,46 +1,113 @@
 from assessment.models import *
 from assessment.forms import *
-from assessment.selection_strategies import BubbleSortStrategy, \
+from assessment.selection_strategies import get_strategy, \
                                             DocumentPairPresentation
+from assessment import precompute, instrumentation, claim_pool, docproxy
+from assessment.routers import reporting_view, reporting_iterator, \
+                               reads_from_replica
+from assessment.instrumentation import render_to_response
 from assessment import app_settings
+from assessment.caching import commit_on_success, get_version, \
+                               versioned_key, VALUE_TIMEOUT
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.db import IntegrityError
-from django.db.models import Sum
-from django.http import HttpResponse, HttpResponseRedirect
-from django.shortcuts import render_to_response, \
-                             get_object_or_404
+from django.db.models import Sum, Q
+from django.http import HttpResponse, HttpResponseRedirect, \
+                        HttpResponseNotModified, Http404
+from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.template import RequestContext
+from django.utils import simplejson
 from random import randint, uniform
-from util import parse_queries_file, parse_docscores_file
+from util import parse_queries_file, parse_docscores_file, relations_csv, \
+                 bulk_save_queries, bulk_save_documents
 
 pref_assessment_form_factory = PreferenceAssessmentReasonFormFactory()
-strategy = BubbleSortStrategy(app_settings.ASSESSMENTS_PER_QUERY)
-strategy.assume_transitivity = app_settings.ASSUME_TRANSITIVITY
+# strategy calls are recorded as their own phase by the instrumentation
+strategy = instrumentation.Timed(get_strategy(), 'strategy')
 
 def redirect_to_pagename(request, pagename):
   return HttpResponseRedirect(reverse(pagename))
 
 @login_required
 @user_passes_test(lambda user: user.is_superuser)
+@reporting_view
 def admin_dashboard(request):
+  # all the progress numbers come from the AssignmentProgress rows, read
+  # with a single query
+  all_assignments = list(Assignment.objects.select_related('assessor') \
+                                           .order_by('id'))
+  progress = AssignmentProgress.for_assignments(all_assignments)
+  assignments = {}
+  for a in all_assignments:
+    # assignments made before progress was kept have no row until it's
+    # rebuilt, and are shown as not computed
+    p = progress.get(a.id)
+    assignments.setdefault(a.query_id, []).append( { \
+        'assessor': a.assessor, \
+        'id': a.id, \
+        'created_date': a.created_date, \
+        'computed': p is not None, \
+        'complete': p and p.assessments_done, \
+        'pending': p and p.pending_assessments, \
+        'bad_dups': p and p.bad_documents + p.dup_documents, \
+        'last_assessment_date': p and p.last_assessment_date } )
+
   # group data by query
   queries = []
   for q in Query.objects.all():
-    q_data = { 'query': q, \
-               'remaining_assignments': q.remaining_assignments, \
-               'assignments': [] }
-    for a in q.assignments.all():
-      q_data['assignments'].append( { \
-          'assessor': a.assessor, \
-          'id': a.id, \
-          'created_date': a.created_date, \
-          'complete': a.num_assessments_complete(), \
-          'pending': strategy.pending_assessments(a) } )
-    queries.append(q_data)
+    queries.append( { 'query': q, \
+                      'remaining_assignments': q.remaining_assignments, \
+                      'assignments': assignments.get(q.id, []) } )
   return render_to_response('assessment/admin_dashboard.html', \
         { 'queries': queries}, RequestContext(request))
 
+@login_required
+@user_passes_test(lambda user: user.is_superuser)
+@reporting_view
+def ranking_report(request):
+  # requires NumPy, so only import it when it's needed
+  from assessment.ranking import aggregate
+  return render_to_response('assessment/ranking_report.html',
+                            {'rankings': aggregate().rows()},
+                            RequestContext(request))
+
+@login_required
+@user_passes_test(lambda user: user.is_superuser)
+@reporting_view
+def agreement_report(request):
+  '''Inter-assessor agreement.  A report computed from the primary is cached
+  until the next judgement is saved.  One computed from the reporting
+  replica isn't, since it may be missing judgements the primary's version
+  already counts.'''
+  key = versioned_key('judgements', 'all', get_version('judgements', 'all'),
+                      'agreement_report')
+  report = cache.get(key)
+  if report is None:
+    from_replica = reads_from_replica(AssessedDocumentRelation)
+    # requires NumPy, so only import it when it's needed
+    from assessment.agreement import analyze
+    report = analyze().report(app_settings.AGREEMENT_MAX_CONFLICTS)
+    if not from_replica:
+      cache.set(key, report, VALUE_TIMEOUT)
+  return render_to_response('assessment/agreement_report.html', report,
+                            RequestContext(request))
+
+@login_required
+@user_passes_test(lambda user: user.is_superuser)
+def instrumentation_report(request):
+  return render_to_response('assessment/instrumentation_report.html',
+                            {'enabled': app_settings.INSTRUMENTATION,
+                             'summaries': instrumentation.summaries(),
+                             'slowest': instrumentation.slowest.requests()},
+                            RequestContext(request))
+
+def _randomize_scores(docs):
+  for doc in docs:
+    doc.score = uniform(0, 1)
+    yield doc
+
 @login_required
 @user_passes_test(lambda user: user.is_superuser)
 def upload_data(request):
@@ -50,29 +117,23 @@ def upload_data(request):
     if form.is_valid():
       # handle queries
       if 'queries_file' in request.FILES:
-        query_count = 0
-        for query in parse_queries_file(request.FILES['queries_file']):
-          try:
-            query.remaining_assignments = form.cleaned_data['assignments']
-            query.save()
-          except IntegrityError:
-            continue
-          query_count += 1
+        remaining_assignments = form.cleaned_data['assignments']
+        if remaining_assignments is None:
+          remaining_assignments = 1
+        query_count = bulk_save_queries(
+              parse_queries_file(request.FILES['queries_file']),
+              remaining_assignments, message_callback = messages.append)
         messages.append('Uploaded %d queries' % query_count)
 
       # handle documents
       if 'document_scores_file' in request.FILES:
-        doc_count = 0
-        for doc in parse_docscores_file(
-              request.FILES['document_scores_file'], messages.append):
-          if form.cleaned_data['randomize_document_presentation']:
-            # assign a random number to the score
-            doc.score = uniform(0, 1)
-          try:
-            doc.save()
-          except IntegrityError:
-            continue
-          doc_count += 1
+        docs = parse_docscores_file(request.FILES['document_scores_file'],
+                                    messages.append)
+        if form.cleaned_data['randomize_document_presentation']:
+          # assign a random number to the score
+          docs = _randomize_scores(docs)
+        doc_count = bulk_save_documents(docs,
+                                        message_callback = messages.append)
         messages.append('Uploaded %d docs' % doc_count)
 
   else:
@@ -84,9 +145,10 @@ def upload_data(request):
 @login_required
 @user_passes_test(lambda user: user.is_superuser)
 def download_data(request):
-  return render_to_response('assessment/data_download.txt',
-                            {'data': AssessedDocumentRelation.objects.all()},
-                            RequestContext(request), mimetype='text/csv')
+  # stream the CSV in chunks rather than building it all in memory, reading
+  # from the reporting replica as it's sent
+  return HttpResponse(reporting_iterator(relations_csv()),
+                      mimetype='text/csv')
 
 @login_required
 def assessor_dashboard(request):
@@ -94,8 +156,15 @@ def assessor_dashboard(request):
 
   # Make lists of complete & in-progress assignments
   complete_assignments, pending_assignments = [], []
-  for a in assignments.filter(abandoned=False):
-    n_pending = strategy.pending_assessments(a)
+  active_assignments = list(assignments.filter(abandoned=False) \
+                                       .select_related('query'))
+  progress = AssignmentProgress.for_assignments(active_assignments)
+  for a in active_assignments:
+    if a.id in progress:
+      n_pending = progress[a.id].pending_assessments
+    else:
+      # made before progress was kept: calculated, but not saved here
+      n_pending = AssignmentProgress.calculate(a).pending_assessments
     if n_pending == 0:
       complete_assignments.append(a)
     else:
@@ -103,15 +172,9 @@ def assessor_dashboard(request):
                                    'pending_assessments':n_pending} )
 
 
-  # Grab a random query to offer
+  # Offer a random query from the claim pool
   assigned_query_ids = assignments.values_list('query__id', flat=True)
-  try:
-    available_query = \
-      Query.objects.exclude(id__in=assigned_query_ids)\
-        .filter(remaining_assignments__gt=0).order_by('?')[0]
-  except IndexError:
-    # no available queries for this assessor
-    available_query = None
+  available_query = claim_pool.offer(assigned_query_ids)
 
   comment_form = CommentForm()
 
@@ -151,31 +214,36 @@ def select_query_confirm(request, query_id):
   query = get_object_or_404(Query, pk=query_id)
 
   if request.method == 'POST':
-    # create a new assignment
-    assignment = Assignment(assessor = request.user,
-                            query = query)
+    # atomically claim this query and create the assignment
     try:
-      assignment.save()
+      assignment = claim_pool.claim(request.user, query)
     except IntegrityError:
       # must be already assigned to this query, so start assessing
       assignment = Assignment.objects.get(assessor = request.user,
                             query = query)
       return HttpResponseRedirect(reverse('next_assessment',
                                 args=[assignment.id]))
-    # decrement our remaining_assignments field
-    query.remaining_assignments -= 1
-    query.save()
-
-    # copy all the docs for this query to AssessedDocument objects
-    for doc in query.documents.all():
-      assessed_doc = AssessedDocument(assignment=assignment,
-                                      document=doc)
-      assessed_doc.save()
+    if assignment is None:
+      # it's been taken: offer another query to confirm, if there are any
+      assigned_query_ids = request.user.assignments.values_list('query__id',
+                                                                flat=True)
+      other_query = claim_pool.offer(assigned_query_ids)
+      if other_query is None:
+        return HttpResponseRedirect(reverse('assessor_dashboard'))
+      return HttpResponseRedirect(reverse('select_query_confirm',
+                                          args=[other_query.id]) + '?taken=1')
+
+    # copy all the docs for this query to AssessedDocument objects, unless
+    # they're created as they are first presented
+    if not app_settings.LAZY_ASSESSED_DOCUMENTS:
+      assignment.materialize_documents()
     return HttpResponseRedirect(reverse('next_assessment',
                                 args=[assignment.id]))
   else:
     return render_to_response('assessment/select_query_confirm.html',
-                              {'query': query}, RequestContext(request))
+                              {'query': query,
+                               'previous_taken': 'taken' in request.GET},
+                              RequestContext(request))
 
 @login_required
 def abandon_query_confirm(request, assignment_id):
@@ -183,15 +251,8 @@ def abandon_query_confirm(request, assignment_id):
   a = get_object_or_404(Assignment, pk=assignment_id)
 
   if request.method == 'POST':
-    # mark abandoned
-    a.abandoned = True
-    a.save()
-
-    # increment the remaining_assignments field
-    query = a.query
-    query.remaining_assignments += 1
-    query.save()
-
+    # mark abandoned and give the query's assignment back
+    claim_pool.abandon(a)
     return HttpResponseRedirect(reverse('assessor_dashboard'))
   else:
     return render_to_response('assessment/abandon_query_confirm.html',
@@ -206,9 +267,9 @@ def assignment_detail(request, assignment_id):
       {'message': 'Sorry, you don\'t have permission to view this assignment'},
       RequestContext(request))
 
-  # use the selection strategy to calculate the number of remaining assessments
   return render_to_response('assessment/assignment_detail.html',
-    {'assignment': a, 'pending_assessments':strategy.pending_assessments(a)},
+    {'assignment': a, 'progress': a.get_progress(),
+     'pending_assessments': a.pending_assessments()},
     RequestContext(request))
 
 @login_required
@@ -221,21 +282,54 @@ def next_assessment(request, assignment_id):
       {'message': 'Sorry, you don\'t have permission to view this assignment'},
       RequestContext(request))
 
-  docpair = strategy.next_pair(assignment)
-  # if no docpairs, we must be done
-  if docpair is None:
-    assignment.complete = True
-    assignment.save()
-    return HttpResponseRedirect(reverse('assessor_dashboard'))
+  return _next_pair_response(request, assignment)
+
+def _next_pair_response(request, assignment):
+  '''Redirects to the new_assessment page for the assignment's next pair, or
+  with DIRECT_PAIR_RENDERING, renders it straight away.'''
+  # use a precomputed pair if there is one, otherwise work it out now
+  pairs = precompute.precomputed_pairs(assignment)
+  if pairs:
+    docpair_args = tuple(pairs[0])
+    docpair = None
+  else:
+    docpair = strategy.next_pair(assignment)
+    # if no docpairs, we must be done
+    if docpair is None:
+      assignment.complete = True
+      assignment.save()
+      return HttpResponseRedirect(reverse('assessor_dashboard'))
+    docpair_args = docpair.to_args()
 
   new_assessment_url = reverse('new_assessment',
-                              args = (assignment.id,) + docpair.to_args())
+                              args = (assignment.id,) + docpair_args)
   # If we're collecting information need statements, make sure we do this before
   # collecting any assessments
   if app_settings.COLLECT_INFORMATION_NEED and len(assignment.description) == 0:
     return HttpResponseRedirect(reverse('information_need',
                     args = (assignment.id,)) + '?next=' + new_assessment_url)
-  return HttpResponseRedirect(new_assessment_url)
+  if not app_settings.DIRECT_PAIR_RENDERING:
+    return HttpResponseRedirect(new_assessment_url)
+  if docpair is None:
+    docpair = _docpairs_from_args([docpair_args])[0]
+  return _render_new_assessment(request, assignment, docpair)
+
+def _render_new_assessment(request, assignment, docpair):
+  submit_options = [('Submit & Continue', '_continue')]
+
+  return render_to_response('assessment/assessment_detail.html',
+    {'assignment': assignment,
+      'docpair': docpair,
+      'form': PreferenceAssessmentForm(
+                      initial={'left_doc':docpair.docs[0].id,
+                               'right_doc':docpair.docs[1].id}),
+      'pending_assessments':assignment.pending_assessments(),
+      'submit_options': submit_options,
+      'client_pair_queue': app_settings.CLIENT_PAIR_QUEUE,
+      # the page's canonical URL, as it may be rendered in response to another
+      'assessment_url': reverse('new_assessment',
+                                args = (assignment.id,) + docpair.to_args())},
+    RequestContext(request))
 
 @login_required
 def new_assessment(request, assignment_id,
@@ -255,39 +349,166 @@ def new_assessment(request, assignment_id,
     if form.is_valid():
       # create a new AssessedDocumentRelation
       rel = form.to_assessment(left_doc, right_doc)
+      # the relation is saved in the same transaction as the updates the
+      # signals make, such as the assignment's progress
       try:
-        rel.save()
+        with commit_on_success():
+          rel.save()
       except IntegrityError:
         # the assessor must have gone back to this page, after having submitted
         # once already.  find that previous assessment & update it
-        existing_assessment = AssessedDocumentRelation.objects.get( \
-          source_doc = rel.source_doc, target_doc = rel.target_doc)
-        existing_assessment.relation_type = rel.relation_type
-        existing_assessment.save()
+        with commit_on_success():
+          existing_assessment = AssessedDocumentRelation.objects.get( \
+            source_doc = rel.source_doc, target_doc = rel.target_doc)
+          existing_assessment.relation_type = rel.relation_type
+          existing_assessment.save()
+      precompute.schedule(assignment.id)
       # go to the next one
+      if app_settings.DIRECT_PAIR_RENDERING:
+        return _next_pair_response(request, assignment)
       return HttpResponseRedirect(reverse('next_assessment',
                                   args=(assignment_id,)))
 
   docpair = DocumentPairPresentation(left_doc, right_doc,
                                     left_fixed == '+', right_fixed == '+')
+  return _render_new_assessment(request, assignment, docpair)
+
+def _json_response(data, status = 200):
+  response = HttpResponse(simplejson.dumps(data), mimetype='application/json')
+  response.status_code = status
+  return response
+
+def _upcoming_pairs(assignment, n):
+  '''Up to n next DocumentPairPresentations for the assignment, from the
+  precomputed pairs if there are enough of them.  The first is the next pair,
+  and each of the rest assumes the one before it gets its assumed preference
+  (see DocumentPairPresentation.assumed_preference).'''
+  pairs = precompute.precomputed_pairs(assignment)
+  if not pairs or len(pairs) < n:
+    return strategy.next_pairs(assignment, n)
+  return _docpairs_from_args(pairs[:n])
+
+def _docpairs_from_args(pairs):
+  '''DocumentPairPresentations from DocumentPairPresentation.to_args()
+  tuples, loading their documents with one query'''
+  docs = AssessedDocument.objects.select_related('document') \
+            .in_bulk([left for (left, _, _, _) in pairs] + \
+                     [right for (_, _, right, _) in pairs])
+  return [DocumentPairPresentation(docs[left], docs[right], lf == '+',
+                                   rf == '+') \
+          for (left, lf, right, rf) in pairs]
+
+def _pair_data(assignment, docpair):
+  '''A JSON-serializable description of a DocumentPairPresentation.  Its
+  assumed preference ('L' or 'R') is the judgement the pairs after it assume
+  it will get.'''
+  (preferred, _) = docpair.assumed_preference()
+  return { 'left': { 'id': docpair.docs[0].id,
+                     'document': docpair.left_doc(),
+                     'url': docpair.left_doc_url(),
+                     'fixed': docpair.left_fixed(),
+                     'times_assessed': docpair.times_left_assessed() },
+           'right': { 'id': docpair.docs[1].id,
+                      'document': docpair.right_doc(),
+                      'url': docpair.right_doc_url(),
+                      'fixed': docpair.right_fixed(),
+                      'times_assessed': docpair.times_right_assessed() },
+           'assumed': 'L' if preferred is docpair.docs[0] else 'R',
+           'url': reverse('new_assessment',
+                          args = (assignment.id,) + docpair.to_args()) }
+
+def _pairs_response(assignment, n):
+  n = max(0, min(n, app_settings.CLIENT_PAIR_QUEUE))
+  return _json_response({
+    'pending': assignment.pending_assessments(),
+    'pairs': [_pair_data(assignment, docpair) \
+              for docpair in _upcoming_pairs(assignment, n)] })
 
-  submit_options = [('Submit & Continue', '_continue')]
+@login_required
+def api_next_pairs(request, assignment_id):
+  '''Returns the next (up to ?n=, at most CLIENT_PAIR_QUEUE) pairs to assess
+  for an assignment, and the number of assessments pending, as JSON.'''
+  assignment = get_object_or_404(Assignment, pk=assignment_id)
+  if assignment.assessor != request.user:
+    return _json_response({'error': 'This query has not been assigned to you.'},
+                          403)
+  try:
+    n = int(request.GET.get('n', app_settings.CLIENT_PAIR_QUEUE))
+  except ValueError:
+    return _json_response({'error': 'n must be an integer.'}, 400)
+  return _pairs_response(assignment, n)
 
-  return render_to_response('assessment/assessment_detail.html',
-    {'assignment': assignment,
-      'docpair': docpair,
-      'form': PreferenceAssessmentForm(
-                      initial={'left_doc':docpair.docs[0].id,
-                               'right_doc':docpair.docs[1].id}),
-      'pending_assessments':strategy.pending_assessments(assignment),
-      'submit_options': submit_options},
-    RequestContext(request))
+@login_required
+def api_judgements(request, assignment_id):
+  '''Saves a batch of judgements for an assignment in one transaction.  The
+  POST body is a JSON object:
+
+    {"judgements": [{"left_doc": <id>, "right_doc": <id>,
+                     "preference": "L"}, ...],
+     "n": <number of next pairs to return>}
+
+  with AssessedDocument ids and the PreferenceAssessmentForm preference
+  values.  Responds like api_next_pairs, with the pairs to assess after the
+  batch.'''
+  assignment = get_object_or_404(Assignment, pk=assignment_id)
+  if assignment.assessor != request.user:
+    return _json_response({'error': 'This query has not been assigned to you.'},
+                          403)
+  # as with new_assessment, the information need comes before any judgements
+  if app_settings.COLLECT_INFORMATION_NEED and len(assignment.description) == 0:
+    return _json_response({'error': 'The information need statement must be ' \
+                                    'entered first.'}, 403)
+  if request.method != 'POST':
+    return _json_response({'error': 'Judgements must be POSTed.'}, 405)
+  try:
+    data = simplejson.loads(request.raw_post_data)
+    judgements = [(int(j['left_doc']), int(j['right_doc']), j['preference']) \
+                  for j in data.get('judgements', [])]
+    n = int(data.get('n', app_settings.CLIENT_PAIR_QUEUE))
+  except (ValueError, TypeError, KeyError, AttributeError):
+    return _json_response({'error': 'Malformed judgements.'}, 400)
+
+  doc_ids = set([left for (left, _, _) in judgements] + \
+                [right for (_, right, _) in judgements])
+  docs = AssessedDocument.objects.filter(assignment = assignment) \
+                                 .in_bulk(list(doc_ids))
+  relations = []
+  for (left, right, preference) in judgements:
+    form = PreferenceAssessmentForm({'preference': preference})
+    if left not in docs or right not in docs or left == right or \
+        not form.is_valid():
+      return _json_response({'error': 'Invalid judgement of %d and %d.' % \
+                                      (left, right)}, 400)
+    relations.append(form.to_assessment(docs[left], docs[right]))
+
+  # the assignment's progress is refreshed once, after the whole batch
+  with commit_on_success():
+    with deferred_progress():
+      for rel in relations:
+        # update the judgement if the pair's been judged already
+        existing = AssessedDocumentRelation.objects.filter(
+          Q(source_doc = rel.source_doc, target_doc = rel.target_doc) |
+          Q(source_doc = rel.target_doc, target_doc = rel.source_doc))
+        try:
+          existing_assessment = existing[0]
+        except IndexError:
+          rel.save()
+        else:
+          existing_assessment.source_doc = rel.source_doc
+          existing_assessment.target_doc = rel.target_doc
+          existing_assessment.relation_type = rel.relation_type
+          existing_assessment.source_presented_left = \
+            rel.source_presented_left
+          existing_assessment.save()
+  if relations:
+    precompute.schedule(assignment.id)
+  return _pairs_response(assignment, n)
 
 @login_required
 def assessment_detail(request, assessment_id):
   '''To handle updating a previously entered assessment'''
   assessment = get_object_or_404(AssessedDocumentRelation, pk=assessment_id)
-  is_assigned_user = assessment.assignment().assessor == request.user
+  is_assigned_user = assessment.assignment.assessor == request.user
   if not ( is_assigned_user or request.user.is_superuser ):
     return render_to_response('assessment/access_error.html',
       {'message': 'Sorry, you don\'t have permission to view this assessment'},
@@ -318,18 +539,22 @@ def assessment_detail(request, assessment_id):
         mail_admins('Error saving assessment from user %s' % request.user,
             message)
         return HttpResponseRedirect(reverse('next_assessment',
-                                    args=[assessment.assignment().id]))
+                                    args=[assessment.assignment.id]))
 
       assessment.relation_type = new_assessment.relation_type
       assessment.source_presented_left = new_assessment.source_presented_left
-      assessment.save()
+      with commit_on_success():
+        assessment.save()
+      precompute.schedule(assessment.assignment_id)
 
+      if app_settings.DIRECT_PAIR_RENDERING:
+        return _next_pair_response(request, assessment.assignment)
       if '_continue' in request.POST:
         return HttpResponseRedirect(reverse('next_assessment',
-                                            args=[assessment.assignment().id]))
+                                            args=[assessment.assignment.id]))
       elif '_save' in request.POST:
         return HttpResponseRedirect(reverse('next_assessment',
-                                            args=[assessment.assignment().id]))
+                                            args=[assessment.assignment.id]))
 
   form = PreferenceAssessmentForm.from_assessment(assessment)
   if not is_assigned_user:
@@ -339,10 +564,40 @@ def assessment_detail(request, assessment_id):
     {'form': form,
       'docpair': DocumentPairPresentation.from_assessment(assessment),
       'assessment': assessment,
-      'assignment': assessment.assignment(),
-      'pending_assessments':strategy.pending_assessments(assessment.assignment())},
+      'assignment': assessment.assignment,
+      'pending_assessments':assessment.assignment.pending_assessments()},
     RequestContext(request))
 
+@login_required
+def document_proxy(request, document):
+  '''Serves a document from the document cache, fetching it from the
+  document server if it isn't cached yet.  Conditional GETs are answered
+  with 304s.'''
+  if not app_settings.DOCUMENT_PROXY or \
+      not Document.objects.filter(document = document).exists():
+    raise Http404
+  try:
+    cached = docproxy.get(document)
+  except docproxy.urllib2.HTTPError as e:
+    return HttpResponse('Error fetching document %s: %s' % (document, e),
+                        mimetype='text/plain', status=e.code)
+  except docproxy.urllib2.URLError as e:
+    return HttpResponse('Error fetching document %s: %s' % (document, e),
+                        mimetype='text/plain', status=502)
+
+  if request.META.get('HTTP_IF_NONE_MATCH') == cached.etag or \
+      (request.META.get('HTTP_IF_MODIFIED_SINCE') == cached.last_modified \
+       and 'HTTP_IF_NONE_MATCH' not in request.META):
+    cached.close()
+    response = HttpResponseNotModified()
+  else:
+    response = HttpResponse(cached, mimetype=cached.content_type)
+    response['Content-Length'] = str(cached.size)
+  response['ETag'] = cached.etag
+  response['Last-Modified'] = cached.last_modified
+  response['Cache-Control'] = 'private'
+  return response
+
 @login_required
 def comment(request):
   '''Handles leaving a comment.'''